@@ -1,101 +1,158 @@
 import re
 import math
 import json
+import argparse
 import collections
 from pathlib import Path
 
+from benford_stats import BENFORD_FIRST, DigitStatsAccumulator
+from dedupe import DEDUPE_BACKENDS, make_deduper
+from scan_engine import AmountConsumer, CFDIAttributeConsumer, KeywordConsumer, parse_cents, run_plugins
+from scan_cache import DEFAULT_CACHE_PATH
+from result_store import RowSpool, save_report as save_store_report
+from streaming_stats import Reservoir
+
+GENERIC_AMOUNT_PATTERN = re.compile(rb'[0-9]{2,}\.[0-9]{2,4}')
+NON_PRINTABLE = re.compile(r'[^ -~]+')
+# Con menos montos CFDI/XML únicos que esto, Benford usa también los montos genéricos
+GENERIC_FALLBACK_MIN = 500
+
+SUSPICIOUS_KEYWORDS = [
+    # Evasión / Dudoso
+    "no deducible", "sin comprobante", "por comprobar", "ajuste", 
+    "varios", "cancelado", "efectivo", "reposicion",
+    # Personales / Ajenos
+    "gastos personales", "prestamo", "anticipo nomina",
+    # Riesgo Fiscal
+    "multa", "recargo", "actualizacion", "donativo"
+]
+
 class AnomalyHunter:
-    def __init__(self, bak_file_path):
+    def __init__(self, bak_file_path, max_bytes=None, dedupe='exact', dedupe_mb=256):
         self.bak_file = bak_file_path
+        # None = archivo completo en modo streaming; un límite solo para pruebas rápidas
+        self.max_bytes = max_bytes
         self.results = {
             "benford_analysis": {},
             "round_numbers": {},
             "suspicious_concepts": [],
             "statistics": {}
         }
-        self.amounts = []
-        self.strings = []
+        # Montos (en centavos) deduplicados al vuelo para no sesgar Benford con copias de seguridad repetidas
+        # 'exact': tabla compacta de enteros; 'approx': Bloom + HyperLogLog con memoria fija
+        self.seen_cents = make_deduper(dedupe, 'int', dedupe_mb / 2)
+        # Histogramas de dígitos y cifras redondas, actualizados con cada monto nuevo
+        self.digit_stats = DigitStatsAccumulator()
+        # Montos genéricos aparte: se suman solo si al final hay pocos montos XML, así el
+        # resultado no depende del orden de lectura ni de cómo se reparten los rangos
+        self.generic_cents = make_deduper(dedupe, 'int', dedupe_mb / 2)
+        self.generic_stats = DigitStatsAccumulator()
+        self._generic_resolved = False
+        # Memoria acotada: conteo por keyword + muestra de evidencias
+        self.keyword_counts = collections.Counter()
+        self.keyword_samples = Reservoir(20)
+        # Todas las evidencias, para el almacén de resultados (el JSON solo lleva la muestra),
+        # grabadas por lotes a disco
+        self.keyword_evidence = RowSpool('evidence')
+
+    def consumers(self):
+        """Consumidores para el ScanEngine: montos CFDI/XML, montos genéricos y texto"""
+        max_bytes = self.max_bytes
+        return [
+            # 1. Patrón Específico CFDI/XML (Muy fiable)
+            # Busca: Total="123.45" o Importe="123.45"
+            CFDIAttributeConsumer(self._on_xml_amount, max_bytes=max_bytes),
+            # 2. Patrón Genérico Numérico (Más agresivo)
+            # Busca: 1234.56 (al menos 2 dígitos enteros y exactamente 2 o 4 decimales)
+            AmountConsumer(self._on_generic_amount, pattern=GENERIC_AMOUNT_PATTERN, max_bytes=max_bytes),
+            # Keywords de riesgo: autómata de una pasada, sin distinguir mayúsculas
+            KeywordConsumer(self._on_keyword, SUSPICIOUS_KEYWORDS, ignore_case=True,
+                            context=(10, 40), max_bytes=max_bytes),
+        ]
+
+    def _add_amount(self, cents):
+        if self.seen_cents.add(cents):
+            self.digit_stats.add_cents(cents)
+
+    def _on_xml_amount(self, value, offset):
+        cents = parse_cents(value)
+        if cents > 100: 
+            self._add_amount(cents)
+
+    def _on_generic_amount(self, value, offset):
+        cents = parse_cents(value)
+        # Filtros para reducir ruido:
+        if 100 < cents < 10000000000 and self.generic_cents.add(cents):
+            self.generic_stats.add_cents(cents)
+
+    def _resolve_generic(self):
+        """Si encontramos pocos en XML, usar también el genérico (una vez, con el escaneo completo)"""
+        if self._generic_resolved:
+            return
+        self._generic_resolved = True
+        if self.digit_stats.count >= GENERIC_FALLBACK_MIN:
+            return
+        if self.seen_cents.exact:
+            for cents in self.generic_cents:
+                self._add_amount(cents)
+        else:
+            # Aproximado: un monto que aparece como XML y como genérico cuenta dos veces
+            self.seen_cents.merge(self.generic_cents)
+            self.digit_stats.merge(self.generic_stats)
+
+    def _on_keyword(self, keyword, offset, context):
+        # Guardar contexto legible (limitar longitud)
+        text = NON_PRINTABLE.sub(' ', context.decode('ascii', errors='ignore')).strip()
+        kw = keyword.decode('ascii')
+        self.keyword_counts[kw] += 1
+        self.keyword_samples.add((kw, offset, text[:50]), (offset, kw))
+        self.keyword_evidence.add(kw, offset, text[:50])
+
+    def merge(self, other):
+        """Fusiona el estado parcial de un worker (escaneo paralelo por rangos)"""
+        if self.seen_cents.exact:
+            # Solo los montos que este parcial no había visto suman a los histogramas
+            for cents in other.seen_cents:
+                self._add_amount(cents)
+            for cents in other.generic_cents:
+                if self.generic_cents.add(cents):
+                    self.generic_stats.add_cents(cents)
+        else:
+            # Aproximado: los repetidos entre rangos cuentan una vez por rango
+            self.seen_cents.merge(other.seen_cents)
+            self.digit_stats.merge(other.digit_stats)
+            self.generic_cents.merge(other.generic_cents)
+            self.generic_stats.merge(other.generic_stats)
+        self.keyword_counts.update(other.keyword_counts)
+        self.keyword_samples.merge(other.keyword_samples)
+        self.keyword_evidence.extend(other.keyword_evidence)
 
-    def extract_data(self):
+    def finish(self):
+        self._resolve_generic()
+        print(f"✓ Datos extraídos: {self.digit_stats.count} montos únicos, {sum(self.keyword_counts.values())} keywords de riesgo.")
+
+    def extract_data(self, workers=1, cache=None):
         """Extrae montos y cadenas de texto del archivo binario con estrategia mejorada"""
         print(f"📂 Escaneando archivo (Modo Profundo): {Path(self.bak_file).name}")
-        
-        # 1. Patrón Específico CFDI/XML (Muy fiable)
-        # Busca: Total="123.45" o Importe="123.45"
-        xml_pattern = re.compile(rb'(?:Total|SubTotal|Importe|ValorUnitario|Monto|Haber|Debe)="([0-9]+\.[0-9]+)"')
-        
-        # 2. Patrón Genérico Numérico (Más agresivo)
-        # Busca: 1234.56 (al menos 2 dígitos enteros y exactamente 2 o 4 decimales)
-        generic_pattern = re.compile(rb'[0-9]{2,}\.[0-9]{2,4}')
-        
-        # Regex para texto legible (cadenas de >4 caracteres)
-        text_pattern = re.compile(rb'[A-Za-z0-9\s\-\.\_\@]{4,}')
-
-        with open(self.bak_file, 'rb') as f:
-            chunk_size = 10 * 1024 * 1024 
-            chunk_count = 0
-            max_chunks = 30 # Aumentamos escaneo a 300MB
-            
-            while chunk_count < 50: # Aumentamos escaneo a 500MB para Majoba
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                
-                # Búsqueda Prioritaria: XML Attributes
-                for match in xml_pattern.finditer(data):
-                    try:
-                        val = float(match.group(1).decode('ascii'))
-                        if val > 1.0: 
-                            self.amounts.append(val)
-                    except: pass
-
-                # Si encontramos pocos en XML, usar el genérico
-                if len(self.amounts) < 500: # Aumentar umbral de switch
-                    for match in generic_pattern.finditer(data):
-                        try:
-                            val = float(match.group(0).decode('ascii'))
-                            # Filtros para reducir ruido:
-                            if 1.0 < val < 100000000.0:
-                                self.amounts.append(val)
-                        except: pass
-                
-                # Extraer texto para búsqueda de keywords
-                for match in text_pattern.finditer(data):
-                    try:
-                        s = match.group(0).decode('ascii', errors='ignore').strip()
-                        if 4 < len(s) < 100: 
-                            self.strings.append(s)
-                    except: pass
-                
-                chunk_count += 1
-                if chunk_count % 5 == 0:
-                    print(f"  ... Procesados {chunk_count * 10} MB | Montos encontrados: {len(self.amounts)}")
-
-        # Eliminar duplicados en montos para no sesgar Benford con copias de seguridad repetidas
-        self.amounts = list(set(self.amounts))
-        print(f"✓ Datos extraídos: {len(self.amounts)} montos únicos, {len(self.strings)} cadenas de texto.")
+        run_plugins(self.bak_file, [self], workers=workers, cache=cache)
 
     def analyze_benford(self):
         """Aplica la Ley de Benford para detectar manipulación de cifras"""
         print("📊 Ejecutando análisis de Ley de Benford...")
+        self._resolve_generic()
         
-        if not self.amounts:
+        stats = self.digit_stats
+        if not stats.count:
             self.results["benford_analysis"] = {"status": "No data"}
             return
 
-        first_digits = [int(str(amount)[0]) for amount in self.amounts if amount > 0]
-        total = len(first_digits)
-        counts = collections.Counter(first_digits)
-        
-        # Frecuencias esperadas por Benford
-        benford_probs = {1: 30.1, 2: 17.6, 3: 12.5, 4: 9.7, 5: 7.9, 6: 6.7, 7: 5.8, 8: 5.1, 9: 4.6}
-        
+        total = sum(stats.first)
         analysis = {}
         suspicious_digits = []
         
         for digit in range(1, 10):
-            actual_pct = (counts[digit] / total) * 100
-            expected_pct = benford_probs[digit]
+            actual_pct = (stats.first[digit] / total) * 100
+            expected_pct = round(BENFORD_FIRST[digit] * 100, 1)
             deviation = actual_pct - expected_pct
             
             analysis[digit] = {
@@ -108,25 +165,34 @@ class AnomalyHunter:
             if abs(deviation) > 5.0:
                 suspicious_digits.append(digit)
 
-        risk_score = "BAJO"
-        if len(suspicious_digits) >= 2: risk_score = "MEDIO"
-        if len(suspicious_digits) >= 4: risk_score = "ALTO"
+        first_digit = stats.first_digit_test()
+
+        # Riesgo: el mayor entre la regla de dígitos sospechosos y la conformidad MAD de Nigrini
+        level = 0
+        if len(suspicious_digits) >= 2: level = 1
+        if len(suspicious_digits) >= 4: level = 2
+        level = max(level, first_digit["conformity_level"] - 1)
+        risk_score = ("BAJO", "MEDIO", "ALTO")[level]
 
         self.results["benford_analysis"] = {
             "risk_score": risk_score,
             "suspicious_digits": suspicious_digits,
-            "details": analysis
+            "details": analysis,
+            "first_digit_test": first_digit,
+            "first_two_digits_test": stats.first_two_digits_test(),
+            "last_two_digits_test": stats.last_two_digits_test()
         }
-        print(f"  Resultado Benford: Riesgo {risk_score}")
+        print(f"  Resultado Benford: Riesgo {risk_score} ({first_digit['conformity']}, MAD {first_digit['mad']})")
 
     def analyze_round_numbers(self):
         """Busca excesos de números redondos (terminados en .00)"""
         print("🎯 Buscando cifras redondas sospechosas...")
         
-        if not self.amounts: return
+        stats = self.digit_stats
+        if not stats.count: return
 
-        round_count = sum(1 for x in self.amounts if x.is_integer())
-        total = len(self.amounts)
+        round_count = stats.round_units
+        total = stats.count
         pct_round = (round_count / total) * 100
         
         # En contabilidad real (con IVA), los números redondos son raros (< 5-10%)
@@ -137,46 +203,35 @@ class AnomalyHunter:
         self.results["round_numbers"] = {
             "percentage": round(pct_round, 2),
             "count": round_count,
+            "multiples_of_100": stats.round_hundreds,
+            "multiples_of_1000": stats.round_thousands,
             "risk_level": risk_level,
             "observation": f"El {round(pct_round, 1)}% de los importes son números exactos, lo cual es {'inusual' if pct_round > 15 else 'normal'}."
         }
         print(f"  Cifras redondas: {round(pct_round, 2)}% - Riesgo {risk_level}")
 
     def hunt_suspicious_concepts(self):
-        """Busca palabras clave de alto riesgo en las cadenas extraídas"""
+        """Resume las palabras clave de alto riesgo encontradas durante el escaneo"""
         print("🕵️ Buscando conceptos sospechosos...")
         
-        keywords = [
-            # Evasión / Dudoso
-            "no deducible", "sin comprobante", "por comprobar", "ajuste", 
-            "varios", "cancelado", "efectivo", "reposicion",
-            # Personales / Ajenos
-            "gastos personales", "prestamo", "anticipo nomina",
-            # Riesgo Fiscal
-            "multa", "recargo", "actualizacion", "donativo"
+        # Muestra de evidencias en orden de aparición en el respaldo
+        samples = [
+            {
+                "keyword": kw,
+                "offset": offset,
+                "text": text, 
+                "category": "Riesgo Fiscal/Contable"
+            }
+            for kw, offset, text in self.keyword_samples.items
         ]
-        
-        found = []
-        for s in self.strings:
-            s_lower = s.lower()
-            for kw in keywords:
-                if kw in s_lower:
-                    # Guardar contexto (limitar longitud)
-                    found.append({
-                        "keyword": kw,
-                        "text": s[:50], 
-                        "category": "Riesgo Fiscal/Contable"
-                    })
-        
-        # Agrupar y contar
-        summary = collections.Counter([item['keyword'] for item in found])
+        total_found = sum(self.keyword_counts.values())
         
         self.results["suspicious_concepts"] = {
-            "total_found": len(found),
-            "top_keywords": dict(summary.most_common(5)),
-            "samples": found[:20] # Guardar primeros 20 ejemplos
+            "total_found": total_found,
+            "top_keywords": dict(self.keyword_counts.most_common(5)),
+            "samples": samples # Guardar 20 ejemplos
         }
-        print(f"  Conceptos encontrados: {len(found)}")
+        print(f"  Conceptos encontrados: {total_found}")
 
     def save_report(self, output_path):
         """Guarda el reporte final"""
@@ -184,18 +239,37 @@ class AnomalyHunter:
             json.dump(self.results, f, indent=2, ensure_ascii=False)
         print(f"💾 Reporte guardado en: {output_path}")
 
+    def save_store(self, store_path, report="anomalies"):
+        """Guarda el resumen y todas las evidencias (sin muestrear) en el almacén de resultados"""
+        concepts = dict(self.results["suspicious_concepts"], breakdown=dict(self.keyword_counts))
+        concepts.pop("samples", None)
+        summary = dict(self.results, suspicious_concepts=concepts)
+        counts = save_store_report(store_path, report, summary, evidence=self.keyword_evidence)
+        print(f"💾 Almacén de resultados: {store_path} ({counts['evidence']} evidencias)")
+
 if __name__ == "__main__":
     print("="*60)
     print("🔎 ENGINE DE DETECCIÓN DE ANOMALÍAS - AUDITOR-IA (MAJOBA)")
     print("="*60)
     
     # Ruta del archivo (Majoba)
-    archivo_bak = r"C:\IA_nubes\auditorIA_1\ctTransportes_Majoba_SA_De_CV-20251027-1050\document_584def9a-95e2-4822-83db-889de0d559d0_content.bak"
+    parser = argparse.ArgumentParser(description="Detección de anomalías en un respaldo .bak")
+    parser.add_argument("bak_path", nargs="?", default=r"C:\IA_nubes\auditorIA_1\ctTransportes_Majoba_SA_De_CV-20251027-1050\document_584def9a-95e2-4822-83db-889de0d559d0_content.bak")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para escaneo paralelo por rangos")
+    parser.add_argument("--max-mb", type=int, default=None, help="Limitar el escaneo a los primeros N MB (por defecto: completo)")
+    parser.add_argument("--dedupe", choices=DEDUPE_BACKENDS, default="exact", help="Deduplicación de montos: exacta o aproximada (Bloom + HyperLogLog)")
+    parser.add_argument("--dedupe-mb", type=int, default=256, help="Presupuesto de memoria para la deduplicación en MB")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true", help="Reescanear sin usar ni actualizar la caché")
+    parser.add_argument("--store", default=None, help="Almacén SQLite de resultados con el detalle completo (opcional)")
+    args = parser.parse_args()
+    archivo_bak = args.bak_path
     
-    hunter = AnomalyHunter(archivo_bak)
+    hunter = AnomalyHunter(archivo_bak, max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None,
+                           dedupe=args.dedupe, dedupe_mb=args.dedupe_mb)
     
     # Ejecutar Pipeline de Análisis
-    hunter.extract_data()
+    hunter.extract_data(workers=args.workers, cache=None if args.no_cache else args.cache)
     hunter.analyze_benford()
     hunter.analyze_round_numbers()
     hunter.hunt_suspicious_concepts()
@@ -203,4 +277,6 @@ if __name__ == "__main__":
     # Guardar resultados
     # Usamos el ID del directorio para facilitar la carga en el dashboard
     hunter.save_report("anomaly_report_majoba.json")
+    if args.store:
+        hunter.save_store(args.store)
     print("\n✅ Análisis finalizado.")
@@ -1,62 +1,405 @@
 import time
 import os
+import re
+import sys
+import queue
+import argparse
+import threading
 import subprocess
+from collections import deque
 from pathlib import Path
 
+from batch_audit import DEFAULT_OUTPUT_DIR, company_entry, company_paths, efos_available, efos_command, update_index
+from efos_list import DEFAULT_INDEX
+from ingest_ledger import LEDGER_DB, IngestLedger, content_fingerprint, content_hash
+from scan_cache import DEFAULT_CACHE_PATH
+
+# Notificaciones nativas (inotify / ReadDirectoryChangesW) si watchdog está instalado
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
 WATCH_DIR = r"C:\IA_nubes\auditorIA_1"
-PROCESSED_LOG = "processed_files.log"
-
-def load_processed():
-    if os.path.exists(PROCESSED_LOG):
-        with open(PROCESSED_LOG, 'r') as f:
-            return set(f.read().splitlines())
-    return set()
-
-def mark_processed(filename):
-    with open(PROCESSED_LOG, 'a') as f:
-        f.write(filename + "\n")
-
-def run_pipeline(filepath):
-    print(f"\n🚀 NUEVO ARCHIVO DETECTADO: {filepath.name}")
-    print("   Iniciando pipeline de auditoría automática...")
-    
-    # 1. Extracción de Datos
-    print("   [1/3] Extrayendo datos contables...")
-    # subprocess.run(["python", "scripts/extract_accounting_data.py", str(filepath)])
-    
-    # 2. Cazador de Anomalías
-    print("   [2/3] Buscando anomalías y fraudes...")
-    # subprocess.run(["python", "scripts/anomaly_hunter.py", str(filepath)])
-    
-    # 3. Análisis Forense de Nómina (si aplica)
-    if "Majoba" in filepath.name:
-        print("   [3/3] Ejecutando auditoría especial de nómina...")
-        subprocess.run(["python", "scripts/payroll_hunter.py"])
-    
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+POLL_INTERVAL = 5          # Segundos entre revisiones
+STABLE_SECONDS = 30        # Tamaño/mtime sin cambios durante este tiempo = copia terminada
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_STAGE_TIMEOUT = 2 * 60 * 60
+
+# Carpeta de un respaldo de ASPEL COI: ct<Empresa>-AAAAMMDD-HHMM
+FOLDER_PREFIX = re.compile(r'^ct(?=[A-Z])')
+FOLDER_TIMESTAMP = re.compile(r'[-_][0-9]{8}-[0-9]{4}$')
+
+# Eventos de watchdog que indican contenido nuevo; opened / closed_no_write son solo lecturas
+# (entre ellas las del propio pipeline) y volverían a encolar el mismo respaldo
+WRITE_EVENTS = {"created", "modified", "moved", "closed"}
+
+# index.json es compartido por todos los workers del vigilante
+_index_lock = threading.Lock()
+
+
+def _scan_command(company, paths, options):
+    # Un solo escaneo para extractor, anomalías, nómina y cubos, con reportes propios de la empresa
+    return [sys.executable, str(SCRIPTS_DIR / "full_scan.py"), company["bak"], "--company", company["name"],
+            "--rfc", company["rfc"], "--slug", company["slug"], "--output-dir", str(paths["data"].parent),
+            "--cache", options["cache"]]
+
+
+# (nombre, línea de comandos, ¿aplica?, reportes que produce): cada etapa escribe en <output_dir>/<slug>/
+# y la bitácora la reanuda por separado. Extractor, anomalías, nómina y cubos son una sola etapa
+# porque comparten la única lectura del respaldo (separarlos lo leería una vez por etapa); la etapa
+# EFOS repite solo su parte y reproduce los RFCs desde la caché de escaneo que dejó `scan`
+STAGES = [
+    ("scan", _scan_command, lambda company, options: True, ("data", "anomalies", "payroll", "periods", "store")),
+    ("efos", efos_command, efos_available, ("efos", "audit_report")),
+]
+
+
+def company_for(path):
+    """Empresa de un respaldo según su carpeta (ctTransportes_Majoba_SA_De_CV-20251027-1050 -> transportes_majoba_sa_de_cv)"""
+    path = Path(path).resolve()
+    folder = FOLDER_PREFIX.sub('', FOLDER_TIMESTAMP.sub('', path.parent.name))
+    slug = re.sub(r'[^0-9a-z]+', '_', folder.lower()).strip('_') or path.stem.lower()
+    return {"slug": slug, "name": folder.replace('_', ' '), "rfc": "", "bak": str(path)}
+
+
+def run_pipeline(filepath, ledger, stage_timeout=DEFAULT_STAGE_TIMEOUT, output_dir=DEFAULT_OUTPUT_DIR,
+                 cache=DEFAULT_CACHE_PATH, efos_index=DEFAULT_INDEX):
+    """
+    Ejecuta las etapas del pipeline como subprocesos con timeout, registrando cada una
+    en la bitácora; las etapas ya completadas para este contenido se omiten.
+    Los reportes van a <output_dir>/<slug>/ y se registran en index.json.
+    Devuelve True si todas terminaron (o el contenido ya estaba auditado), False si
+    algo falló y None si otro worker tiene el mismo contenido en proceso.
+    """
+    filepath = Path(filepath)
+    if ledger.is_done(filepath):
+        print(f"↷ {filepath.name}: ya auditado (misma ruta, tamaño y mtime), se omite")
+        return True
+    fp = content_fingerprint(filepath)
+    previous = ledger.register(fp, filepath)
+    if previous == 'running':
+        print(f"↷ {filepath.name}: otro worker ya procesa este mismo contenido")
+        return None
+    digest = None
+    if previous == 'done':
+        # Sin reclamar el trabajo todavía: un error aquí no lo deja 'running'
+        try:
+            # Huella muestreada + tamaño + mtime de un archivo ya auditado: se confía sin releerlo
+            if ledger.trusted_copy(fp, filepath):
+                ledger.remember(fp, filepath)
+                print(f"↷ {filepath.name}: copia de un respaldo ya auditado, se omite")
+                return True
+            # Otro mtime: la huella solo muestrea bloques, se confirma con el hash completo
+            digest = content_hash(filepath)
+            reference = ledger.reference_hash(fp)
+        except OSError as e:
+            print(f"   ❌ No se pudo leer {filepath.name}: {e}")
+            return False
+        if reference == digest:
+            ledger.remember(fp, filepath)
+            print(f"↷ {filepath.name}: mismo contenido que un respaldo ya auditado, se omite")
+            return True
+        if not ledger.reopen(fp, filepath):
+            print(f"↷ {filepath.name}: otro worker ya procesa este mismo contenido")
+            return None
+        print(f"   {filepath.name}: misma huella que un respaldo auditado pero contenido distinto, se procesa")
+
+    # Desde aquí el trabajo está 'running' a nombre de este worker: cualquier error lo marca
+    # 'failed' para que el siguiente evento (o el reinicio) lo reclame de nuevo
+    stage = None
+    try:
+        company = company_for(filepath)
+        paths = company_paths(output_dir, company["slug"])
+        options = {"cache": str(Path(cache).resolve()), "efos_index": str(Path(efos_index).resolve())}
+        print(f"\n🚀 NUEVO ARCHIVO DETECTADO: {filepath.name} ({company['name']})")
+        print("   Iniciando pipeline de auditoría automática...")
+
+        done = ledger.completed_stages(fp)
+        stages = {}
+        ok = True
+        for i, (name, command, applies, outputs) in enumerate(STAGES, 1):
+            if name in done:
+                print(f"   [{i}/{len(STAGES)}] {name}: ya completada, se omite")
+                stages[name] = {"status": "cached", "seconds": None, "error": None}
+                continue
+            if not applies(company, options):
+                print(f"   [{i}/{len(STAGES)}] {name}: no aplica, se omite")
+                stages[name] = {"status": "skipped", "seconds": None, "error": None}
+                continue
+            print(f"   [{i}/{len(STAGES)}] {name}: {filepath.name}")
+            stage, started = name, ledger.start_stage(fp, name)
+            error = None
+            try:
+                result = subprocess.run(command(company, paths, options), timeout=stage_timeout)
+                if result.returncode != 0:
+                    error = f"código de salida {result.returncode}"
+            except subprocess.TimeoutExpired:
+                error = f"excedió {stage_timeout}s"
+            # Rutas explícitas de la etapa: con varios workers el directorio tiene reportes de otros trabajos
+            written = [str(paths[output]) for output in outputs if paths[output].exists()]
+            ledger.finish_stage(fp, name, started, outputs=written, error=error)
+            stage = None
+            stages[name] = {"status": "failed" if error else "done", "seconds": round(time.time() - started, 1),
+                            "error": error}
+            if error:
+                print(f"   ❌ Etapa '{name}' falló ({error}); se aborta el pipeline de {filepath.name}")
+                ok = False
+                break
+            print(f"   ✓ {name} en {time.time() - started:.1f}s")
+
+        with _index_lock:
+            update_index(output_dir, {company["slug"]: company_entry(Path(output_dir), company, stages)})
+        if not ok:
+            return False
+        ledger.finish_job(fp, digest)
+        ledger.remember(fp, filepath)
+    except Exception as e:
+        error = str(e) or type(e).__name__
+        if stage is not None:
+            ledger.finish_stage(fp, stage, started, error=error)
+        else:
+            ledger.fail_job(fp)
+        print(f"   ❌ Error procesando {filepath.name}: {error}")
+        return False
     print(f"✅ Procesamiento completado para: {filepath.name}\n")
-    mark_processed(filepath.name)
+    return True
+
+
+class DirectoryPoller:
+    """
+    Respaldo sin notificaciones nativas: guarda el mtime de cada directorio y solo
+    vuelve a listar los que cambiaron (un archivo nuevo cambia el mtime de su carpeta),
+    en lugar de recorrer todo el árbol con rglob cada vez.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.dir_mtimes = {self.root: None}
+
+    def poll(self):
+        """Devuelve los .bak de los directorios nuevos o modificados desde la última revisión"""
+        found = []
+        for directory, known in list(self.dir_mtimes.items()):
+            try:
+                mtime = directory.stat().st_mtime_ns
+            except OSError:
+                del self.dir_mtimes[directory]
+                continue
+            if mtime == known:
+                continue
+            self.dir_mtimes[directory] = mtime
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if Path(entry.path) not in self.dir_mtimes:
+                        self.dir_mtimes[Path(entry.path)] = None
+                        # Directorio nuevo: se lista en esta misma revisión
+                        found.extend(self._scan_new(Path(entry.path)))
+                elif entry.name.lower().endswith(".bak"):
+                    found.append(Path(entry.path))
+        return found
 
-def watch():
+    def _scan_new(self, directory):
+        found = []
+        for root, dirs, files in os.walk(directory):
+            root = Path(root)
+            try:
+                self.dir_mtimes[root] = root.stat().st_mtime_ns
+            except OSError:
+                continue
+            found.extend(root / name for name in files if name.lower().endswith(".bak"))
+        return found
+
+
+class BakEventHandler(FileSystemEventHandler):
+    """Recibe eventos de watchdog y marca los .bak tocados como candidatos"""
+
+    def __init__(self, on_candidate):
+        self.on_candidate = on_candidate
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in WRITE_EVENTS:
+            return
+        # Un archivo movido/renombrado solo existe en su destino
+        path = event.dest_path if event.event_type == "moved" else event.src_path
+        if path and str(path).lower().endswith(".bak"):
+            self.on_candidate(Path(path))
+
+
+class StabilityTracker:
+    """Solo libera un archivo cuando su tamaño y mtime no cambian durante `stable_seconds` (copia terminada)"""
+
+    def __init__(self, stable_seconds=STABLE_SECONDS):
+        self.stable_seconds = stable_seconds
+        self.pending = {}  # ruta -> (tamaño, mtime, estable_desde)
+        self.lock = threading.Lock()
+
+    def touch(self, path):
+        with self.lock:
+            self.pending.setdefault(path, (None, None, time.time()))
+
+    def ready(self):
+        now = time.time()
+        released = []
+        with self.lock:
+            for path, (size, mtime, since) in list(self.pending.items()):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    del self.pending[path]
+                    continue
+                if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                    self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                elif stat.st_size > 0 and now - since >= self.stable_seconds:
+                    del self.pending[path]
+                    released.append(path)
+        return released
+
+
+class IngestWatcher:
+    """
+    Detecta respaldos nuevos (notificaciones nativas o sondeo por directorio),
+    espera a que terminen de copiarse y los procesa en una cola acotada atendida
+    por un pool de workers, sin que un respaldo grande bloquee la detección del resto.
+    """
+
+    def __init__(self, watch_dir=WATCH_DIR, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 stable_seconds=STABLE_SECONDS, poll_interval=POLL_INTERVAL, stage_timeout=DEFAULT_STAGE_TIMEOUT,
+                 use_events=True, ledger_path=LEDGER_DB, output_dir=DEFAULT_OUTPUT_DIR, cache=DEFAULT_CACHE_PATH,
+                 efos_index=DEFAULT_INDEX):
+        self.watch_dir = Path(watch_dir)
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stage_timeout = stage_timeout
+        self.output_dir = output_dir
+        self.cache = cache
+        self.efos_index = efos_index
+        self.use_events = use_events and Observer is not None
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.backlog = deque()  # Listos pero la cola está llena
+        self.tracker = StabilityTracker(stable_seconds)
+        self.poller = DirectoryPoller(self.watch_dir)
+        self.ledger = IngestLedger(ledger_path)
+        self.in_flight = set()
+        # Dos respaldos de la misma empresa escriben en la misma carpeta: se procesan uno a la vez
+        self.company_locks = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def accepts(self, path):
+        # Solo procesamos Majoba automáticamente por ahora como demo
+        return "Majoba" in str(path)
+
+    def _company_lock(self, path):
+        slug = company_for(path)["slug"]
+        with self.lock:
+            return self.company_locks.setdefault(slug, threading.Lock())
+
+    def _worker(self):
+        while not self.stop_event.is_set():
+            try:
+                path = self.jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                with self._company_lock(path):
+                    run_pipeline(path, self.ledger, stage_timeout=self.stage_timeout, output_dir=self.output_dir,
+                                 cache=self.cache, efos_index=self.efos_index)
+            except Exception as e:
+                print(f"   ❌ Error procesando {path.name}: {e}")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(path)
+                self.jobs.task_done()
+
+    def _dispatch(self):
+        """Encola los archivos estables; si la cola está llena quedan en espera para la siguiente vuelta"""
+        for path in self.tracker.ready():
+            # El sondeo vuelve a entregar los .bak de una carpeta cuando cambia su mtime
+            if not self.accepts(path) or self.ledger.is_done(path):
+                continue
+            with self.lock:
+                if path in self.in_flight:
+                    continue
+                self.in_flight.add(path)
+            self.backlog.append(path)
+        while self.backlog:
+            try:
+                self.jobs.put_nowait(self.backlog[0])
+            except queue.Full:
+                break
+            print(f"📥 En cola: {self.backlog.popleft().name} ({self.jobs.qsize()} pendientes)")
+
+    def run(self):
+        pool = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in pool:
+            thread.start()
+
+        observer = None
+        if self.use_events:
+            observer = Observer()
+            observer.schedule(BakEventHandler(self.tracker.touch), str(self.watch_dir), recursive=True)
+            observer.start()
+
+        try:
+            # Trabajos interrumpidos por una caída: se reanudan las etapas pendientes
+            for path in self.ledger.recover():
+                if path.exists():
+                    self.tracker.touch(path)
+            # Primera revisión completa (archivos que ya existían); después solo eventos o directorios cambiados
+            for path in self.poller.poll():
+                self.tracker.touch(path)
+            while True:
+                time.sleep(self.poll_interval)
+                if observer is None:
+                    for path in self.poller.poll():
+                        self.tracker.touch(path)
+                self._dispatch()
+        finally:
+            self.stop_event.set()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self.ledger.close()
+
+def watch(watch_dir=WATCH_DIR, **options):
+    watcher = IngestWatcher(watch_dir, **options)
     print(f"👀 TIGER-BOT VIGILANTE ACTIVO")
-    print(f"   Monitoreando carpeta: {WATCH_DIR}")
+    print(f"   Monitoreando carpeta: {watch_dir}")
+    print(f"   Detección: {'notificaciones del sistema' if watcher.use_events else 'sondeo de directorios modificados'}"
+          f" | Workers: {watcher.workers} | Cola máx.: {watcher.jobs.maxsize}")
     print("   Esperando nuevos archivos .bak para auditar...")
     print("   (Presiona Ctrl+C para detener)")
-    
-    processed = load_processed()
-    
+
     try:
-        while True:
-            # Buscar archivos .bak en directorios (recursivo)
-            p = Path(WATCH_DIR)
-            for bak_file in p.rglob("*.bak"):
-                if bak_file.name not in processed and "Majoba" in str(bak_file):
-                     # Solo procesamos Majoba automáticamente por ahora como demo
-                     run_pipeline(bak_file)
-                     processed.add(bak_file.name)
-            
-            time.sleep(5)
+        watcher.run()
     except KeyboardInterrupt:
         print("\n🛑 Vigilancia detenida.")
 
 if __name__ == "__main__":
-    watch()
+    parser = argparse.ArgumentParser(description="Vigila una carpeta y audita los respaldos .bak nuevos")
+    parser.add_argument("watch_dir", nargs="?", default=WATCH_DIR)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Pipelines simultáneos")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Tamaño máximo de la cola de trabajos")
+    parser.add_argument("--stable-seconds", type=int, default=STABLE_SECONDS,
+                        help="Segundos sin cambios de tamaño antes de procesar un archivo")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="Segundos entre revisiones")
+    parser.add_argument("--stage-timeout", type=int, default=DEFAULT_STAGE_TIMEOUT, help="Timeout por etapa en segundos")
+    parser.add_argument("--polling", action="store_true", help="Forzar sondeo aunque haya notificaciones nativas")
+    parser.add_argument("--ledger", default=LEDGER_DB, help="Bitácora SQLite de trabajos y etapas")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Carpeta raíz de reportes (<slug>/ por empresa)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--efos-index", default=DEFAULT_INDEX, help="Índice del listado 69-B para la etapa EFOS")
+    args = parser.parse_args()
+    watch(args.watch_dir, workers=args.workers, queue_size=args.queue_size, stable_seconds=args.stable_seconds,
+          poll_interval=args.poll_interval, stage_timeout=args.stage_timeout, use_events=not args.polling,
+          ledger_path=args.ledger, output_dir=args.output_dir, cache=args.cache, efos_index=args.efos_index)
@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from pathlib import Path
+
+from cross_match import cross_match
+from efos_list import DEFAULT_INDEX
+from extract_xmls import scan_directory
+from full_scan import REPORT_FILES, full_scan
+from scan_cache import DEFAULT_CACHE_PATH
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+DEFAULT_OUTPUT_DIR = "reports"
+DEFAULT_WORKERS = 4
+# Lectores simultáneos por dispositivo: en un disco mecánico dos lecturas secuenciales se estorban
+DEFAULT_READERS_PER_DEVICE = 1
+INDEX_FILE = "index.json"
+
+# Reportes por empresa dentro de <output_dir>/<slug>/ (el dashboard los resuelve con index.json)
+COMPANY_FILES = dict(REPORT_FILES, **{
+    "cfdis": "cfdis_{slug}.jsonl",
+    "cross_match": "cross_match_{slug}.json",
+    "cross_match_unmatched": "cross_match_{slug}_unmatched.jsonl",
+    "efos": "efos_analysis_{slug}.json",
+    "audit_report": "audit_report_{slug}.md",
+})
+
+
+def company_paths(output_dir, slug):
+    """Rutas predecibles de todos los reportes de una empresa"""
+    folder = Path(output_dir) / slug
+    return {name: folder / template.format(slug=slug) for name, template in COMPANY_FILES.items()}
+
+
+def load_manifest(path):
+    """
+    Manifiesto JSON: {"companies": [{"slug", "name", "rfc", "bak", "xml_dir"}, ...]}.
+    `bak` y `xml_dir` son opcionales (se omiten las etapas que los requieren); las rutas
+    relativas se resuelven contra la carpeta del manifiesto.
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    companies = []
+    seen = set()
+    for entry in manifest.get("companies", []):
+        slug = entry.get("slug")
+        if not slug or slug in seen:
+            raise ValueError(f"Cada empresa necesita un slug único: {entry}")
+        seen.add(slug)
+        company = dict(entry, name=entry.get("name", slug), rfc=entry.get("rfc", ""))
+        for key in ("bak", "xml_dir"):
+            if company.get(key):
+                company[key] = str((path.parent / company[key]).resolve())
+        companies.append(company)
+    return companies
+
+
+def _device(path):
+    # Volumen físico del archivo (st_dev); rutas inexistentes cuentan como su propio dispositivo
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return path
+
+
+def _tree_size(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _mtime(path):
+    path = Path(path)
+    if path.is_dir():
+        return max((p.stat().st_mtime for p in path.rglob('*') if p.is_file()), default=path.stat().st_mtime)
+    return path.stat().st_mtime
+
+
+# --- Etapas (se ejecutan en los procesos del pool; devuelven las rutas escritas) ---
+
+def run_scan(company, paths, options):
+    """Extractor, anomalías, nómina y cubos mensuales en una sola lectura del respaldo"""
+    outputs = full_scan(company["bak"], company["name"], company["rfc"], company["slug"],
+                        workers=options["scan_workers"], cache=options["cache"],
+                        output_dir=paths["data"].parent)
+    return list(outputs.values())
+
+
+def run_xmls(company, paths, options):
+    paths["cfdis"].parent.mkdir(parents=True, exist_ok=True)
+    scan_directory(company["xml_dir"], str(paths["cfdis"]), workers=options["xml_workers"])
+    return [str(paths["cfdis"])]
+
+
+def run_cross_match(company, paths, options):
+    # El escaneo de montos se reproduce desde la caché que dejó la etapa `scan`
+    report = cross_match(company["bak"], str(paths["cfdis"]), cache=options["cache"],
+                         details_path=str(paths["cross_match_unmatched"]))
+    with open(paths["cross_match"], 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return [str(paths["cross_match"]), str(paths["cross_match_unmatched"])]
+
+
+def efos_command(company, paths, options):
+    """
+    Línea de comandos de efos_detector para una empresa (también la usa el vigilante).
+    Corre en el directorio de trabajo actual: ahí resuelve .env.local (API key) y la caché de
+    respuestas; las rutas van absolutas. Con --bak revisa todos los RFCs del respaldo
+    (reproducidos desde la caché de escaneo), no solo la muestra del resumen
+    """
+    command = [sys.executable, str(SCRIPTS_DIR / "efos_detector.py"),
+               "--data", str(paths["data"].resolve()), "--bak", company["bak"],
+               "--efos-index", options["efos_index"], "--output", str(paths["efos"].resolve()),
+               "--report", str(paths["audit_report"].resolve())]
+    if options["cache"]:
+        command += ["--cache", options["cache"]]
+    return command
+
+
+def run_efos(company, paths, options):
+    subprocess.run(efos_command(company, paths, options), check=True)
+    return [str(paths[name]) for name in ("efos", "audit_report") if paths[name].exists()]
+
+
+def _has_api_key():
+    # Misma búsqueda que efos_detector: variable de entorno o .env.local del directorio de trabajo
+    if os.getenv('GOOGLE_GENERATIVE_AI_API_KEY'):
+        return True
+    env_path = Path('.env.local')
+    return env_path.exists() and any(line.strip().startswith('GOOGLE_GENERATIVE_AI_API_KEY=')
+                                     for line in env_path.read_text(encoding='utf-8').splitlines())
+
+
+def efos_available(company, options):
+    # Sin índice 69-B ni API key el detector no tiene con qué revisar los RFCs
+    has_source = os.path.exists(options["efos_index"]) or _has_api_key()
+    return bool(company.get("bak")) and has_source
+
+
+# (nombre, función, dependencias, entrada que lee del disco, ¿aplica?, reportes que produce)
+STAGES = [
+    ("scan", run_scan, (), "bak", lambda company, options: bool(company.get("bak")),
+     ("data", "anomalies", "payroll", "periods", "store")),
+    ("xmls", run_xmls, (), "xml_dir", lambda company, options: bool(company.get("xml_dir")),
+     ("cfdis",)),
+    ("cross_match", run_cross_match, ("scan", "xmls"), "bak",
+     lambda company, options: bool(company.get("bak") and company.get("xml_dir")),
+     ("cross_match",)),
+    ("efos", run_efos, ("scan",), "bak", efos_available, ("efos",)),
+]
+
+
+def _execute(stage_name, company, paths, options):
+    """Tarea de worker: ejecuta una etapa y mide su duración"""
+    func = next(stage[1] for stage in STAGES if stage[0] == stage_name)
+    start = time.time()
+    outputs = func(company, paths, options)
+    return outputs, time.time() - start
+
+
+class Task:
+    def __init__(self, company, name, deps, source, outputs, size):
+        self.company = company
+        self.name = name
+        self.deps = deps
+        self.source = source
+        self.outputs = outputs
+        # Peso para el orden: tamaño total de las entradas de la empresa (respaldo + XMLs)
+        self.size = size
+        self.device = _device(source) if source else None
+        self.status = "pending"
+        self.seconds = None
+        self.error = None
+
+    @property
+    def key(self):
+        return (self.company["slug"], self.name)
+
+
+class BatchRunner:
+    """
+    Audita muchas empresas con un pool de procesos compartido. Cada empresa es un grafo de
+    etapas (scan -> cross_match, xmls -> cross_match, scan -> efos); entre las etapas listas
+    se despacha primero la de la empresa más pesada (LPT: reduce el tiempo total de la noche)
+    y nunca hay más de `readers_per_device` etapas leyendo del mismo disco.
+    """
+
+    def __init__(self, companies, output_dir=DEFAULT_OUTPUT_DIR, workers=DEFAULT_WORKERS,
+                 readers_per_device=DEFAULT_READERS_PER_DEVICE, cache=DEFAULT_CACHE_PATH, efos_index=DEFAULT_INDEX,
+                 scan_workers=1, xml_workers=1, force=False):
+        self.companies = companies
+        self.output_dir = Path(output_dir)
+        self.workers = workers
+        self.readers_per_device = readers_per_device
+        self.force = force
+        self.options = {"cache": cache and str(Path(cache).resolve()), "efos_index": str(Path(efos_index).resolve()),
+                        "scan_workers": scan_workers, "xml_workers": xml_workers}
+        self.tasks = self._plan()
+
+    def _plan(self):
+        tasks = {}
+        for company in self.companies:
+            size = sum(os.path.getsize(company["bak"]) if key == "bak" else _tree_size(company[key])
+                       for key in ("bak", "xml_dir") if company.get(key) and os.path.exists(company[key]))
+            paths = company_paths(self.output_dir, company["slug"])
+            for name, _, deps, source_key, applies, outputs in STAGES:
+                task = Task(company, name, deps, company.get(source_key) if source_key else None,
+                            [paths[output] for output in outputs], size)
+                # Una etapa cuya dependencia se va a repetir también se repite
+                stale_deps = any(tasks[(company["slug"], dep)].status == "pending" for dep in deps)
+                if not applies(company, self.options):
+                    task.status = "skipped"
+                elif not stale_deps and self._up_to_date(task, self._inputs(company, name)):
+                    task.status = "cached"
+                tasks[task.key] = task
+        return tasks
+
+    def _inputs(self, company, stage_name):
+        """Entradas de una etapa: lo que lee del disco más las entradas de sus dependencias"""
+        _, _, deps, source_key, _, _ = next(stage for stage in STAGES if stage[0] == stage_name)
+        inputs = {company[source_key]} if source_key and company.get(source_key) else set()
+        for dep in deps:
+            inputs |= self._inputs(company, dep)
+        return inputs
+
+    def _up_to_date(self, task, inputs):
+        """Reportes más nuevos que las entradas de la etapa: no se repite (salvo --force)"""
+        if self.force or not all(path.exists() for path in task.outputs):
+            return False
+        newest_input = max((_mtime(path) for path in inputs if os.path.exists(path)), default=0)
+        return min(path.stat().st_mtime for path in task.outputs) >= newest_input
+
+    def _ready(self, task):
+        if task.status != "pending":
+            return False
+        deps = [self.tasks[(task.company["slug"], dep)] for dep in task.deps]
+        if any(dep.status in ("failed", "blocked") for dep in deps):
+            task.status = "blocked"
+            task.error = "falló una etapa previa"
+            return False
+        # Una dependencia omitida (sin bak o sin XMLs) ya dejó fuera a esta etapa en `applies`
+        return all(dep.status in ("done", "cached", "skipped") for dep in deps)
+
+    def run(self):
+        readers = {}
+        running = {}
+        pending = [task for task in self.tasks.values() if task.status == "pending"]
+        print(f"📋 {len(self.companies)} empresas | {len(pending)} etapas por ejecutar | "
+              f"{self.workers} procesos | {self.readers_per_device} lector(es) por disco")
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                ready = sorted((task for task in self.tasks.values() if self._ready(task)),
+                               key=lambda task: -task.size)
+                for task in ready:
+                    if len(running) >= self.workers:
+                        break
+                    if task.device is not None and readers.get(task.device, 0) >= self.readers_per_device:
+                        continue
+                    if task.device is not None:
+                        readers[task.device] = readers.get(task.device, 0) + 1
+                    task.status = "running"
+                    paths = company_paths(self.output_dir, task.company["slug"])
+                    print(f"▶️ {task.company['slug']}: {task.name}")
+                    running[executor.submit(_execute, task.name, task.company, paths, self.options)] = task
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    if task.device is not None:
+                        readers[task.device] -= 1
+                    try:
+                        _, task.seconds = future.result()
+                        task.status = "done"
+                        print(f"✓ {task.company['slug']}: {task.name} en {task.seconds:.1f}s")
+                    except Exception as e:
+                        task.status = "failed"
+                        task.error = str(e) or type(e).__name__
+                        print(f"❌ {task.company['slug']}: {task.name} falló ({task.error})")
+        elapsed = time.time() - start
+        self.write_index()
+        counts = {}
+        for task in self.tasks.values():
+            counts[task.status] = counts.get(task.status, 0) + 1
+        print(f"⏱️ Lote terminado en {elapsed:.1f}s: " + ", ".join(f"{n} {s}" for s, n in sorted(counts.items())))
+        return counts
+
+    def write_index(self):
+        """Registra las empresas del manifiesto en index.json con el estado de cada etapa"""
+        entries = {}
+        for company in self.companies:
+            slug = company["slug"]
+            stages = {name: {"status": task.status, "seconds": task.seconds and round(task.seconds, 1),
+                             "error": task.error}
+                      for (task_slug, name), task in self.tasks.items() if task_slug == slug}
+            entries[slug] = company_entry(self.output_dir, company, stages)
+        index_path = update_index(self.output_dir, entries)
+        print(f"💾 Índice del lote: {index_path}")
+
+
+def company_entry(output_dir, company, stages):
+    """Entrada de index.json: nombre, RFC, rutas relativas de los reportes existentes y etapas"""
+    paths = company_paths(output_dir, company["slug"])
+    return {
+        "name": company["name"],
+        "rfc": company["rfc"],
+        "reports": {name: path.relative_to(output_dir).as_posix() for name, path in paths.items() if path.exists()},
+        "stages": stages,
+    }
+
+
+def update_index(output_dir, entries):
+    """
+    index.json: agrega o reemplaza las empresas de `entries` ({slug: entrada}); las de
+    corridas anteriores se conservan. Devuelve la ruta del índice.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    index_path = output_dir / INDEX_FILE
+    index = {"companies": {}}
+    if index_path.exists():
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    index["companies"].update(entries)
+    index["generated"] = datetime.now().isoformat()
+    tmp_path = index_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    # Reemplazo atómico: el dashboard nunca lee un índice a medio escribir
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auditoría nocturna de varias empresas desde un manifiesto")
+    parser.add_argument("manifest", help="JSON con las empresas: slug, name, rfc, bak, xml_dir")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Carpeta raíz de reportes (<slug>/ por empresa)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Procesos del pool compartido")
+    parser.add_argument("--readers-per-device", type=int, default=DEFAULT_READERS_PER_DEVICE,
+                        help="Etapas que leen a la vez del mismo disco")
+    parser.add_argument("--scan-workers", type=int, default=1, help="Procesos por escaneo de respaldo (rangos)")
+    parser.add_argument("--xml-workers", type=int, default=1, help="Procesos por extracción de XMLs")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--efos-index", default=DEFAULT_INDEX, help="Índice del listado 69-B (efos_list.py)")
+    parser.add_argument("--force", action="store_true", help="Repetir etapas aunque sus reportes estén al día")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🌙 AUDITORÍA POR LOTES - AUDITOR-IA")
+    print("=" * 60)
+    runner = BatchRunner(load_manifest(args.manifest), output_dir=args.output_dir, workers=args.workers,
+                         readers_per_device=args.readers_per_device, cache=args.cache, efos_index=args.efos_index,
+                         scan_workers=args.scan_workers, xml_workers=args.xml_workers, force=args.force)
+    counts = runner.run()
+    sys.exit(1 if counts.get("failed") else 0)
@@ -0,0 +1,95 @@
+import math
+
+# Frecuencias esperadas por la Ley de Benford
+BENFORD_FIRST = {d: math.log10(1 + 1 / d) for d in range(1, 10)}
+BENFORD_FIRST_TWO = {d: math.log10(1 + 1 / d) for d in range(10, 100)}
+UNIFORM_LAST_TWO = {d: 0.01 for d in range(100)}
+
+# Valores críticos de chi-cuadrada al 5% (grados de libertad = categorías - 1)
+CHI2_CRITICAL_05 = {8: 15.507, 89: 112.022, 99: 123.225}
+
+# Umbrales MAD de Nigrini (cercana, aceptable, marginal); arriba = no conformidad
+MAD_THRESHOLDS = {
+    'first': (0.006, 0.012, 0.015),
+    'first_two': (0.0012, 0.0018, 0.0022),
+    'last_two': (0.0012, 0.0018, 0.0022),
+}
+CONFORMITY_LABELS = ("Conformidad cercana", "Conformidad aceptable", "Conformidad marginal", "No conformidad")
+
+
+class DigitStatsAccumulator:
+    """
+    Acumulador incremental de dígitos para Benford y cifras redondas.
+    Trabaja sobre centavos enteros (sin `str(float)`), usa memoria O(1) en el
+    número de montos y sus estados parciales se pueden fusionar (workers paralelos).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.first = [0] * 10        # Primer dígito significativo
+        self.first_two = [0] * 100   # Primeros dos dígitos (montos >= 0.10)
+        self.last_two = [0] * 100    # Centavos
+        self.round_units = 0         # Sin centavos (.00)
+        self.round_hundreds = 0      # Múltiplos de $100
+        self.round_thousands = 0     # Múltiplos de $1,000
+
+    def add(self, amount):
+        self.add_cents(int(round(amount * 100)))
+
+    def add_cents(self, cents):
+        if cents <= 0:
+            return
+        digits = str(cents)
+        self.count += 1
+        self.first[ord(digits[0]) - 48] += 1
+        if len(digits) >= 2:
+            self.first_two[int(digits[:2])] += 1
+        self.last_two[cents % 100] += 1
+        if cents % 100 == 0:
+            self.round_units += 1
+            if cents % 10000 == 0:
+                self.round_hundreds += 1
+                if cents % 100000 == 0:
+                    self.round_thousands += 1
+
+    def merge(self, other):
+        self.count += other.count
+        for mine, theirs in ((self.first, other.first), (self.first_two, other.first_two), (self.last_two, other.last_two)):
+            for i, value in enumerate(theirs):
+                mine[i] += value
+        self.round_units += other.round_units
+        self.round_hundreds += other.round_hundreds
+        self.round_thousands += other.round_thousands
+
+    def first_digit_test(self):
+        return self._conformity(self.first, BENFORD_FIRST, 'first')
+
+    def first_two_digits_test(self):
+        return self._conformity(self.first_two, BENFORD_FIRST_TWO, 'first_two')
+
+    def last_two_digits_test(self):
+        return self._conformity(self.last_two, UNIFORM_LAST_TWO, 'last_two')
+
+    def _conformity(self, counts, expected, test):
+        """Chi-cuadrada y MAD (desviación absoluta media) contra la distribución esperada"""
+        total = sum(counts[d] for d in expected)
+        if not total:
+            return {"status": "No data"}
+        chi2 = 0.0
+        abs_dev = 0.0
+        for digit, prob in expected.items():
+            observed = counts[digit] / total
+            chi2 += (counts[digit] - prob * total) ** 2 / (prob * total)
+            abs_dev += abs(observed - prob)
+        mad = abs_dev / len(expected)
+        level = sum(1 for threshold in MAD_THRESHOLDS[test] if mad > threshold)
+        critical = CHI2_CRITICAL_05[len(expected) - 1]
+        return {
+            "n": total,
+            "chi_square": round(chi2, 3),
+            "chi_square_critical_05": critical,
+            "chi_square_reject": chi2 > critical,
+            "mad": round(mad, 5),
+            "conformity": CONFORMITY_LABELS[level],
+            "conformity_level": level,
+        }
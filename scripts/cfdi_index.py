@@ -0,0 +1,218 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+from extract_xmls import FIELDS, BATCH_SIZE, iter_xml_files, parse_cfdi, batched
+
+DEFAULT_DB = "cfdi_index.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    uuid TEXT,
+    indexed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS cfdis (
+    uuid TEXT PRIMARY KEY,
+    rfc_emisor TEXT,
+    nombre_emisor TEXT,
+    rfc_receptor TEXT,
+    total REAL,
+    subtotal REAL,
+    tipo TEXT,
+    fecha TEXT,
+    moneda TEXT,
+    path TEXT,
+    copies INTEGER NOT NULL DEFAULT 1,
+    first_seen TEXT,
+    last_seen TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_files_uuid ON files (uuid);
+CREATE INDEX IF NOT EXISTS idx_cfdis_emisor ON cfdis (rfc_emisor);
+CREATE INDEX IF NOT EXISTS idx_cfdis_receptor ON cfdis (rfc_receptor);
+CREATE INDEX IF NOT EXISTS idx_cfdis_fecha ON cfdis (fecha);
+"""
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_batch(items):
+    """Tarea de worker: [(ruta, tamaño, mtime, hash_previo)] -> [(ruta, tamaño, mtime, hash, datos | None | 'same')]"""
+    results = []
+    for path, size, mtime, previous_hash in items:
+        try:
+            digest = file_hash(path)
+        except OSError:
+            continue
+        if digest == previous_hash:
+            # Solo cambió el mtime (copia o touch): no hace falta reparsear
+            results.append((path, size, mtime, digest, 'same'))
+        else:
+            results.append((path, size, mtime, digest, parse_cfdi(path)))
+    return results
+
+
+class CFDIIndex:
+    """
+    Índice persistente de CFDIs en SQLite.
+    Solo se leen los XML nuevos o modificados (tamaño/mtime, y hash para confirmar),
+    y cada comprobante se guarda una vez por UUID del TimbreFiscalDigital aunque
+    aparezca en varios respaldos.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB):
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _known_files(self, base_path):
+        prefix = os.path.join(os.path.abspath(base_path), '')
+        rows = self.conn.execute("SELECT path, size, mtime_ns, hash FROM files WHERE substr(path, 1, ?) = ?",
+                                 (len(prefix), prefix))
+        return {path: (size, mtime, digest) for path, size, mtime, digest in rows}
+
+    def _changed_files(self, base_path, stats):
+        """Genera (ruta, tamaño, mtime, hash_previo) de los XML nuevos o con tamaño/mtime distinto"""
+        known = self._known_files(base_path)
+        for path in iter_xml_files(os.path.abspath(base_path)):
+            stats['seen'] += 1
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            previous = known.get(path)
+            if previous and previous[:2] == (st.st_size, st.st_mtime_ns):
+                continue
+            yield path, st.st_size, st.st_mtime_ns, previous[2] if previous else None
+
+    def update(self, base_path, workers=None, batch_size=BATCH_SIZE):
+        """Ingiere solo el delta del árbol; devuelve estadísticas de la corrida"""
+        workers = workers or os.cpu_count() or 1
+        stats = {'seen': 0, 'changed': 0, 'new_cfdis': 0, 'updated': 0, 'duplicates': 0, 'invalid': 0, 'removed': 0}
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for batch in batched(self._changed_files(base_path, stats), batch_size):
+                pending.add(executor.submit(index_batch, batch))
+                # Cola acotada (como extract_xmls): el recorrido no se adelanta al parseo
+                if len(pending) < workers * 4:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._store(future.result(), stats)
+            for future in pending:
+                self._store(future.result(), stats)
+        stats['seconds'] = round(time.time() - start, 2)
+        return stats
+
+    def _store(self, results, stats):
+        now = datetime.now().isoformat()
+        with self.conn:
+            for path, size, mtime, digest, data in results:
+                stats['changed'] += 1
+                row = self.conn.execute("SELECT uuid FROM files WHERE path = ?", (path,)).fetchone()
+                previous = row[0] if row else None
+                uuid = None
+                if data == 'same':
+                    uuid = previous
+                elif data is None:
+                    stats['invalid'] += 1
+                else:
+                    # Sin timbre no hay UUID: se usa el hash del archivo para no perder el comprobante
+                    uuid = data['uuid'] if data['uuid'] not in (None, 'N/A') else f"SIN-UUID:{digest}"
+                    if previous == uuid:
+                        # El mismo XML fue modificado: se actualizan sus datos
+                        stats['updated'] += 1
+                        self.conn.execute(
+                            f"UPDATE cfdis SET {', '.join(f'{field} = ?' for field in FIELDS[1:])}, last_seen = ? "
+                            "WHERE uuid = ?", tuple(data[field] for field in FIELDS[1:]) + (now, uuid))
+                    else:
+                        inserted = self.conn.execute(
+                            "INSERT INTO cfdis (uuid, rfc_emisor, nombre_emisor, rfc_receptor, total, subtotal, tipo, "
+                            "fecha, moneda, path, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                            "ON CONFLICT (uuid) DO NOTHING",
+                            (uuid,) + tuple(data[field] for field in FIELDS[1:]) + (path, now, now)
+                        ).rowcount
+                        if inserted:
+                            stats['new_cfdis'] += 1
+                        else:
+                            # Mismo UUID en otro respaldo: una sola fila
+                            stats['duplicates'] += 1
+                            self.conn.execute("UPDATE cfdis SET last_seen = ? WHERE uuid = ?", (now, uuid))
+                self._upsert_file(path, size, mtime, digest, uuid, now)
+                if uuid is not None:
+                    self._count_copies(uuid)
+                if previous is not None and previous != uuid:
+                    # El archivo cambió de UUID o dejó de ser válido: su comprobante anterior pierde una copia
+                    stats['removed'] += self._count_copies(previous)
+
+    def _count_copies(self, uuid):
+        """
+        Copias de un UUID = archivos del índice que lo contienen. Sin archivos se borra el
+        comprobante (devuelve 1); si su ruta ya no lo contiene apunta a otra copia.
+        """
+        copies, path = self.conn.execute("SELECT COUNT(*), MIN(path) FROM files WHERE uuid = ?", (uuid,)).fetchone()
+        if not copies:
+            return self.conn.execute("DELETE FROM cfdis WHERE uuid = ?", (uuid,)).rowcount
+        self.conn.execute("UPDATE cfdis SET copies = ?, path = CASE WHEN EXISTS "
+                          "(SELECT 1 FROM files WHERE files.path = cfdis.path AND files.uuid = cfdis.uuid) "
+                          "THEN cfdis.path ELSE ? END WHERE uuid = ?", (copies, path, uuid))
+        return 0
+
+    def _upsert_file(self, path, size, mtime, digest, uuid, now):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns, hash, uuid, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, size, mtime, digest, uuid, now))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM cfdis").fetchone()[0]
+
+    def iter_cfdis(self, where="", params=()):
+        """CFDIs del índice con los mismos campos que parse_cfdi"""
+        cursor = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM cfdis {where} ORDER BY fecha", params)
+        for row in cursor:
+            yield dict(zip(FIELDS, row))
+
+    def export_jsonl(self, output_path):
+        with open(output_path, 'w', encoding='utf-8') as f:
+            for data in self.iter_cfdis():
+                f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice incremental de CFDIs (solo procesa XML nuevos o modificados)")
+    parser.add_argument("base_paths", nargs="+", help="Carpetas con XMLs (una o varias copias de respaldo)")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Base SQLite del índice")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos de parseo (por defecto: CPUs)")
+    parser.add_argument("--export", default=None, help="Exportar el índice completo a JSON Lines")
+    args = parser.parse_args()
+
+    index = CFDIIndex(args.db)
+    for base_path in args.base_paths:
+        print(f"📂 Indexando: {base_path}")
+        stats = index.update(base_path, workers=args.workers)
+        print(f"  {stats['seen']} XML revisados | {stats['changed']} nuevos/modificados | "
+              f"{stats['new_cfdis']} CFDIs nuevos | {stats['updated']} actualizados | {stats['duplicates']} UUID repetidos | "
+              f"{stats['invalid']} inválidos | {stats['removed']} retirados | {stats['seconds']}s")
+    print(f"✅ Índice con {index.count()} CFDIs únicos: {args.db}")
+    if args.export:
+        index.export_jsonl(args.export)
+        print(f"💾 Exportado a: {args.export}")
+    index.close()
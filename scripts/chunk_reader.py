@@ -0,0 +1,186 @@
+import mmap
+import heapq
+from collections import namedtuple
+from operator import itemgetter
+
+from dual_encoding import ASCII, ENCODINGS, compile_dual, narrow
+
+DEFAULT_CHUNK_SIZE = 10 * 1024 * 1024
+# Debe ser mayor que el match más largo esperado (RFCs, montos, cadenas < 100)
+DEFAULT_OVERLAP = 4 * 1024
+
+# data: buffer (bytes o memoryview) | base: offset absoluto de data[0]
+# begin/end: región de data que se escanea (incluye contexto y traslape).
+# lo/hi: posiciones relativas donde pueden *iniciar* los matches de esta ventana.
+# [begin, lo) es contexto ya cubierto por la ventana anterior; [hi, end) se difiere a la siguiente.
+Window = namedtuple('Window', ['data', 'base', 'begin', 'lo', 'hi', 'end'])
+
+
+class OverlappingReader:
+    """
+    Lector por bloques que arrastra una cola de `overlap` bytes entre lecturas,
+    para que los matches que cruzan el límite de un bloque no se pierdan.
+    Opcionalmente limita la lectura al rango [start, end) del archivo.
+    """
+
+    def __init__(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, start=0, end=None):
+        if chunk_size <= 2 * overlap:
+            raise ValueError("chunk_size debe ser mayor que 2 * overlap")
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        with open(self.file_path, 'rb') as f:
+            # Contexto previo para lookbehinds y matches que inician antes de `start`
+            read_pos = max(0, self.start - self.overlap)
+            f.seek(read_pos)
+            data = b''
+            base = read_pos
+            lo = self.start - read_pos
+
+            while True:
+                to_read = self.chunk_size
+                if self.end is not None:
+                    # Leer `overlap` bytes más allá de `end` para completar matches del borde
+                    to_read = min(to_read, self.end + self.overlap - (base + len(data)))
+                chunk = f.read(to_read) if to_read > 0 else b''
+                data += chunk
+                eof = not chunk or (self.end is not None and base + len(data) >= self.end + self.overlap)
+
+                hi = len(data) if eof else len(data) - self.overlap
+                if self.end is not None:
+                    hi = min(hi, self.end - base)
+                if hi > lo:
+                    yield Window(data, base, 0, lo, hi, len(data))
+                if eof or (self.end is not None and base + hi >= self.end):
+                    break
+
+                # Arrastrar `overlap` bytes de contexto + la cola diferida. Si no hubo ventana
+                # (rango más corto que el traslape al final del archivo) `lo` no retrocede
+                keep = max(0, hi - self.overlap)
+                data = data[keep:]
+                base += keep
+                lo = max(lo, hi) - keep
+
+
+class MappedReader:
+    """
+    Variante de OverlappingReader sobre `mmap`: las ventanas son vistas (memoryview)
+    del respaldo mapeado, sin copiar bytes por bloque. Los regex de bytes corren
+    directo sobre la vista y solo se materializa lo que el consumidor pide.
+    """
+
+    def __init__(self, file_path, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, start=0, end=None):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.start = start
+        self.end = end
+
+    def __iter__(self):
+        with open(self.file_path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Archivo vacío: no hay nada que mapear
+                return
+            try:
+                if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                try:
+                    yield from self._windows(mm, view)
+                finally:
+                    view.release()
+            finally:
+                mm.close()
+
+    def _windows(self, mm, view):
+        size = len(mm)
+        stop = size if self.end is None else min(self.end, size)
+        lo = self.start
+        released = 0
+        while lo < stop:
+            hi = min(lo + self.chunk_size, stop)
+            begin = max(0, lo - self.overlap)
+            end = min(size, hi + self.overlap)
+            yield Window(view, 0, begin, lo, hi, end)
+
+            # Liberar las páginas ya procesadas para mantener el RSS acotado
+            if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+                release_to = (begin // mmap.PAGESIZE) * mmap.PAGESIZE
+                if release_to > released:
+                    mm.madvise(mmap.MADV_DONTNEED, released, release_to - released)
+                    released = release_to
+            lo = hi
+
+
+def open_reader(file_path, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, start=0, end=None, use_mmap=False):
+    """Devuelve el lector adecuado: mmap (sin copias) o bloques con traslape"""
+    reader_class = MappedReader if use_mmap else OverlappingReader
+    return reader_class(file_path, chunk_size=chunk_size, overlap=overlap, start=start, end=end)
+
+
+class WindowScanner:
+    """
+    Aplica un regex a ventanas sucesivas y entrega solo los matches propios de cada ventana,
+    deduplicando por offset absoluto los que ya se reportaron en la ventana anterior.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.last_end = -1
+
+    def scan(self, window, limit=None):
+        """Genera (offset_absoluto, match). `limit` acota el offset absoluto de inicio."""
+        data, base, begin, lo, hi, end = window
+        if limit is not None:
+            hi = min(hi, limit - base)
+        for match in self.pattern.finditer(data, begin, end):
+            start = match.start()
+            if start >= hi:
+                break
+            if start < lo:
+                continue
+            absolute = base + start
+            if absolute < self.last_end:
+                continue
+            self.last_end = base + match.end()
+            yield absolute, match
+
+
+class DualScanner:
+    """
+    Un WindowScanner por codificación (un byte y UTF-16LE) sobre la misma ventana:
+    entrega (offset_absoluto, match, ancho) en orden de offset, sin decodificar el bloque.
+    """
+
+    def __init__(self, pattern, encodings=ENCODINGS):
+        self.encodings = tuple(enc for enc in ENCODINGS if enc in encodings)
+        self.branches = [(WindowScanner(regex), width) for regex, width in compile_dual(pattern, encodings)]
+
+    def scan(self, window, limit=None):
+        streams = [self._tagged(scanner, width, window, limit) for scanner, width in self.branches]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=itemgetter(0))
+
+    @staticmethod
+    def _tagged(scanner, width, window, limit):
+        for offset, match in scanner.scan(window, limit=limit):
+            yield offset, match, width
+
+
+def iter_matches(file_path, pattern, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, group=0, use_mmap=False,
+                 encodings=(ASCII,)):
+    """
+    Genera (offset_absoluto, bytes) para cada match del patrón en todo el archivo.
+    Con `encodings=ENCODINGS` también reconoce UTF-16LE (valor normalizado a un byte por carácter).
+    """
+    scanner = DualScanner(pattern, encodings)
+    for window in open_reader(file_path, chunk_size=chunk_size, overlap=overlap, use_mmap=use_mmap):
+        for offset, match, width in scanner.scan(window):
+            yield offset, narrow(match.group(group), width)
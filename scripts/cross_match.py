@@ -0,0 +1,254 @@
+import json
+import sqlite3
+import argparse
+from array import array
+from bisect import bisect_left
+from datetime import date
+from pathlib import Path
+
+from scan_engine import EPOCH_ORDINAL, run_plugins
+from scan_cache import DEFAULT_CACHE_PATH
+from typed_records import NO_DATE, TypedExtractor, day_to_iso
+
+SAMPLE_SIZE = 200
+
+
+def _cfdi_day(fecha):
+    try:
+        return date.fromisoformat(fecha[:10]).toordinal() - EPOCH_ORDINAL
+    except (TypeError, ValueError):
+        return NO_DATE
+
+
+def load_cfdis(source):
+    """CFDIs desde el índice SQLite (cfdi_index.py), JSON Lines o el arreglo JSON de extract_xmls.py"""
+    source = Path(source)
+    if source.suffix in ('.sqlite', '.db'):
+        conn = sqlite3.connect(str(source))
+        try:
+            columns = ("uuid", "rfc_emisor", "rfc_receptor", "total", "subtotal", "fecha")
+            for row in conn.execute(f"SELECT {', '.join(columns)} FROM cfdis"):
+                yield dict(zip(columns, row))
+        finally:
+            conn.close()
+    elif source.suffix == '.jsonl':
+        with open(source, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(source, encoding='utf-8') as f:
+            yield from json.load(f)
+
+
+def _to_cents(amount):
+    return int(round(float(amount or 0) * 100))
+
+
+class CrossMatcher:
+    """
+    Cruce uno a uno de CFDIs (total y subtotal) contra montos del respaldo.
+    Los montos se ordenan una vez por (centavos, día); cada factura busca con bisect,
+    dentro de cada importe de su tolerancia, la partida libre más cercana antes y después
+    de su fecha. Las partidas ya usadas se saltan con estructuras "siguiente/anterior libre"
+    (union-find), así el costo es O((n + m) log m) sin ciclos anidados ni tope de candidatos.
+    """
+
+    def __init__(self, ledger_cents, ledger_days, tolerance_cents=0, date_window_days=None):
+        self.tolerance = tolerance_cents
+        self.date_window = date_window_days
+        n = len(ledger_cents)
+        # Orden por (centavos, día, posición) empaquetado en un solo entero: el sort compara ints en C
+        keys = sorted((cents << 48) | ((days + 1) << 32) | i
+                      for i, (cents, days) in enumerate(zip(ledger_cents, ledger_days)))
+        self.order = array('q', (key & 0xFFFFFFFF for key in keys))
+        self.cents = array('q', (key >> 48 for key in keys))
+        self.days = array('l', (((key >> 32) & 0xFFFF) - 1 for key in keys))
+        # Llave (centavos, día + 1) para ubicar con bisect un día dentro de cada importe; sin fecha = 0
+        self.keys = array('q', (key >> 32 for key in keys))
+        del keys
+        # next_free[j]: siguiente partida sin usar en posición >= j (n = ninguna)
+        self.next_free = array('q', range(n + 1))
+        # prev_free[j + 1]: partida sin usar anterior en posición <= j (-1 = ninguna)
+        self.prev_free = array('q', range(-1, n))
+
+    def _find(self, j):
+        next_free = self.next_free
+        while next_free[j] != j:
+            next_free[j] = next_free[next_free[j]]
+            j = next_free[j]
+        return j
+
+    def _find_prev(self, j):
+        prev_free = self.prev_free
+        k = j + 1
+        while prev_free[k] != k - 1:
+            prev_free[k] = prev_free[prev_free[k] + 1]
+            k = prev_free[k] + 1
+        return k - 1
+
+    def _candidates(self, cents, day):
+        """Mejores partidas libres de un importe exacto: la primera sin fecha y las más cercanas a `day`"""
+        keys = self.keys
+        n = len(keys)
+        base = cents << 16
+        # Las partidas sin fecha (día + 1 = 0) van al inicio del bloque: la primera libre las representa
+        j = self._find(bisect_left(keys, base))
+        if j >= n or keys[j] >> 16 != cents:
+            return
+        if keys[j] == base or day == NO_DATE:
+            yield j
+            if day == NO_DATE:
+                # Factura sin fecha: todas las partidas del importe valen lo mismo
+                return
+        window = self.date_window if self.date_window is not None else 0xFFFF
+        lower = base | max(1, day + 1 - window)
+        upper = base | min(0xFFFF, day + 1 + window)
+        target = bisect_left(keys, base | min(0xFFFF, day + 1))
+        after = self._find(target)
+        if after < n and keys[after] <= upper:
+            yield after
+        before = self._find_prev(target - 1)
+        if before >= 0 and keys[before] >= lower:
+            # Entre partidas del mismo día gana la primera libre (orden estable)
+            yield self._find(bisect_left(keys, keys[before]))
+
+    def match_amount(self, cents, day=NO_DATE):
+        """Reserva la mejor partida libre para un importe; devuelve su posición ordenada o None"""
+        keys, sorted_days = self.keys, self.days
+        n = len(keys)
+        best, best_score = None, None
+        j = bisect_left(keys, max(0, cents - self.tolerance) << 16)
+        upper = cents + self.tolerance
+        while j < n and keys[j] >> 16 <= upper:
+            amount = keys[j] >> 16
+            for candidate in self._candidates(amount, day):
+                ledger_day = sorted_days[candidate]
+                dated = day != NO_DATE and ledger_day != NO_DATE
+                score = (abs(amount - cents), abs(ledger_day - day) if dated else 1 << 30, candidate)
+                if best_score is None or score < best_score:
+                    best, best_score = candidate, score
+            if best_score is not None and best_score[:2] == (0, 0):
+                break
+            j = bisect_left(keys, (amount + 1) << 16)
+        if best is not None:
+            self.next_free[best] = best + 1
+            self.prev_free[best + 1] = best - 1
+        return best
+
+    def run(self, cfdis):
+        """Devuelve (cruces, facturas sin partida, posiciones de partidas sin factura)"""
+        matches, unmatched = [], []
+        # Orden determinista (por total) sin importar el orden de entrada de los CFDIs
+        invoices = sorted((max(_to_cents(cfdi.get("total")), 0) << 32) | i for i, cfdi in enumerate(cfdis))
+        days = {}
+        for key in invoices:
+            cfdi = cfdis[key & 0xFFFFFFFF]
+            fecha = cfdi.get("fecha")
+            day = days.get(fecha)
+            if day is None:
+                day = days[fecha] = _cfdi_day(fecha)
+            position = None
+            total = key >> 32
+            if total > 0:
+                position = self.match_amount(total, day)
+                field = "total"
+            if position is None:
+                subtotal = _to_cents(cfdi.get("subtotal"))
+                if subtotal > 0:
+                    position = self.match_amount(subtotal, day)
+                    field = "subtotal"
+            if position is None:
+                unmatched.append(cfdi)
+            else:
+                matches.append((cfdi, field, position))
+        unused = [j for j in range(len(self.cents)) if self.next_free[j] == j]
+        return matches, unmatched, unused
+
+
+def _unmatched_cfdi(cfdi):
+    return {"uuid": cfdi.get("uuid"), "rfc_emisor": cfdi.get("rfc_emisor"), "total": cfdi.get("total"),
+            "subtotal": cfdi.get("subtotal"), "fecha": cfdi.get("fecha")}
+
+
+def cross_match(bak_path, cfdi_source, tolerance_cents=0, date_window_days=None, workers=1, cache=None,
+                max_bytes=None, details_path=None):
+    """
+    Escanea el respaldo (o lo reproduce desde la caché) y cruza sus montos contra los CFDIs.
+    El reporte lleva muestras; con `details_path` se escriben en JSON Lines todas las
+    facturas y partidas sin cruce.
+    """
+    ledger = TypedExtractor(bak_path, max_bytes=max_bytes)
+    run_plugins(bak_path, [ledger], workers=workers, cache=cache)
+    matcher = CrossMatcher(ledger.amounts.values, ledger.amount_days(), tolerance_cents=tolerance_cents,
+                           date_window_days=date_window_days)
+    cfdis = list(load_cfdis(cfdi_source))
+    matches, unmatched, unused = matcher.run(cfdis)
+
+    def ledger_item(position):
+        original = matcher.order[position]
+        return {
+            "offset": ledger.amounts.offsets[original],
+            "amount": matcher.cents[position] / 100,
+            "date": day_to_iso(matcher.days[position]),
+        }
+
+    if details_path:
+        with open(details_path, 'w', encoding='utf-8') as f:
+            for cfdi in unmatched:
+                f.write(json.dumps(dict(_unmatched_cfdi(cfdi), side="cfdi"), ensure_ascii=False) + "\n")
+            for position in unused:
+                f.write(json.dumps(dict(ledger_item(position), side="ledger")) + "\n")
+
+    return {
+        "summary": {
+            "cfdis": len(cfdis),
+            "ledger_amounts": len(matcher.cents),
+            "matched": len(matches),
+            "matched_by_subtotal": sum(1 for _, field, _ in matches if field == "subtotal"),
+            "unmatched_cfdis": len(unmatched),
+            "unmatched_ledger_amounts": len(unused),
+            "match_rate": round(len(matches) / len(cfdis) * 100, 2) if cfdis else 0,
+            "tolerance_cents": tolerance_cents,
+            "date_window_days": date_window_days,
+        },
+        "matches": [
+            {"uuid": cfdi.get("uuid"), "field": field, "cfdi_amount": cfdi.get(field),
+             "cfdi_date": cfdi.get("fecha"), "ledger": ledger_item(position)}
+            for cfdi, field, position in matches[:SAMPLE_SIZE]
+        ],
+        "unmatched_cfdis": [_unmatched_cfdi(cfdi) for cfdi in unmatched[:SAMPLE_SIZE]],
+        "unmatched_ledger_amounts": [ledger_item(position) for position in unused[:SAMPLE_SIZE]],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cruce fiscal: montos del respaldo .bak contra totales de CFDIs")
+    parser.add_argument("bak_path")
+    parser.add_argument("cfdi_source", help="cfdi_index.sqlite, .jsonl o .json de extract_xmls.py")
+    parser.add_argument("--slug", required=True, help="Sufijo del reporte (ej. elizondo)")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Tolerancia en pesos (ej. 0.50 por redondeos)")
+    parser.add_argument("--date-window", type=int, default=None, help="Máxima diferencia en días cuando ambas fechas se conocen")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para escaneo paralelo por rangos")
+    parser.add_argument("--max-mb", type=int, default=None, help="Limitar el escaneo a los primeros N MB (por defecto: completo)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true", help="Reescanear sin usar ni actualizar la caché")
+    args = parser.parse_args()
+    output_path = f"cross_match_{args.slug}.json"
+    details_path = f"cross_match_{args.slug}_unmatched.jsonl"
+
+    print("=" * 60)
+    print("🔗 CRUCE FISCAL AUTOMÁTICO - AUDITOR-IA")
+    print("=" * 60)
+    report = cross_match(args.bak_path, args.cfdi_source, tolerance_cents=int(round(args.tolerance * 100)),
+                         date_window_days=args.date_window, workers=args.workers,
+                         cache=None if args.no_cache else args.cache,
+                         max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None,
+                         details_path=details_path)
+
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    summary = report["summary"]
+    print(f"  CFDIs cruzados: {summary['matched']} de {summary['cfdis']} ({summary['match_rate']}%)")
+    print(f"  CFDIs sin partida: {summary['unmatched_cfdis']} | Partidas sin CFDI: {summary['unmatched_ledger_amounts']}")
+    print(f"💾 Reporte guardado en: {output_path} (detalle sin cruce: {details_path})")
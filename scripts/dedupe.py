@@ -0,0 +1,362 @@
+import hashlib
+import math
+import zlib
+from array import array
+
+# OR de filtros de Bloom con NumPy si está instalado; por bloques en Python puro como respaldo
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_EMPTY = -(2 ** 63)  # Centinela de slot vacío en ExactIntSet
+
+# Capacidad esperada y tasa de falsos positivos con que se dimensiona un filtro de Bloom
+DEFAULT_EXPECTED_ITEMS = 10_000_000
+BLOOM_FALSE_POSITIVE = 0.01
+# Bytes por bloque al fusionar filtros sin NumPy (memoria temporal acotada)
+_MERGE_BLOCK = 1024 * 1024
+
+
+def _mix64(value):
+    """Hash determinista de un entero (splitmix64): igual en todos los procesos"""
+    z = (value + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def _hash_key(key):
+    if isinstance(key, int):
+        return _mix64(key)
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+class ExactIntSet:
+    """
+    Conjunto exacto de enteros de 64 bits (ej. montos en centavos) con
+    direccionamiento abierto sobre `array('q')`: 8 bytes por slot en lugar de
+    los ~60 de un float dentro de un `set` de Python.
+    """
+
+    exact = True
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, initial_slots=1024):
+        self.max_bytes = max_bytes
+        self._count = 0
+        self._table = array('q', [_EMPTY]) * initial_slots
+        self._mask = initial_slots - 1
+
+    def add(self, key):
+        """Agrega la llave; devuelve True si era nueva"""
+        if key == _EMPTY:
+            raise ValueError("Valor reservado")
+        table, mask = self._table, self._mask
+        slot = _mix64(key) & mask
+        while True:
+            current = table[slot]
+            if current == _EMPTY:
+                break
+            if current == key:
+                return False
+            slot = (slot + 1) & mask
+        table[slot] = key
+        self._count += 1
+        if self._count * 10 > len(table) * 7:
+            self._grow()
+        return True
+
+    def __contains__(self, key):
+        table, mask = self._table, self._mask
+        slot = _mix64(key) & mask
+        while True:
+            current = table[slot]
+            if current == _EMPTY:
+                return False
+            if current == key:
+                return True
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        new_slots = len(self._table) * 2
+        if new_slots * self._table.itemsize > self.max_bytes:
+            raise MemoryError(f"Dedupe exacto excede el presupuesto de {self.max_bytes / (1024*1024):.0f} MB; "
+                              "usa el backend aproximado o aumenta el presupuesto")
+        old = self._table
+        self._table = array('q', [_EMPTY]) * new_slots
+        self._mask = new_slots - 1
+        self._count = 0
+        for key in old:
+            if key != _EMPTY:
+                self.add(key)
+
+    def __iter__(self):
+        return (key for key in self._table if key != _EMPTY)
+
+    def __len__(self):
+        return self._count
+
+    def merge(self, other):
+        for key in other:
+            self.add(key)
+
+    @property
+    def memory_bytes(self):
+        return len(self._table) * self._table.itemsize
+
+
+class ExactKeySet:
+    """
+    Conjunto exacto de llaves cortas de ancho fijo (ej. RFCs de 12-13 bytes)
+    empaquetadas en un `bytearray` con direccionamiento abierto.
+    """
+
+    exact = True
+
+    def __init__(self, width=13, max_bytes=256 * 1024 * 1024, initial_slots=1024):
+        self.width = width
+        self.max_bytes = max_bytes
+        self._count = 0
+        self._slots = initial_slots
+        self._table = bytearray(initial_slots * width)
+        self._empty = bytes(width)
+
+    def _pack(self, key):
+        if isinstance(key, str):
+            key = key.encode('ascii')
+        if not key or len(key) > self.width:
+            raise ValueError(f"Llave inválida para ancho {self.width}: {key!r}")
+        return key.ljust(self.width, b'\0')
+
+    def _find(self, packed):
+        """Devuelve (slot, encontrado)"""
+        width, table, mask = self.width, self._table, self._slots - 1
+        slot = zlib.crc32(packed) & mask
+        while True:
+            current = table[slot * width:(slot + 1) * width]
+            if current == self._empty:
+                return slot, False
+            if current == packed:
+                return slot, True
+            slot = (slot + 1) & mask
+
+    def add(self, key):
+        """Agrega la llave; devuelve True si era nueva"""
+        packed = self._pack(key)
+        slot, found = self._find(packed)
+        if found:
+            return False
+        self._table[slot * self.width:(slot + 1) * self.width] = packed
+        self._count += 1
+        if self._count * 10 > self._slots * 7:
+            self._grow()
+        return True
+
+    def __contains__(self, key):
+        return self._find(self._pack(key))[1]
+
+    def _grow(self):
+        new_slots = self._slots * 2
+        if new_slots * self.width > self.max_bytes:
+            raise MemoryError(f"Dedupe exacto excede el presupuesto de {self.max_bytes / (1024*1024):.0f} MB; "
+                              "usa el backend aproximado o aumenta el presupuesto")
+        old = list(self._iter_packed())
+        self._slots = new_slots
+        self._table = bytearray(new_slots * self.width)
+        self._count = 0
+        for packed in old:
+            slot, _ = self._find(packed)
+            self._table[slot * self.width:(slot + 1) * self.width] = packed
+            self._count += 1
+
+    def _iter_packed(self):
+        width, table = self.width, self._table
+        for slot in range(self._slots):
+            current = bytes(table[slot * width:(slot + 1) * width])
+            if current != self._empty:
+                yield current
+
+    def __iter__(self):
+        """Llaves como str (ASCII), igual que los RFCs extraídos"""
+        return (packed.rstrip(b'\0').decode('ascii') for packed in self._iter_packed())
+
+    def __len__(self):
+        return self._count
+
+    def merge(self, other):
+        for key in other:
+            self.add(key)
+
+    @property
+    def memory_bytes(self):
+        return len(self._table)
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom: pertenencia aproximada (sin falsos negativos) en memoria fija.
+    Se dimensiona para `expected_items` con BLOOM_FALSE_POSITIVE, sin pasar de `max_bytes`,
+    y los bits se reservan con la primera llave: un filtro vacío viaja a los workers sin peso.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, expected_items=DEFAULT_EXPECTED_ITEMS):
+        expected_items = max(expected_items, 1)
+        optimal_bits = math.ceil(-expected_items * math.log(BLOOM_FALSE_POSITIVE) / math.log(2) ** 2)
+        self.num_bits = max(64, min(max_bytes * 8, optimal_bits)) // 8 * 8
+        # Número óptimo de funciones hash para la capacidad esperada
+        self.num_hashes = max(1, min(16, round(self.num_bits / expected_items * math.log(2))))
+        self._bits = None
+
+    def _positions(self, key):
+        if isinstance(key, int):
+            key = key.to_bytes(8, 'little', signed=True)
+        elif isinstance(key, str):
+            key = key.encode('utf-8')
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        """Agrega la llave; devuelve True si (probablemente) era nueva"""
+        if self._bits is None:
+            self._bits = bytearray(self.num_bits // 8)
+        new = False
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                new = True
+        return new
+
+    def __contains__(self, key):
+        if self._bits is None:
+            return False
+        return all(self._bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(key))
+
+    def merge(self, other):
+        if (other.num_bits, other.num_hashes) != (self.num_bits, self.num_hashes):
+            raise ValueError("Solo se pueden fusionar filtros de Bloom con la misma configuración")
+        if other._bits is None:
+            return
+        if self._bits is None:
+            self._bits = bytearray(other._bits)
+            return
+        # OR byte a byte sobre el mismo bytearray, sin enteros del tamaño del filtro
+        if np is not None:
+            target = np.frombuffer(self._bits, dtype=np.uint8)
+            np.bitwise_or(target, np.frombuffer(other._bits, dtype=np.uint8), out=target)
+            return
+        mine, theirs = memoryview(self._bits), memoryview(other._bits)
+        for start in range(0, len(mine), _MERGE_BLOCK):
+            end = min(start + _MERGE_BLOCK, len(mine))
+            merged = int.from_bytes(mine[start:end], 'little') | int.from_bytes(theirs[start:end], 'little')
+            mine[start:end] = merged.to_bytes(end - start, 'little')
+
+    def __getstate__(self):
+        # Entre procesos los bits van comprimidos: el filtro de un rango suele ser casi todo ceros
+        state = dict(self.__dict__)
+        if self._bits is not None:
+            state['_bits'] = zlib.compress(self._bits, 1)
+        return state
+
+    def __setstate__(self, state):
+        if state['_bits'] is not None:
+            state['_bits'] = bytearray(zlib.decompress(state['_bits']))
+        self.__dict__.update(state)
+
+    @property
+    def memory_bytes(self):
+        return 0 if self._bits is None else len(self._bits)
+
+
+class HyperLogLog:
+    """Estimador de cardinalidad HyperLogLog (error típico ~1.04 / sqrt(2^p))"""
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self._registers = bytearray(self.num_registers)
+
+    def add(self, key):
+        h = _hash_key(key)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & _MASK64
+        rank = (64 - self.precision + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def count(self):
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Corrección para cardinalidades pequeñas (conteo lineal)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        self._registers = bytearray(max(a, b) for a, b in zip(self._registers, other._registers))
+
+    @property
+    def memory_bytes(self):
+        return len(self._registers)
+
+
+class ApproximateDedupe:
+    """
+    Backend aproximado: Bloom para decidir si una llave es nueva y HyperLogLog
+    para la cardinalidad. Memoria fija sin importar el tamaño del respaldo;
+    no permite enumerar las llaves.
+    """
+
+    exact = False
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, expected_items=DEFAULT_EXPECTED_ITEMS, precision=14):
+        self.bloom = BloomFilter(max_bytes=max(8, max_bytes - (1 << precision)), expected_items=expected_items)
+        self.hll = HyperLogLog(precision=precision)
+
+    def add(self, key):
+        self.hll.add(key)
+        return self.bloom.add(key)
+
+    def __contains__(self, key):
+        return key in self.bloom
+
+    def __len__(self):
+        return self.hll.count()
+
+    def __iter__(self):
+        raise TypeError("El backend aproximado no permite enumerar llaves")
+
+    def merge(self, other):
+        self.bloom.merge(other.bloom)
+        self.hll.merge(other.hll)
+
+    @property
+    def memory_bytes(self):
+        return self.bloom.memory_bytes + self.hll.memory_bytes
+
+
+DEDUPE_BACKENDS = ('exact', 'approx')
+
+
+def make_deduper(backend='exact', key_type='int', max_mb=256, width=13, expected_items=DEFAULT_EXPECTED_ITEMS):
+    """
+    Crea el backend de deduplicación.
+    backend: 'exact' (enumerable) o 'approx' (Bloom + HyperLogLog).
+    key_type: 'int' (centavos) o 'key' (llaves cortas como RFCs).
+    Con 'approx' el presupuesto es un tope: el Bloom se dimensiona para `expected_items`.
+    """
+    max_bytes = int(max_mb * 1024 * 1024)
+    if backend == 'approx':
+        return ApproximateDedupe(max_bytes=max_bytes, expected_items=expected_items)
+    if backend != 'exact':
+        raise ValueError(f"Backend de dedupe desconocido: {backend}")
+    if key_type == 'int':
+        return ExactIntSet(max_bytes=max_bytes)
+    return ExactKeySet(width=width, max_bytes=max_bytes)
@@ -0,0 +1,142 @@
+import re
+
+# Codificaciones de texto en un respaldo de SQL Server: VARCHAR (un byte) y NVARCHAR (UTF-16LE)
+ASCII = 'ascii'
+UTF16LE = 'utf-16-le'
+ENCODINGS = (ASCII, UTF16LE)
+
+_GROUP_PREFIXES = (b'(?:', b'(?=', b'(?!', b'(?<=', b'(?<!')
+_ZERO_WIDTH = set(b'^$')
+_QUANTIFIERS = set(b'*+?')
+
+
+def _class_end(source, pos):
+    """Posición siguiente al `]` que cierra la clase que inicia en `pos`"""
+    i = pos + 1
+    if i < len(source) and source[i:i + 1] == b'^':
+        i += 1
+    if i < len(source) and source[i:i + 1] == b']':
+        i += 1
+    while i < len(source):
+        char = source[i:i + 1]
+        if char == b'\\':
+            i += 2
+            continue
+        if char == b']':
+            return i + 1
+        i += 1
+    raise ValueError(f"Clase sin cerrar en el patrón: {source!r}")
+
+
+def _escape_end(source, pos):
+    if source[pos + 1:pos + 2] == b'x':
+        return pos + 4
+    return pos + 2
+
+
+def _quantifier(source, pos):
+    """(fin, mínimo, máximo o None, sufijo lazy/posesivo) del cuantificador en `pos`, o None"""
+    char = source[pos:pos + 1]
+    if char == b'{':
+        end = source.index(b'}', pos) + 1
+        low, _, high = source[pos + 1:end - 1].partition(b',')
+        low = int(low or 0)
+        high = low if b',' not in source[pos:end] else (int(high) if high else None)
+    elif char in (b'*', b'+', b'?'):
+        end = pos + 1
+        low, high = {b'*': (0, None), b'+': (1, None), b'?': (0, 1)}[char]
+    else:
+        return None
+    suffix = source[end:end + 1] if source[end:end + 1] in (b'?', b'+') else b''
+    return end + len(suffix), low, high, suffix
+
+
+def _repeat(low, high):
+    if high is None:
+        return {0: b'*', 1: b'+'}.get(low) or b'{%d,}' % low
+    if low == high:
+        return b'' if low == 1 else b'{%d}' % low
+    return b'?' if (low, high) == (0, 1) else b'{%d,%d}' % (low, high)
+
+
+def widen(source):
+    """
+    Traduce el fuente de un regex de bytes a su equivalente UTF-16LE: cada átomo
+    (literal, clase o escape) pasa a ser `átomo\x00`, así cuantificadores, grupos
+    y lookarounds (con su numeración de grupos) siguen intactos. Un átomo repetido
+    se desenrolla una vez (`X{3,4}` -> `X(?:X){2,3}`) para que `re` conserve el salto
+    rápido por el primer carácter del patrón.
+    """
+    out = []
+    i = 0
+    while i < len(source):
+        char = source[i:i + 1]
+        if char == b'[':
+            end = _class_end(source, i)
+        elif char == b'\\':
+            end = _escape_end(source, i)
+            if source[i + 1:end] in (b'b', b'B', b'A', b'Z'):
+                out.append(source[i:end])
+                i = end
+                continue
+        elif char == b'(':
+            if source.startswith(b'(?P<', i):
+                prefix = source[i:source.index(b'>', i) + 1]
+            else:
+                prefix = next((p for p in _GROUP_PREFIXES if source.startswith(p, i)), None)
+            if prefix is None and source.startswith(b'(?', i):
+                raise ValueError(f"Grupo no soportado en modo UTF-16: {source[i:i + 8]!r}")
+            prefix = prefix or b'('
+            out.append(prefix)
+            i += len(prefix)
+            continue
+        elif char in (b')', b'|') or char[0] in _ZERO_WIDTH:
+            out.append(char)
+            i += 1
+            continue
+        elif char == b'{' or char[0] in _QUANTIFIERS:
+            # Cuantificador de un grupo: se copia tal cual
+            end = _quantifier(source, i)[0]
+            out.append(source[i:end])
+            i = end
+            continue
+        else:
+            end = i + 1
+        wide = source[i:end] + b'\\x00'
+        quantifier = _quantifier(source, end)
+        if quantifier is None:
+            out.append(wide)
+            i = end
+            continue
+        end, low, high, suffix = quantifier
+        if low >= 1:
+            out.append(wide)
+            low, high = low - 1, None if high is None else high - 1
+        if high != 0:
+            out.append(b'(?:' + wide + b')' + _repeat(low, high) + suffix)
+        i = end
+    return b''.join(out)
+
+
+def compile_dual(pattern, encodings=ENCODINGS):
+    """
+    [(regex, ancho)] precompilados: el patrón original para texto de un byte y su versión
+    UTF-16LE. Van por separado y no como una sola alternativa: así `re` conserva el salto
+    rápido por el primer carácter de cada rama (la alternativa escanea ~3 veces más lento).
+    """
+    unknown = set(encodings) - set(ENCODINGS)
+    if unknown or not encodings:
+        raise ValueError(f"Codificaciones no soportadas: {sorted(unknown) or encodings}")
+    branches = []
+    if ASCII in encodings:
+        branches.append((pattern, 1))
+    if UTF16LE in encodings:
+        branches.append((re.compile(widen(pattern.pattern), pattern.flags), 2))
+    return branches
+
+
+def narrow(value, width):
+    """Valor UTF-16LE normalizado a un byte por carácter (el patrón ya garantizó los bytes altos en cero)"""
+    if width == 2 and value is not None:
+        return bytes(value)[::2]
+    return value
@@ -1,8 +1,17 @@
 import os
 import json
-from google import generativeai as genai
+import asyncio
+import argparse
 from pathlib import Path
 
+from dedupe import make_deduper
+from efos_list import DEFAULT_INDEX, EFOSIndex
+from llm_client import (DEFAULT_CONCURRENCY, DEFAULT_LLM_CACHE, GeminiClient, LLMRunner, ResponseCache,
+                        estimate_tokens, token_batches)
+from result_store import iter_rows
+from scan_cache import DEFAULT_CACHE_PATH
+from scan_engine import RFCConsumer, run_plugins
+
 # Cargar variables de entorno desde .env.local
 env_path = Path('.') / '.env.local'
 if env_path.exists():
@@ -13,22 +22,79 @@ if env_path.exists():
                 key, value = line.split('=', 1)
                 os.environ[key] = value
 
+# Presupuesto de tokens por petición (RFCs + instrucciones)
+BATCH_TOKENS = 2000
+
+
+def _empty_analysis(total, error=None):
+    result = {
+        "total_rfcs_analyzed": total,
+        "risk_summary": {"low": 0, "medium": 0, "high": 0, "critical": 0},
+        "flagged_rfcs": [],
+        "general_observations": "Error en el análisis" if error else "",
+        "compliance_score": 0
+    }
+    if error:
+        result["error"] = error
+    return result
+
+
+def parse_json_response(response_text):
+    """JSON de la respuesta del modelo (sin los bloques de código markdown)"""
+    response_text = response_text.strip()
+    if response_text.startswith('```json'):
+        response_text = response_text[7:]
+    if response_text.startswith('```'):
+        response_text = response_text[3:]
+    if response_text.endswith('```'):
+        response_text = response_text[:-3]
+    result = json.loads(response_text.strip())
+    if not isinstance(result, dict):
+        raise ValueError(f"se esperaba un objeto JSON, llegó {type(result).__name__}")
+    return result
+
+
+def merge_batch_results(results):
+    """Une los análisis por lote en uno solo con la misma estructura"""
+    merged = _empty_analysis(0)
+    observations, errors, weighted_score = [], [], 0
+    for result in results:
+        total = result.get("total_rfcs_analyzed", 0) or 0
+        merged["total_rfcs_analyzed"] += total
+        for level, count in result.get("risk_summary", {}).items():
+            merged["risk_summary"][level] = merged["risk_summary"].get(level, 0) + (count or 0)
+        merged["flagged_rfcs"].extend(result.get("flagged_rfcs", []))
+        if result.get("general_observations"):
+            observations.append(result["general_observations"])
+        if "error" in result:
+            errors.append(result["error"])
+        else:
+            weighted_score += (result.get("compliance_score", 0) or 0) * total
+    analyzed = sum(r.get("total_rfcs_analyzed", 0) or 0 for r in results if "error" not in r)
+    merged["compliance_score"] = round(weighted_score / analyzed) if analyzed else 0
+    merged["general_observations"] = "\n".join(observations)
+    if errors:
+        merged["error"] = "; ".join(errors)
+    return merged
+
+
 class EFOSDetector:
     """
     Detector de EFOS/EDOS usando Gemini AI
-    Analiza RFCs contra el conocimiento del SAT
+    Analiza RFCs contra el conocimiento del SAT. Los RFCs se mandan en lotes por
+    presupuesto de tokens, en paralelo (asyncio) y con caché en disco de las respuestas;
+    `client` permite inyectar un cliente falso sin red.
     """
     
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
-        
-    def analyze_rfcs_batch(self, rfcs: list) -> dict:
-        """
-        Analiza un lote de RFCs para detectar posibles EFOS/EDOS
-        """
-        
-        prompt = f"""
+    def __init__(self, api_key: str = None, client=None, cache_path=DEFAULT_LLM_CACHE,
+                 concurrency=DEFAULT_CONCURRENCY, batch_tokens=BATCH_TOKENS):
+        self.client = client or GeminiClient(api_key)
+        self.cache = ResponseCache(cache_path) if cache_path else None
+        self.runner = LLMRunner(self.client, cache=self.cache, concurrency=concurrency)
+        self.batch_tokens = batch_tokens
+
+    def rfcs_prompt(self, rfcs: list) -> str:
+        return f"""
 Eres un experto auditor fiscal del SAT de México especializado en detectar EFOS (Empresas que Facturan Operaciones Simuladas) y EDOS (Empresas Dedicadas a Operaciones Simuladas).
 
 Analiza los siguientes {len(rfcs)} RFCs extraídos de un respaldo contable real de una empresa de transportes:
@@ -64,39 +130,33 @@ IMPORTANTE: Responde ÚNICAMENTE en formato JSON con esta estructura:
 }}
 """
 
-        try:
-            response = self.model.generate_content(prompt)
-            # Limpiar la respuesta para extraer solo el JSON
-            response_text = response.text.strip()
-            
-            # Remover markdown code blocks si existen
-            if response_text.startswith('```json'):
-                response_text = response_text[7:]
-            if response_text.startswith('```'):
-                response_text = response_text[3:]
-            if response_text.endswith('```'):
-                response_text = response_text[:-3]
-            
-            result = json.loads(response_text.strip())
-            return result
-            
-        except Exception as e:
-            print(f"❌ Error en análisis de IA: {e}")
-            return {
-                "error": str(e),
-                "total_rfcs_analyzed": len(rfcs),
-                "risk_summary": {"low": 0, "medium": 0, "high": 0, "critical": 0},
-                "flagged_rfcs": [],
-                "general_observations": "Error en el análisis",
-                "compliance_score": 0
-            }
-    
-    def generate_audit_report(self, company_data: dict, efos_analysis: dict) -> str:
+    async def analyze_rfcs(self, rfcs: list) -> dict:
         """
-        Genera un reporte de auditoría completo usando Gemini
+        Analiza miles de RFCs: lotes por presupuesto de tokens, peticiones concurrentes
+        y un resultado combinado con la estructura de un solo lote
         """
+        overhead = estimate_tokens(self.rfcs_prompt([]))
+        batches = list(token_batches(rfcs, self.batch_tokens, overhead))
+        # La caché solo guarda las respuestas que sí son JSON: una truncada se vuelve a pedir
+        responses = await self.runner.complete_many([self.rfcs_prompt(batch) for batch in batches],
+                                                    validate=parse_json_response)
+        results = []
+        for batch, response in zip(batches, responses):
+            if isinstance(response, Exception):
+                print(f"❌ Error en análisis de IA: {response}")
+                results.append(_empty_analysis(len(batch), str(response)))
+            else:
+                results.append(response)
+        return results[0] if len(results) == 1 else merge_batch_results(results)
         
-        prompt = f"""
+    def analyze_rfcs_batch(self, rfcs: list) -> dict:
+        """
+        Analiza un lote de RFCs para detectar posibles EFOS/EDOS
+        """
+        return asyncio.run(self.analyze_rfcs(rfcs))
+    
+    def audit_report_prompt(self, company_data: dict, efos_analysis: dict) -> str:
+        return f"""
 Genera un REPORTE DE AUDITORÍA FISCAL profesional para la empresa:
 
 DATOS DE LA EMPRESA:
@@ -119,12 +179,107 @@ GENERA un reporte ejecutivo que incluya:
 Formato: Markdown profesional, directo y accionable.
 """
 
+    async def generate_audit_report_async(self, company_data: dict, efos_analysis: dict) -> str:
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            return await self.runner.complete(self.audit_report_prompt(company_data, efos_analysis))
         except Exception as e:
             return f"Error generando reporte: {e}"
 
+    def generate_audit_report(self, company_data: dict, efos_analysis: dict) -> str:
+        """
+        Genera un reporte de auditoría completo usando Gemini
+        """
+        return asyncio.run(self.generate_audit_report_async(company_data, efos_analysis))
+
+
+class RFCCollector:
+    """Plugin del ScanEngine: todos los RFCs únicos del respaldo (no solo la muestra del resumen)"""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.rfcs = make_deduper('exact', 'key')
+
+    def consumers(self):
+        return [RFCConsumer(self._on_rfc, max_bytes=self.max_bytes)]
+
+    def _on_rfc(self, value, offset):
+        self.rfcs.add(value.decode('ascii', errors='ignore'))
+
+    def merge(self, other):
+        self.rfcs.merge(other.rfcs)
+
+
+def load_rfcs(company_data, bak=None, store=None, cache=None, report="data"):
+    """
+    Lista completa de RFCs a revisar: del respaldo (--bak) o de la tabla `rfcs` del almacén
+    de resultados (--store). El resumen JSON solo trae los primeros 50, así que sin una de
+    esas fuentes solo se usa si no viene truncado; si no, ValueError en vez de analizar la muestra.
+    """
+    if bak:
+        collector = RFCCollector()
+        run_plugins(bak, [collector], cache=cache)
+        return list(collector.rfcs)
+    expected = company_data['statistics']['total_rfcs']
+    if store:
+        if not os.path.exists(store):
+            raise ValueError(f"No se encontró el almacén de resultados {store}")
+        rfcs = [rfc for rfc, in iter_rows(store, report, "rfcs")]
+        if len(rfcs) < expected:
+            raise ValueError(f"El almacén {store} solo tiene {len(rfcs)} de {expected} RFCs del reporte "
+                             f"'{report}'; usa --bak para leerlos del respaldo")
+        return rfcs
+    rfcs = company_data['rfcs']
+    if len(rfcs) < expected:
+        raise ValueError(f"El resumen solo trae {len(rfcs)} de {expected} RFCs (muestra truncada); "
+                         f"usa --bak o --store para revisarlos todos")
+    return rfcs
+
+
+def blacklist_analysis(screening, total_rfcs):
+    """Resultado con el formato del análisis de IA a partir del cruce local contra el listado 69-B"""
+    flagged = [
+        {
+            "rfc": item["rfc"],
+            "risk_level": "CRITICAL" if item["status"] == "Definitivo" else "HIGH",
+            "reason": f"Aparece en el listado del SAT Art. 69-B como {item['status']}",
+            "recommendation": "Verificar la materialidad de las operaciones y no deducir sus comprobantes"
+        }
+        for item in screening["hits"]
+    ] + [
+        {
+            "rfc": item["rfc"],
+            "risk_level": "MEDIUM",
+            "reason": f"Aparece en el listado del SAT Art. 69-B como {item['status']}",
+            "recommendation": "Conservar la evidencia de que desvirtuó la presunción"
+        }
+        for item in screening["ambiguous"]
+    ]
+    critical = sum(1 for item in flagged if item["risk_level"] == "CRITICAL")
+    high = sum(1 for item in flagged if item["risk_level"] == "HIGH")
+    medium = len(flagged) - critical - high
+    return {
+        "total_rfcs_analyzed": total_rfcs,
+        "risk_summary": {"low": total_rfcs - len(flagged), "medium": medium, "high": high, "critical": critical},
+        "flagged_rfcs": flagged,
+        "general_observations": f"{len(screening['hits'])} RFCs en el listado 69-B (presuntos o definitivos) "
+                                f"y {len(screening['ambiguous'])} desvirtuados o con sentencia favorable, "
+                                f"de {total_rfcs} RFCs revisados localmente.",
+        "compliance_score": round(100 * (1 - len(screening["hits"]) / total_rfcs)) if total_rfcs else 100
+    }
+
+
+def merge_llm_analysis(local, llm):
+    """Agrega el criterio de la IA sobre los RFCs escalados, sin perder los hallazgos del listado"""
+    merged = dict(local)
+    known = {item["rfc"] for item in local["flagged_rfcs"]}
+    merged["flagged_rfcs"] = local["flagged_rfcs"] + [
+        item for item in llm.get("flagged_rfcs", []) if item.get("rfc") not in known
+    ]
+    merged["llm_observations"] = llm.get("general_observations")
+    if "error" in llm:
+        merged["llm_error"] = llm["error"]
+    return merged
+
 
 # Script de ejecución
 if __name__ == "__main__":
@@ -133,15 +288,28 @@ if __name__ == "__main__":
     print("=" * 70)
     print()
     
+    parser = argparse.ArgumentParser(description="Detección de EFOS/EDOS: listado 69-B local + IA para los casos escalados")
+    parser.add_argument("--data", default="data_elizondo_extracted.json", help="Resumen de extract_accounting_data.py")
+    parser.add_argument("--efos-index", default=DEFAULT_INDEX, help="Índice del listado 69-B (efos_list.py)")
+    parser.add_argument("--bak", default=None, help="Respaldo .bak para revisar todos sus RFCs (no solo la muestra)")
+    parser.add_argument("--store", default=None, help="Almacén results_<slug>.sqlite con la tabla completa de RFCs")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--llm-cache", default=DEFAULT_LLM_CACHE, help="Caché SQLite de respuestas del modelo")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Peticiones simultáneas al modelo")
+    parser.add_argument("--output", default="efos_analysis_elizondo.json", help="Archivo del análisis EFOS (JSON)")
+    parser.add_argument("--report", default="audit_report_elizondo.md", help="Reporte de auditoría (Markdown)")
+    args = parser.parse_args()
+
     # Cargar API Key
     api_key = os.getenv('GOOGLE_GENERATIVE_AI_API_KEY')
-    if not api_key:
+    use_index = os.path.exists(args.efos_index)
+    if not api_key and not use_index:
         print("❌ Error: No se encontró GOOGLE_GENERATIVE_AI_API_KEY")
         print("   Configúrala en tu archivo .env.local")
         exit(1)
     
     # Cargar datos extraídos
-    data_file = 'data_elizondo_extracted.json'
+    data_file = args.data
     if not os.path.exists(data_file):
         print(f"❌ Error: No se encontró {data_file}")
         print("   Ejecuta primero: python scripts/extract_accounting_data.py")
@@ -155,17 +323,35 @@ if __name__ == "__main__":
     print(f"🔍 RFCs a analizar: {company_data['statistics']['total_rfcs']}")
     print()
     
+    # Todos los RFCs (respaldo o almacén), nunca la muestra truncada del resumen
+    try:
+        all_rfcs = load_rfcs(company_data, bak=args.bak, store=args.store, cache=args.cache)
+    except ValueError as e:
+        print(f"❌ Error: {e}")
+        exit(1)
+
     # Inicializar detector
-    detector = EFOSDetector(api_key)
-    
-    # Analizar RFCs (primeros 50 para no saturar)
-    rfcs_to_analyze = company_data['rfcs'][:50]
-    
-    print("🤖 Analizando RFCs con Gemini AI...")
-    print("   (Esto puede tomar 10-20 segundos)")
-    print()
+    detector = EFOSDetector(api_key, cache_path=args.llm_cache, concurrency=args.concurrency) if api_key else None
     
-    efos_analysis = detector.analyze_rfcs_batch(rfcs_to_analyze)
+    if use_index:
+        # Todos los RFCs contra el listado 69-B local; solo los hits y casos dudosos van a la IA
+        index = EFOSIndex(args.efos_index)
+        screening = index.screen(all_rfcs)
+        print(f"📋 Listado 69-B ({len(index)} RFCs): {len(screening['hits'])} hits, "
+              f"{len(screening['ambiguous'])} dudosos, {screening['clean']} sin coincidencia")
+        efos_analysis = blacklist_analysis(screening, len(set(all_rfcs)))
+        escalated = [item["rfc"] for item in screening["hits"] + screening["ambiguous"]]
+        if escalated and detector:
+            print(f"🤖 Escalando {len(escalated)} RFCs a Gemini AI...")
+            efos_analysis = merge_llm_analysis(efos_analysis, detector.analyze_rfcs_batch(escalated))
+        print()
+    else:
+        # Analizar todos los RFCs (lotes por presupuesto de tokens, en paralelo y con caché)
+        print(f"🤖 Analizando {len(all_rfcs)} RFCs con Gemini AI...")
+        print(f"   (hasta {args.concurrency} peticiones simultáneas; respuestas en caché: {args.llm_cache})")
+        print()
+        
+        efos_analysis = detector.analyze_rfcs_batch(all_rfcs)
     
     # Mostrar resultados
     print("=" * 70)
@@ -197,7 +383,7 @@ if __name__ == "__main__":
     print()
     
     # Guardar análisis
-    output_file = 'efos_analysis_elizondo.json'
+    output_file = args.output
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(efos_analysis, f, indent=2, ensure_ascii=False)
     
@@ -205,15 +391,16 @@ if __name__ == "__main__":
     print()
     
     # Generar reporte completo
-    print("📝 Generando reporte de auditoría completo...")
-    report = detector.generate_audit_report(company_data, efos_analysis)
-    
-    report_file = 'audit_report_elizondo.md'
-    with open(report_file, 'w', encoding='utf-8') as f:
-        f.write(report)
-    
-    print(f"✅ Reporte guardado en: {report_file}")
-    print()
+    if detector:
+        print("📝 Generando reporte de auditoría completo...")
+        report = detector.generate_audit_report(company_data, efos_analysis)
+        
+        report_file = args.report
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write(report)
+        
+        print(f"✅ Reporte guardado en: {report_file}")
+        print()
     print("=" * 70)
     print("✨ ANÁLISIS COMPLETADO")
     print("=" * 70)
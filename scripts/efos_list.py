@@ -0,0 +1,157 @@
+import csv
+import io
+import struct
+import argparse
+from bisect import bisect_left
+from pathlib import Path
+
+DEFAULT_INDEX = "efos_69b.idx"
+
+MAGIC = b'EFOS69B2'
+RFC_WIDTH = 13
+# Un byte por carácter sin pérdida: la Ñ (y &) quedan distintas y el orden es el de los bytes
+RFC_ENCODING = 'latin-1'
+RECORD = RFC_WIDTH + 1  # RFC (relleno con espacios) + código de situación
+
+# Situación del contribuyente en el listado del Art. 69-B
+STATUS_CODES = {
+    'definitivo': b'D',
+    'presunto': b'P',
+    'desvirtuado': b'V',
+    'sentencia favorable': b'S',
+}
+STATUS_NAMES = {
+    b'D': 'Definitivo',
+    b'P': 'Presunto',
+    b'V': 'Desvirtuado',
+    b'S': 'Sentencia Favorable',
+    b'?': 'Desconocido',
+}
+# Definitivo/Presunto = hit; el resto aparece en el listado pero requiere criterio
+HIT_CODES = {b'D', b'P'}
+
+
+def _status_code(text):
+    text = (text or '').strip().lower()
+    for name, code in STATUS_CODES.items():
+        if text.startswith(name):
+            return code
+    return b'?'
+
+
+def rfc_key(rfc):
+    """Llave de ancho fijo de un RFC, la misma al compilar y al buscar"""
+    return rfc.strip().upper().encode(RFC_ENCODING, errors='replace').ljust(RFC_WIDTH)[:RFC_WIDTH]
+
+
+def read_sat_csv(csv_path):
+    """
+    Lee el CSV del SAT (Listado completo 69-B). El archivo trae renglones de
+    encabezado antes de la tabla y suele venir en latin-1; se ubican las columnas
+    'RFC' y 'Situación' por nombre. Genera (rfc, código de situación).
+    """
+    raw = Path(csv_path).read_bytes()
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = raw.decode('latin-1')
+
+    reader = csv.reader(io.StringIO(text))
+    rfc_col = status_col = None
+    for row in reader:
+        if rfc_col is None:
+            names = [cell.strip().lower() for cell in row]
+            if 'rfc' in names:
+                rfc_col = names.index('rfc')
+                status_col = next((i for i, name in enumerate(names) if name.startswith('situaci')), None)
+            continue
+        if len(row) <= rfc_col:
+            continue
+        rfc = row[rfc_col].strip().upper()
+        if 12 <= len(rfc) <= RFC_WIDTH:
+            status = row[status_col] if status_col is not None and status_col < len(row) else ''
+            yield rfc, _status_code(status)
+
+
+def build_index(csv_path, index_path=DEFAULT_INDEX):
+    """
+    Compila el CSV a un índice compacto: registros de ancho fijo ordenados por RFC
+    (14 bytes c/u). Si un RFC aparece varias veces gana la situación más grave.
+    """
+    severity = {b'D': 4, b'P': 3, b'S': 2, b'V': 1, b'?': 0}
+    entries = {}
+    for rfc, code in read_sat_csv(csv_path):
+        key = rfc_key(rfc)
+        if key not in entries or severity[code] > severity[entries[key]]:
+            entries[key] = code
+    with open(index_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(entries)))
+        # Ordenado por los bytes codificados: es el orden en que `status` hace la búsqueda binaria
+        for key in sorted(entries):
+            f.write(key + entries[key])
+    return len(entries)
+
+
+class _Keys:
+    """Vista de las llaves (RFC) del índice como secuencia, para usar `bisect` sin copiarlas"""
+
+    def __init__(self, data, count):
+        self.data = data
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = 8 + 4 + i * RECORD
+        return self.data[start:start + RFC_WIDTH]
+
+
+class EFOSIndex:
+    """Índice local del listado 69-B con búsqueda binaria por lotes"""
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        data = Path(index_path).read_bytes()
+        if data[:8] != MAGIC:
+            raise ValueError(f"{index_path} no es un índice EFOS 69-B vigente (recompílalo con efos_list.py)")
+        self.data = data
+        self.count = struct.unpack('<I', data[8:12])[0]
+        self._keys = _Keys(data, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def status(self, rfc):
+        """Situación en el listado (código de un byte) o None si no aparece"""
+        key = rfc_key(rfc)
+        i = bisect_left(self._keys, key)
+        if i < self.count and self._keys[i] == key:
+            start = 8 + 4 + i * RECORD + RFC_WIDTH
+            return self.data[start:start + 1]
+        return None
+
+    def screen(self, rfcs):
+        """
+        Revisa todos los RFCs de un respaldo. Devuelve {hits, ambiguous, clean}:
+        hits = Definitivo/Presunto; ambiguous = en el listado con otra situación.
+        """
+        hits, ambiguous, clean = [], [], 0
+        for rfc in sorted(set(rfcs)):
+            code = self.status(rfc)
+            if code is None:
+                clean += 1
+            elif code in HIT_CODES:
+                hits.append({"rfc": rfc, "status": STATUS_NAMES[code]})
+            else:
+                ambiguous.append({"rfc": rfc, "status": STATUS_NAMES[code]})
+        return {"hits": hits, "ambiguous": ambiguous, "clean": clean}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compila el listado del SAT Art. 69-B (CSV) a un índice local")
+    parser.add_argument("csv_path", help="Listado completo 69-B descargado del SAT (CSV)")
+    parser.add_argument("--output", default=DEFAULT_INDEX, help="Ruta del índice compacto")
+    args = parser.parse_args()
+
+    total = build_index(args.csv_path, args.output)
+    print(f"✅ Índice 69-B con {total} RFCs: {args.output} ({Path(args.output).stat().st_size / 1024:.0f} KB)")
@@ -1,127 +1,166 @@
-import re
 import json
+import argparse
 from datetime import datetime
 from pathlib import Path
 
+from dedupe import DEDUPE_BACKENDS, make_deduper
+from scan_engine import (
+    ScanEngine, RFCConsumer, AmountConsumer, DateConsumer, KeywordConsumer, parse_cents, run_plugins
+)
+from scan_cache import DEFAULT_CACHE_PATH
+from result_store import RowSpool, save_report as save_store_report
+from streaming_stats import RunningStats, Reservoir
+from typed_records import day_to_iso, parse_date
+
+# Nombres de tablas comunes de ASPEL COI
+TABLE_KEYWORDS = [
+    b'CPOLIZA', b'POLIZA', b'CUENTAS', b'AUXILIAR', 
+    b'CATALOGO', b'EMPRESA', b'PERIODO', b'BALANZA'
+]
+
 class AccountingDataExtractor:
-    def __init__(self, bak_file_path):
+    def __init__(self, bak_file_path, max_bytes=None, dedupe='exact', dedupe_mb=256):
         self.bak_file = bak_file_path
+        # None = archivo completo en modo streaming; un límite solo para pruebas rápidas
+        self.max_bytes = max_bytes
         self.data = {
-            'rfcs': set(),
+            # RFCs en slots de ancho fijo (exacto) o Bloom + HyperLogLog (aproximado)
+            'rfcs': make_deduper(dedupe, 'key', dedupe_mb),
             'amounts': [],
             'dates': [],
             'concepts': [],
             'metadata': {}
         }
+        # Memoria acotada: estadísticas en línea + muestra de 1000 montos
+        self.amount_stats = RunningStats()
+        self._amount_sample = Reservoir(1000)
+        # Todos los montos (offset, centavos) para el almacén de resultados, grabados por lotes a disco
+        self.amount_rows = RowSpool('amounts')
+        # Fechas normalizadas (días desde 1970) sin importar el formato en que aparecieron
+        self._dates_found = set()
+        self._tables_found = {}
     
+    def consumers(self):
+        """Consumidores para el ScanEngine (una sola lectura del respaldo)"""
+        return [
+            self._rfc_consumer(),
+            self._amount_consumer(),
+            self._date_consumer(),
+            self._table_consumer(),
+        ]
+
+    def merge(self, other):
+        """Fusiona el estado parcial de un worker (escaneo paralelo por rangos)"""
+        self.data['rfcs'].merge(other.data['rfcs'])
+        self.amount_stats.merge(other.amount_stats)
+        self._amount_sample.merge(other._amount_sample)
+        self.amount_rows.extend(other.amount_rows)
+        self._dates_found.update(other._dates_found)
+        for table, count in other._tables_found.items():
+            self._tables_found[table] = self._tables_found.get(table, 0) + count
+
+    def finish(self):
+        self.report_rfcs()
+        self.report_amounts()
+        self.report_dates()
+        self.report_tables()
+
+    def extract_all(self, workers=1, cache=None):
+        """Extrae RFCs, montos, fechas y tablas en una sola pasada"""
+        run_plugins(self.bak_file, [self], workers=workers, cache=cache)
+
+    def _scan(self, consumer):
+        engine = ScanEngine(self.bak_file)
+        engine.add_consumer(consumer)
+        engine.run()
+
+    def _rfc_consumer(self):
+        return RFCConsumer(self._on_rfc, max_bytes=self.max_bytes)
+
+    def _on_rfc(self, value, offset):
+        self.data['rfcs'].add(value.decode('ascii', errors='ignore'))
+
     def extract_rfcs(self):
         """Extrae todos los RFCs del archivo"""
-        rfc_pattern = re.compile(rb'[A-Z&]{3,4}[0-9]{2}(0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])[A-Z0-9]{3}')
-        
-        with open(self.bak_file, 'rb') as f:
-            chunk_size = 10 * 1024 * 1024
-            while True:
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                for match in rfc_pattern.finditer(data):
-                    self.data['rfcs'].add(match.group(0).decode('ascii', errors='ignore'))
-        
+        self._scan(self._rfc_consumer())
+        return self.report_rfcs()
+
+    def report_rfcs(self):
         print(f"✓ Extraídos {len(self.data['rfcs'])} RFCs únicos")
-        return list(self.data['rfcs'])
-    
+        return self._rfc_list()
+
+    def _rfc_list(self):
+        # El backend aproximado solo estima el total, no enumera RFCs
+        rfcs = self.data['rfcs']
+        return sorted(rfcs) if rfcs.exact else []
+
+    def _amount_consumer(self):
+        # Buscar patrones como: 1234.56, 12345.67, etc.
+        return AmountConsumer(self._on_amount, max_bytes=self.max_bytes)
+
+    def _on_amount(self, value, offset):
+        cents = parse_cents(value)
+        if 1 <= cents <= 9999999999:  # Filtrar montos razonables
+            amount = cents / 100
+            self.amount_stats.add(amount)
+            self._amount_sample.add(amount, offset)
+            self.amount_rows.add(offset, cents)
+
     def extract_amounts(self):
         """Extrae montos monetarios (formato decimal)"""
-        # Buscar patrones como: 1234.56, 12345.67, etc.
-        amount_pattern = re.compile(rb'(?<![0-9])[0-9]{1,10}\.[0-9]{2}(?![0-9])')
-        
-        amounts_found = []
-        with open(self.bak_file, 'rb') as f:
-            chunk_size = 5 * 1024 * 1024
-            chunk_count = 0
-            while chunk_count < 20:  # Limitar a primeros 100MB para velocidad
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                for match in amount_pattern.finditer(data):
-                    try:
-                        amount = float(match.group(0).decode('ascii'))
-                        if 0.01 <= amount <= 99999999.99:  # Filtrar montos razonables
-                            amounts_found.append(amount)
-                    except:
-                        pass
-                chunk_count += 1
-        
-        self.data['amounts'] = amounts_found[:1000]  # Guardar primeros 1000
-        print(f"✓ Extraídos {len(amounts_found)} montos (guardados primeros 1000)")
+        self._scan(self._amount_consumer())
+        return self.report_amounts()
+
+    def report_amounts(self):
+        stats = self.amount_stats
+        self.data['amounts'] = self._amount_sample.items  # Muestra aleatoria de 1000
+        print(f"✓ Extraídos {stats.count} montos (muestra de {len(self.data['amounts'])})")
         
-        if amounts_found:
-            print(f"  Monto promedio: ${sum(amounts_found)/len(amounts_found):,.2f}")
-            print(f"  Monto máximo: ${max(amounts_found):,.2f}")
-            print(f"  Monto mínimo: ${min(amounts_found):,.2f}")
+        if stats.count:
+            print(f"  Monto promedio: ${stats.mean:,.2f}")
+            print(f"  Monto máximo: ${stats.max:,.2f}")
+            print(f"  Monto mínimo: ${stats.min:,.2f}")
         
-        return amounts_found
-    
+        return self.data['amounts']
+
+    def _date_consumer(self):
+        # Formatos comunes en SQL Server (ISO, DD/MM/YYYY, YYYY/MM/DD, YYYYMMDD, MM/DD/YYYY)
+        return DateConsumer(self._on_date, max_bytes=self.max_bytes)
+
+    def _on_date(self, value, offset):
+        # Fechas inexistentes (ej. 31/02) se descartan al normalizar
+        parsed = parse_date(value)
+        if parsed is not None:
+            self._dates_found.add(parsed[0])
+
     def extract_dates(self):
         """Extrae fechas en múltiples formatos comunes en SQL Server"""
-        date_patterns = [
-            # YYYY-MM-DD (ISO format)
-            re.compile(rb'20[0-9]{2}-(0[1-9]|1[0-2])-(0[1-9]|[12][0-9]|3[01])'),
-            # DD/MM/YYYY
-            re.compile(rb'(0[1-9]|[12][0-9]|3[01])/(0[1-9]|1[0-2])/20[0-9]{2}'),
-            # YYYY/MM/DD
-            re.compile(rb'20[0-9]{2}/(0[1-9]|1[0-2])/(0[1-9]|[12][0-9]|3[01])'),
-            # YYYYMMDD (compact format)
-            re.compile(rb'20[0-9]{2}(0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])'),
-            # MM/DD/YYYY (American format)
-            re.compile(rb'(0[1-9]|1[0-2])/(0[1-9]|[12][0-9]|3[01])/20[0-9]{2}')
-        ]
-        
-        dates_found = []
-        with open(self.bak_file, 'rb') as f:
-            chunk_size = 10 * 1024 * 1024  # Increased chunk size
-            chunk_count = 0
-            while chunk_count < 20:  # More chunks to scan
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                for pattern in date_patterns:
-                    for match in pattern.finditer(data):
-                        date_str = match.group(0).decode('ascii', errors='ignore')
-                        # Filter out dates that are clearly invalid
-                        if '2024' in date_str or '2025' in date_str:
-                            dates_found.append(date_str)
-                chunk_count += 1
-        
-        unique_dates = list(set(dates_found))
+        self._scan(self._date_consumer())
+        return self.report_dates()
+
+    def report_dates(self):
+        unique_dates = [day_to_iso(days) for days in sorted(self._dates_found)]
         self.data['dates'] = unique_dates[:500]
         print(f"✓ Extraídas {len(unique_dates)} fechas únicas (guardadas primeras 500)")
         if unique_dates:
             print(f"  Ejemplo: {unique_dates[0]}")
-        return dates_found
-    
+        return unique_dates
+
+    def _table_consumer(self):
+        return KeywordConsumer(self._on_table, TABLE_KEYWORDS, max_bytes=self.max_bytes)
+
+    def _on_table(self, keyword, offset, context):
+        # El autómata reporta keywords traslapadas: CPOLIZA también cuenta como POLIZA
+        key = keyword.decode('ascii')
+        self._tables_found[key] = self._tables_found.get(key, 0) + 1
+
     def extract_table_names(self):
         """Busca nombres de tablas comunes de ASPEL COI"""
-        table_keywords = [
-            b'CPOLIZA', b'POLIZA', b'CUENTAS', b'AUXILIAR', 
-            b'CATALOGO', b'EMPRESA', b'PERIODO', b'BALANZA'
-        ]
-        
-        tables_found = {}
-        with open(self.bak_file, 'rb') as f:
-            chunk_size = 10 * 1024 * 1024
-            chunk_count = 0
-            while chunk_count < 5:
-                data = f.read(chunk_size)
-                if not data:
-                    break
-                for keyword in table_keywords:
-                    count = data.count(keyword)
-                    if count > 0:
-                        key = keyword.decode('ascii')
-                        tables_found[key] = tables_found.get(key, 0) + count
-                chunk_count += 1
-        
+        self._scan(self._table_consumer())
+        return self.report_tables()
+
+    def report_tables(self):
+        tables_found = self._tables_found
         print(f"✓ Tablas/Keywords encontrados:")
         for table, count in sorted(tables_found.items(), key=lambda x: x[1], reverse=True):
             print(f"  {table}: {count} ocurrencias")
@@ -138,13 +177,14 @@ class AccountingDataExtractor:
             },
             'statistics': {
                 'total_rfcs': len(self.data['rfcs']),
+                'total_amounts_found': self.amount_stats.count,
                 'total_amounts_sampled': len(self.data['amounts']),
                 'total_dates_found': len(self.data['dates']),
-                'avg_amount': sum(self.data['amounts']) / len(self.data['amounts']) if self.data['amounts'] else 0,
-                'max_amount': max(self.data['amounts']) if self.data['amounts'] else 0,
-                'min_amount': min(self.data['amounts']) if self.data['amounts'] else 0
+                'avg_amount': self.amount_stats.mean,
+                'max_amount': self.amount_stats.max or 0,
+                'min_amount': self.amount_stats.min or 0
             },
-            'rfcs': sorted(list(self.data['rfcs']))[:50],  # Primeros 50 RFCs
+            'rfcs': self._rfc_list()[:50],  # Primeros 50 RFCs
             'sample_amounts': self.data['amounts'][:100],  # Primeros 100 montos
             'sample_dates': self.data['dates'][:50]  # Primeras 50 fechas
         }
@@ -154,9 +194,30 @@ class AccountingDataExtractor:
     def save_to_json(self, output_file):
         """Guarda los datos extraídos en JSON"""
         with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False, default=str)
+            json.dump(dict(self.data, rfcs=self._rfc_list()), f, indent=2, ensure_ascii=False, default=str)
         print(f"✓ Datos guardados en: {output_file}")
 
+    def save_store(self, store_path, company_name, company_rfc, report="data"):
+        """Guarda el resumen y las tablas completas (RFCs, montos, fechas) en el almacén de resultados"""
+        summary = self.generate_summary(company_name, company_rfc)
+        for key in ('rfcs', 'sample_amounts', 'sample_dates'):
+            summary.pop(key)
+        summary['statistics']['total_dates_found'] = len(self._dates_found)
+        summary['tables'] = self._tables_found
+        # Con el dedupe aproximado la tabla `rfcs` queda vacía: el resumen lo dice explícitamente
+        summary['rfcs_enumerated'] = self.data['rfcs'].exact
+        if not summary['rfcs_enumerated']:
+            print("⚠️  Dedupe aproximado: el almacén solo guarda el total estimado de RFCs, no la lista "
+                  "(usa --dedupe exact para enumerarlos)")
+        counts = save_store_report(
+            store_path, report, summary,
+            rfcs=((rfc,) for rfc in self._rfc_list()),
+            amounts=self.amount_rows,
+            dates=((day_to_iso(days),) for days in sorted(self._dates_found)),
+        )
+        print(f"💾 Almacén de resultados: {store_path} ({counts['rfcs']} RFCs, {counts['amounts']} montos, "
+              f"{counts['dates']} fechas)")
+
 
 # Ejecutar extracción para Elizondo
 if __name__ == "__main__":
@@ -165,29 +226,28 @@ if __name__ == "__main__":
     print("=" * 60)
     print()
     
-    elizondo_path = r"C:\IA_nubes\auditorIA_1\ctTRANSPORTES_ELIZONDO_2024-20251024-1750\document_9aa3cd70-d41b-4905-8c9d-dc96db1a6e8a_content.bak"
+    parser = argparse.ArgumentParser(description="Extractor de datos contables de un respaldo .bak")
+    parser.add_argument("bak_path", nargs="?", default=r"C:\IA_nubes\auditorIA_1\ctTRANSPORTES_ELIZONDO_2024-20251024-1750\document_9aa3cd70-d41b-4905-8c9d-dc96db1a6e8a_content.bak")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para escaneo paralelo por rangos")
+    parser.add_argument("--max-mb", type=int, default=None, help="Limitar el escaneo a los primeros N MB (por defecto: completo)")
+    parser.add_argument("--dedupe", choices=DEDUPE_BACKENDS, default="exact", help="Deduplicación de RFCs: exacta o aproximada (Bloom + HyperLogLog)")
+    parser.add_argument("--dedupe-mb", type=int, default=256, help="Presupuesto de memoria para la deduplicación en MB")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true", help="Reescanear sin usar ni actualizar la caché")
+    parser.add_argument("--store", default=None, help="Almacén SQLite de resultados con el detalle completo (opcional)")
+    args = parser.parse_args()
+    elizondo_path = args.bak_path
     
     print(f"📂 Procesando: TRANSPORTES ELIZONDO JIMENEZ")
     print(f"📄 Archivo: {Path(elizondo_path).name}")
     print(f"💾 Tamaño: {Path(elizondo_path).stat().st_size / (1024*1024):.2f} MB")
     print()
     
-    extractor = AccountingDataExtractor(elizondo_path)
-    
-    print("🔍 Fase 1: Extrayendo RFCs...")
-    extractor.extract_rfcs()
-    print()
-    
-    print("🔍 Fase 2: Extrayendo montos...")
-    extractor.extract_amounts()
-    print()
-    
-    print("🔍 Fase 3: Extrayendo fechas...")
-    extractor.extract_dates()
-    print()
+    max_bytes = args.max_mb * 1024 * 1024 if args.max_mb else None
+    extractor = AccountingDataExtractor(elizondo_path, max_bytes=max_bytes, dedupe=args.dedupe, dedupe_mb=args.dedupe_mb)
     
-    print("🔍 Fase 4: Buscando tablas contables...")
-    extractor.extract_table_names()
+    print("🔍 Extrayendo RFCs, montos, fechas y tablas contables (una sola pasada)...")
+    extractor.extract_all(workers=args.workers, cache=None if args.no_cache else args.cache)
     print()
     
     # Generar resumen
@@ -200,6 +260,8 @@ if __name__ == "__main__":
     output_path = "data_elizondo_extracted.json"
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(summary, f, indent=2, ensure_ascii=False)
+    if args.store:
+        extractor.save_store(args.store, "TRANSPORTES ELIZONDO JIMENEZ", "TEJ2304191I0")
     
     print("=" * 60)
     print(f"✅ EXTRACCIÓN COMPLETADA")
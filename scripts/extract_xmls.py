@@ -1,30 +1,90 @@
 import os
-import xml.etree.ElementTree as ET
+import re
+import time
 import json
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
+from xml.sax.saxutils import unescape
 
-def parse_cfdi(xml_path):
-    """Extrae datos clave de un CFDI real."""
+# lxml es más rápido si está instalado; ElementTree (stdlib) como respaldo
+try:
+    from lxml import etree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Elementos que necesitamos; al verlos todos se deja de leer el XML (los Conceptos pueden ser miles)
+WANTED_TAGS = {'Comprobante', 'Emisor', 'Receptor', 'TimbreFiscalDigital'}
+FIELDS = ["uuid", "rfc_emisor", "nombre_emisor", "rfc_receptor", "total", "subtotal", "tipo", "fecha", "moneda"]
+BATCH_SIZE = 256
+STATS_EVERY = 5  # Segundos entre reportes de avance
+# El TimbreFiscalDigital va en el Complemento, después de los Conceptos: se busca en la cola del archivo
+TAIL_BYTES = 16 * 1024
+TIMBRE_TAG = re.compile(rb'<(?:[\w.-]+:)?TimbreFiscalDigital\b([^>]*)>')
+ATTRIBUTE = re.compile(rb'([\w.:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+def _local_name(tag):
+    # Independiente del namespace: sirve para CFDI 3.3 y 4.0
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+def _tail_timbre(f):
+    """Atributos del TimbreFiscalDigital si está en los últimos TAIL_BYTES del archivo, o None"""
+    f.seek(0, os.SEEK_END)
+    f.seek(max(0, f.tell() - TAIL_BYTES))
+    tags = TIMBRE_TAG.findall(f.read())
+    if not tags:
+        return None
+    return {name.decode('utf-8', errors='replace'): unescape((double or single).decode('utf-8', errors='replace'))
+            for name, double, single in ATTRIBUTE.findall(tags[-1])}
+
+def read_cfdi(xml_path):
+    """
+    Extrae datos clave de un CFDI real: devuelve (datos, None) o (None, motivo del descarte).
+    El timbre se toma de la cola del archivo y el iterparse se detiene tras Emisor y Receptor,
+    sin recorrer los Conceptos; si el timbre no está en la cola se sigue parseando y cada
+    elemento se limpia al cerrarse para que la memoria no crezca con los Conceptos.
+    """
+    found = {}
+    try:
+        with open(xml_path, 'rb') as f:
+            timbre = _tail_timbre(f)
+            if timbre is not None:
+                found['TimbreFiscalDigital'] = timbre
+            f.seek(0)
+            stack = []
+            for event, elem in ET.iterparse(f, events=('start', 'end')):
+                if event == 'end':
+                    stack.pop()
+                    elem.clear()
+                    # Los hermanos anteriores ya cerraron: el padre no necesita conservarlos
+                    if stack:
+                        del stack[-1][:]
+                    continue
+                name = _local_name(elem.tag)
+                if name in WANTED_TAGS and name not in found:
+                    found[name] = dict(elem.attrib)
+                    if len(found) == len(WANTED_TAGS):
+                        break
+                stack.append(elem)
+    except ET.ParseError:
+        return None, 'xml_mal_formado'
+    except OSError:
+        return None, 'error_lectura'
+
+    root = found.get('Comprobante')
+    if root is None:
+        return None, 'sin_comprobante'
+    emisor = found.get('Emisor')
+    receptor = found.get('Receptor')
+    tfd = found.get('TimbreFiscalDigital')
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        
-        # Namespaces comunes de CFDI
-        ns = {
-            'cfdi': 'http://www.sat.gob.mx/cfd/4',
-            'tfd': 'http://www.sat.gob.mx/TimbreFiscalDigital'
-        }
-        
-        # Intentar con CFDI 3.3 si falla el 4.0
-        if '4' not in root.tag:
-            ns['cfdi'] = 'http://www.sat.gob.mx/cfd/3'
-
-        # Datos base
-        emisor = root.find('cfdi:Emisor', ns)
-        receptor = root.find('cfdi:Receptor', ns)
-        complemento = root.find('cfdi:Complemento', ns)
-        tfd = complemento.find('tfd:TimbreFiscalDigital', ns) if complemento is not None else None
-        
         data = {
             "uuid": tfd.get('UUID') if tfd is not None else "N/A",
             "rfc_emisor": emisor.get('Rfc') if emisor is not None else "N/A",
@@ -36,34 +96,173 @@ def parse_cfdi(xml_path):
             "fecha": root.get('Fecha'),
             "moneda": root.get('Moneda')
         }
-        return data
-    except Exception as e:
-        return None
+    except ValueError:
+        return None, 'importe_invalido'
+    return data, None
+
+def parse_cfdi(xml_path):
+    """Datos clave de un CFDI, o None si se descarta (el motivo lo da read_cfdi)"""
+    return read_cfdi(xml_path)[0]
+
+def iter_xml_files(base_path):
+    """Recorre el árbol (estructura A-Z) entregando rutas de XML sin acumularlas en memoria"""
+    stack = [base_path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith('.xml'):
+                    yield entry.path
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def parse_batch(paths):
+    """Tarea de worker: parsea un lote de XMLs; devuelve (CFDIs válidos, número de archivos, motivos de descarte)"""
+    rows, discarded = [], Counter()
+    for data, reason in map(read_cfdi, paths):
+        if data:
+            rows.append(data)
+        else:
+            discarded[reason] += 1
+    return rows, len(paths), discarded
+
+
+class JsonLinesWriter:
+    """Un CFDI por línea; cada lote se escribe en cuanto llega"""
+
+    def __init__(self, path):
+        self.f = open(path, 'w', encoding='utf-8')
+
+    def write_batch(self, rows):
+        self.f.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.f.close()
+
+
+class JsonArrayWriter(JsonLinesWriter):
+    """Arreglo JSON escrito de forma incremental (formato de data_elizondo_real.json)"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.f.write("[")
+        self.first = True
+
+    def write_batch(self, rows):
+        for row in rows:
+            self.f.write(("\n    " if self.first else ",\n    ") + json.dumps(row, ensure_ascii=False))
+            self.first = False
+
+    def close(self):
+        self.f.write("\n]" if not self.first else "]")
+        self.f.close()
+
+
+class ParquetWriter:
+    """Lotes columnares (requiere pyarrow)"""
+
+    SCHEMA_TYPES = {"total": "float64", "subtotal": "float64"}
+
+    def __init__(self, path):
+        if pa is None:
+            raise RuntimeError("La salida .parquet requiere pyarrow (pip install pyarrow)")
+        self.schema = pa.schema([(name, self.SCHEMA_TYPES.get(name, "string")) for name in FIELDS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write_batch(self, rows):
+        if rows:
+            columns = {name: [row.get(name) for row in rows] for name in FIELDS}
+            self.writer.write_table(pa.Table.from_pydict(columns, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(output_path):
+    """Elige el formato por extensión: .jsonl, .json o .parquet"""
+    suffix = Path(output_path).suffix.lower()
+    if suffix == '.parquet':
+        return ParquetWriter(output_path)
+    if suffix == '.json':
+        return JsonArrayWriter(output_path)
+    return JsonLinesWriter(output_path)
+
+def scan_directory(base_path, output_path, workers=None, batch_size=BATCH_SIZE, stats=None):
+    """
+    Ingiere todos los CFDIs del árbol en un pool de procesos y escribe los resultados
+    por lotes conforme terminan, con estadísticas de avance periódicas.
+    Devuelve el número de CFDIs escritos; `stats` (dict) recibe archivos, escritos y descartes por motivo.
+    """
+    workers = workers or os.cpu_count() or 1
+    print(f"Escaneando directorio: {base_path} ({workers} procesos, parser {ET.__name__})")
+    writer = open_writer(output_path)
+    start = last_report = time.time()
+    stats = {} if stats is None else stats
+    stats.update(files=0, written=0, discarded=Counter())
+
+    def collect(future):
+        rows, count, discarded = future.result()
+        writer.write_batch(rows)
+        stats['files'] += count
+        stats['written'] += len(rows)
+        stats['discarded'].update(discarded)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            batches = batched(iter_xml_files(base_path), batch_size)
+            for batch in batches:
+                pending.add(executor.submit(parse_batch, batch))
+                # Cola acotada: el recorrido del árbol no se adelanta demasiado al parseo
+                if len(pending) < workers * 4:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+                if time.time() - last_report >= STATS_EVERY:
+                    last_report = time.time()
+                    _report(stats, start)
+            for future in pending:
+                collect(future)
+    finally:
+        writer.close()
+    _report(stats, start)
+    return stats['written']
+
+def _report(stats, start):
+    elapsed = max(time.time() - start, 1e-6)
+    files, written = stats['files'], stats['written']
+    reasons = ", ".join(f"{reason}: {count}" for reason, count in stats['discarded'].most_common())
+    print(f"  ... {files} XML leídos | {written} CFDIs válidos | {files - written} descartados"
+          f"{f' ({reasons})' if reasons else ''} | {files / elapsed:,.0f} archivos/s")
+
+if __name__ == "__main__":
+    # Rutas de tus respaldos reales
+    elizondo_path = r"C:\IA_nubes\auditorIA_1\ctTRANSPORTES_ELIZONDO_2024-20251024-1750\other_9aa3cd70-d41b-4905-8c9d-dc96db1a6e8a"
+    majoba_path = r"C:\IA_nubes\auditorIA_1\ctTransportes_Majoba_SA_De_CV-20251027-1050\other_584def9a-95e2-4822-83db-889de0d559d0"
+
+    parser = argparse.ArgumentParser(description="Extracción de CFDIs (XML) de un respaldo")
+    parser.add_argument("base_path", nargs="?", default=elizondo_path)
+    parser.add_argument("--output", default="data_elizondo_real.jsonl", help="Salida: .jsonl, .json o .parquet")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos de parseo (por defecto: CPUs)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="XMLs por tarea de worker")
+    args = parser.parse_args()
+
+    # Ejecutar escaneo rápido para Elizondo
+    print("--- INICIANDO EXTRACCIÓN REAL (ELIZONDO) ---")
+    total = scan_directory(args.base_path, args.output, workers=args.workers, batch_size=args.batch_size)
 
-def scan_directory(base_path):
-    results = []
-    print(f"Escaneando directorio: {base_path}")
-    # Buscar XMLs en la estructura A-Z
-    for root, dirs, files in os.walk(base_path):
-        for file in files:
-            if file.lower().endswith('.xml'):
-                full_path = os.path.join(root, file)
-                print(f"Procesando: {file}")
-                cfdi_data = parse_cfdi(full_path)
-                if cfdi_data:
-                    results.append(cfdi_data)
-    return results
-
-# Rutas de tus respaldos reales
-elizondo_path = r"C:\IA_nubes\auditorIA_1\ctTRANSPORTES_ELIZONDO_2024-20251024-1750\other_9aa3cd70-d41b-4905-8c9d-dc96db1a6e8a"
-majoba_path = r"C:\IA_nubes\auditorIA_1\ctTransportes_Majoba_SA_De_CV-20251027-1050\other_584def9a-95e2-4822-83db-889de0d559d0"
-
-# Ejecutar escaneo rápido para Elizondo
-print("--- INICIANDO EXTRACCIÓN REAL (ELIZONDO) ---")
-data_elizondo = scan_directory(elizondo_path)
-
-# Guardar en JSON para que la app lo consuma localmente antes de subir a Firebase
-with open('data_elizondo_real.json', 'w', encoding='utf-8') as f:
-    json.dump(data_elizondo, f, indent=4, ensure_ascii=False)
-
-print(f"Success! Se extrajeron {len(data_elizondo)} CFDIs reales de Elizondo.")
+    print(f"Success! Se extrajeron {total} CFDIs reales en {args.output}.")
@@ -0,0 +1,108 @@
+import argparse
+import json
+from pathlib import Path
+
+from chunk_reader import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP
+from dedupe import DEDUPE_BACKENDS
+from scan_cache import DEFAULT_CACHE_PATH
+from scan_engine import run_plugins
+from extract_accounting_data import AccountingDataExtractor
+from anomaly_hunter import AnomalyHunter
+from payroll_hunter import PayrollHunter
+from period_cubes import PeriodCubes
+from result_store import STORE_FILE
+
+# Reportes de un escaneo completo (mismos nombres que consume el dashboard)
+REPORT_FILES = {
+    "data": "data_{slug}_extracted.json",
+    "anomalies": "anomaly_report_{slug}.json",
+    "payroll": "payroll_report_{slug}.json",
+    "periods": "period_cubes_{slug}.json",
+    # Resumen + detalle completo (RFCs, montos, fechas, evidencias) con lectura paginada
+    "store": STORE_FILE,
+}
+
+
+def full_scan(bak_path, company_name, company_rfc, slug, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP,
+              use_mmap=False, workers=1, max_bytes=None, dedupe='exact', dedupe_mb=768, cache=None, output_dir='.'):
+    """
+    Ejecuta extractor, anomalías, nómina y cubos mensuales con una sola lectura del respaldo.
+    Con `cache` un respaldo ya escaneado se reproduce desde la caché de matches.
+    Los reportes se escriben en `output_dir` con el sufijo `slug`; devuelve sus rutas.
+    """
+    # El presupuesto de dedupe se reparte entre los tres analizadores
+    budget = dedupe_mb / 3
+    extractor = AccountingDataExtractor(bak_path, max_bytes=max_bytes, dedupe=dedupe, dedupe_mb=budget)
+    anomalies = AnomalyHunter(bak_path, max_bytes=max_bytes, dedupe=dedupe, dedupe_mb=budget)
+    payroll = PayrollHunter(bak_path, max_bytes=max_bytes, dedupe=dedupe, dedupe_mb=budget)
+    periods = PeriodCubes(bak_path, max_bytes=max_bytes)
+
+    run_plugins(bak_path, [extractor, anomalies, payroll, periods], chunk_size=chunk_size, overlap=overlap,
+                use_mmap=use_mmap, workers=workers, cache=cache)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = {name: str(output_dir / template.format(slug=slug)) for name, template in REPORT_FILES.items()}
+
+    summary = extractor.generate_summary(company_name, company_rfc)
+    with open(outputs["data"], 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    anomalies.analyze_benford()
+    anomalies.analyze_round_numbers()
+    anomalies.hunt_suspicious_concepts()
+    anomalies.save_report(outputs["anomalies"])
+
+    payroll.save_report(outputs["payroll"])
+
+    extractor.save_store(outputs["store"], company_name, company_rfc)
+    anomalies.save_store(outputs["store"])
+    payroll.save_store(outputs["store"])
+
+    # Métricas por mes y cuenta precalculadas: el dashboard consulta un periodo sin reescanear
+    periods.save(outputs["periods"])
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Escaneo único de un respaldo .bak para todos los analizadores")
+    parser.add_argument("bak_path")
+    parser.add_argument("--company", required=True, help="Nombre de la empresa")
+    parser.add_argument("--rfc", required=True, help="RFC de la empresa")
+    parser.add_argument("--slug", required=True, help="Sufijo de los reportes (ej. elizondo, majoba)")
+    parser.add_argument("--chunk-mb", type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024),
+                        help="Tamaño de bloque de lectura en MB")
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP,
+                        help="Bytes de traslape entre bloques")
+    parser.add_argument("--mmap", action="store_true",
+                        help="Escanear el respaldo mapeado en memoria (sin copias por bloque)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para escaneo paralelo por rangos de bytes")
+    parser.add_argument("--max-mb", type=int, default=None,
+                        help="Limitar el escaneo a los primeros N MB (por defecto: archivo completo)")
+    parser.add_argument("--dedupe", choices=DEDUPE_BACKENDS, default="exact",
+                        help="Deduplicación de montos y RFCs: exacta o aproximada (Bloom + HyperLogLog)")
+    parser.add_argument("--dedupe-mb", type=int, default=768,
+                        help="Presupuesto total de memoria para la deduplicación en MB")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Reescanear sin usar ni actualizar la caché")
+    parser.add_argument("--output-dir", default=".",
+                        help="Carpeta de los reportes (por defecto: directorio actual)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🚀 ESCANEO ÚNICO DE RESPALDO - AUDITOR-IA")
+    print("=" * 60)
+    print(f"📄 Archivo: {Path(args.bak_path).name}")
+    print(f"💾 Tamaño: {Path(args.bak_path).stat().st_size / (1024*1024):.2f} MB")
+    print()
+
+    full_scan(args.bak_path, args.company, args.rfc, args.slug,
+              chunk_size=args.chunk_mb * 1024 * 1024, overlap=args.overlap,
+              use_mmap=args.mmap, workers=args.workers,
+              max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None,
+              dedupe=args.dedupe, dedupe_mb=args.dedupe_mb,
+              cache=None if args.no_cache else args.cache, output_dir=args.output_dir)
+    print("\n✅ Análisis finalizado.")
@@ -0,0 +1,235 @@
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from scan_cache import fingerprint
+
+LEDGER_DB = "ingest_ledger.sqlite"
+HASH_READ_SIZE = 8 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    fingerprint TEXT PRIMARY KEY,
+    bak_path TEXT NOT NULL,
+    size INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    content_hash TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    fingerprint TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    duration REAL,
+    outputs TEXT,
+    error TEXT,
+    PRIMARY KEY (fingerprint, stage)
+);
+-- Archivos ya vistos por ruta, tamaño y mtime: un evento repetido sobre un respaldo
+-- auditado se descarta sin volver a leerlo
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+"""
+
+
+def content_fingerprint(file_path):
+    """Huella por contenido (sin ruta ni mtime): una copia subida dos veces es el mismo trabajo"""
+    return fingerprint(file_path, blocks=64, include_mtime=False)
+
+
+def content_hash(file_path):
+    """
+    Hash de todo el contenido: la huella solo muestrea bloques, así que un respaldo nuevo
+    del mismo tamaño puede coincidir con uno ya auditado. Solo se calcula cuando la huella
+    coincide pero el mtime no (lee el respaldo completo).
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(HASH_READ_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestLedger:
+    """
+    Bitácora transaccional (SQLite/WAL) de los respaldos procesados por el vigilante.
+    Cada trabajo se identifica por la huella del contenido y guarda estado, duración
+    y archivos generados por etapa; tras una caída solo se repiten las etapas sin terminar.
+    """
+
+    def __init__(self, db_path=LEDGER_DB):
+        self.db_path = str(db_path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        # Bitácoras creadas antes de guardar el hash completo
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "content_hash" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN content_hash TEXT")
+
+    def _execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def register(self, fp, bak_path):
+        """
+        Registra un trabajo y lo reclama para este worker (en una transacción).
+        Devuelve el estado previo: 'done' o 'running' significan que no hay que procesarlo.
+        """
+        now = datetime.now().isoformat()
+        bak_path = Path(bak_path).resolve()
+        size = bak_path.stat().st_size
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT status FROM jobs WHERE fingerprint = ?", (fp,)).fetchone()
+                if row is None:
+                    self.conn.execute(
+                        "INSERT INTO jobs (fingerprint, bak_path, size, status, created_at, updated_at) "
+                        "VALUES (?, ?, ?, 'running', ?, ?)", (fp, str(bak_path), size, now, now))
+                    status = 'pending'
+                else:
+                    status = row[0]
+                    if status not in ('done', 'running'):
+                        self.conn.execute("UPDATE jobs SET bak_path = ?, status = 'running', updated_at = ? "
+                                          "WHERE fingerprint = ?", (str(bak_path), now, fp))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return status
+
+    def is_done(self, bak_path):
+        """True si esta ruta, con el mismo tamaño y mtime, ya pertenece a un trabajo terminado"""
+        bak_path = Path(bak_path).resolve()
+        try:
+            stat = bak_path.stat()
+        except OSError:
+            return False
+        return bool(self._execute(
+            "SELECT 1 FROM files f JOIN jobs j USING (fingerprint) "
+            "WHERE f.path = ? AND f.size = ? AND f.mtime_ns = ? AND j.status = 'done'",
+            (str(bak_path), stat.st_size, stat.st_mtime_ns)))
+
+    def remember(self, fp, bak_path):
+        """Asocia la ruta (con su tamaño y mtime actuales) al trabajo `fp`"""
+        bak_path = Path(bak_path).resolve()
+        stat = bak_path.stat()
+        self._execute(
+            "INSERT INTO files (path, size, mtime_ns, fingerprint) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "fingerprint = excluded.fingerprint", (str(bak_path), stat.st_size, stat.st_mtime_ns, fp))
+
+    def trusted_copy(self, fp, bak_path):
+        """
+        True si un archivo ya registrado del trabajo `fp` tiene el mismo tamaño y mtime que
+        `bak_path`: huella muestreada + tamaño + mtime bastan para no releer el respaldo
+        """
+        stat = Path(bak_path).stat()
+        return bool(self._execute("SELECT 1 FROM files WHERE fingerprint = ? AND size = ? AND mtime_ns = ?",
+                                  (fp, stat.st_size, stat.st_mtime_ns)))
+
+    def stored_hash(self, fp):
+        """Hash completo guardado del trabajo (None si nunca hizo falta calcularlo)"""
+        rows = self._execute("SELECT content_hash FROM jobs WHERE fingerprint = ?", (fp,))
+        return rows[0][0] if rows else None
+
+    def reference_hash(self, fp):
+        """
+        Hash completo del contenido auditado con huella `fp`: el guardado o, si no se había
+        calculado, el de un archivo registrado del trabajo que siga sin cambios (se guarda).
+        None si ya no queda ninguno con qué comparar.
+        """
+        stored = self.stored_hash(fp)
+        if stored:
+            return stored
+        for path, size, mtime_ns in self._execute("SELECT path, size, mtime_ns FROM files WHERE fingerprint = ?",
+                                                  (fp,)):
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                continue
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                digest = content_hash(path)
+                self._execute("UPDATE jobs SET content_hash = ? WHERE fingerprint = ?", (digest, fp))
+                return digest
+        return None
+
+    def reopen(self, fp, bak_path):
+        """
+        Reclama de nuevo un trabajo 'done' cuya huella coincide pero con contenido distinto:
+        sus etapas se borran para que todo se repita. False si otro worker ya lo reclamó.
+        """
+        now = datetime.now().isoformat()
+        bak_path = Path(bak_path).resolve()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                claimed = self.conn.execute(
+                    "UPDATE jobs SET bak_path = ?, size = ?, status = 'running', content_hash = NULL, updated_at = ? "
+                    "WHERE fingerprint = ? AND status = 'done'",
+                    (str(bak_path), bak_path.stat().st_size, now, fp)).rowcount
+                if claimed:
+                    # Los archivos registrados eran del contenido anterior
+                    self.conn.execute("DELETE FROM stages WHERE fingerprint = ?", (fp,))
+                    self.conn.execute("DELETE FROM files WHERE fingerprint = ?", (fp,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return bool(claimed)
+
+    def completed_stages(self, fp):
+        return {row[0] for row in self._execute(
+            "SELECT stage FROM stages WHERE fingerprint = ? AND status = 'done'", (fp,))}
+
+    def start_stage(self, fp, stage):
+        now = datetime.now().isoformat()
+        self._execute(
+            "INSERT INTO stages (fingerprint, stage, status, started_at) VALUES (?, ?, 'running', ?) "
+            "ON CONFLICT (fingerprint, stage) DO UPDATE SET status = 'running', started_at = excluded.started_at, "
+            "finished_at = NULL, duration = NULL, outputs = NULL, error = NULL", (fp, stage, now))
+        return time.time()
+
+    def finish_stage(self, fp, stage, started, outputs=None, error=None):
+        now = datetime.now().isoformat()
+        self._execute(
+            "UPDATE stages SET status = ?, finished_at = ?, duration = ?, outputs = ?, error = ? "
+            "WHERE fingerprint = ? AND stage = ?",
+            ('failed' if error else 'done', now, round(time.time() - started, 3),
+             json.dumps(outputs or [], ensure_ascii=False), error, fp, stage))
+        if error:
+            self._execute("UPDATE jobs SET status = 'failed', updated_at = ? WHERE fingerprint = ?", (now, fp))
+
+    def fail_job(self, fp):
+        """Marca el trabajo como fallido (se reclama de nuevo con el siguiente evento o al reiniciar)"""
+        self._execute("UPDATE jobs SET status = 'failed', updated_at = ? WHERE fingerprint = ?",
+                      (datetime.now().isoformat(), fp))
+
+    def finish_job(self, fp, digest=None):
+        self._execute("UPDATE jobs SET status = 'done', content_hash = ?, updated_at = ? WHERE fingerprint = ?",
+                      (digest, datetime.now().isoformat(), fp))
+
+    def recover(self):
+        """Al arrancar: las etapas 'running' quedaron a medias por una caída; se marcan para repetirse"""
+        self._execute("UPDATE stages SET status = 'interrupted' WHERE status = 'running'")
+        self._execute("UPDATE jobs SET status = 'interrupted' WHERE status = 'running'")
+        return [Path(row[0]) for row in self._execute("SELECT bak_path FROM jobs WHERE status != 'done'")]
+
+    def close(self):
+        self.conn.close()
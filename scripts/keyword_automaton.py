@@ -0,0 +1,81 @@
+import re
+
+_TERMINAL = None
+
+
+class KeywordAutomaton:
+    """
+    Autómata multi-keyword (trie tipo Aho-Corasick) sobre bytes.
+    El trie se compila a un regex con lookahead, así el motor `re` (en C) recorre
+    el buffer una sola vez y marca cada posición donde inicia alguna keyword;
+    solo en esas posiciones se camina el trie para reportar todas las keywords,
+    incluidas las que se traslapan (ej. POLIZA dentro de CPOLIZA).
+    """
+
+    def __init__(self, keywords, ignore_case=True):
+        self.ignore_case = ignore_case
+        self.keywords = sorted({self._normalize(kw) for kw in keywords if kw})
+        self.max_len = max((len(kw) for kw in self.keywords), default=0)
+        self.trie = {}
+        for kw in self.keywords:
+            node = self.trie
+            for byte in kw:
+                node = node.setdefault(byte, {})
+            node[_TERMINAL] = kw
+        flags = re.IGNORECASE if ignore_case else 0
+        if self.keywords:
+            self.pattern = re.compile(b'(?=' + self._trie_regex(self.trie) + b')', flags)
+        else:
+            self.pattern = re.compile(b'(?!)')  # Nunca coincide
+
+    def _normalize(self, keyword):
+        if isinstance(keyword, str):
+            keyword = keyword.encode('ascii')
+        return keyword.lower() if self.ignore_case else keyword
+
+    def _trie_regex(self, node):
+        branches = [re.escape(bytes([byte])) + self._trie_regex(child)
+                    for byte, child in sorted((k, v) for k, v in node.items() if k is not _TERMINAL)]
+        if not branches:
+            return b''
+        body = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+        if _TERMINAL in node:
+            # Esta keyword termina aquí pero otras continúan: el resto es opcional
+            return b'(?:' + body + b')?'
+        return body
+
+    def keywords_at(self, data, pos, end=None, width=1):
+        """
+        Todas las keywords que inician en `pos` (data puede ser bytes o memoryview).
+        `width=2`: texto UTF-16LE; solo cuentan los caracteres con byte alto en cero.
+        """
+        stop = pos + self.max_len * width if end is None else min(pos + self.max_len * width, end)
+        segment = bytes(data[pos:stop])
+        if width == 2:
+            high = segment[1::2]
+            segment = segment[0::2][:len(high) - len(high.lstrip(b'\x00'))]
+        if self.ignore_case:
+            segment = segment.lower()
+        node = self.trie
+        for byte in segment:
+            node = node.get(byte)
+            if node is None:
+                return
+            if _TERMINAL in node:
+                yield node[_TERMINAL]
+
+    def iter_hits(self, data, begin=0, end=None):
+        """Genera (posición, keyword) para cada ocurrencia en data[begin:end], en una sola pasada"""
+        end = len(data) if end is None else end
+        for match in self.pattern.finditer(data, begin, end):
+            pos = match.start()
+            for keyword in self.keywords_at(data, pos, end):
+                yield pos, keyword
+
+    def find_all(self, data, context=(20, 40)):
+        """Devuelve [(posición, keyword, contexto)] con una ventana de contexto por hit"""
+        before, after = context
+        return [
+            (pos, keyword, bytes(data[max(0, pos - before):pos + after]))
+            for pos, keyword in self.iter_hits(data)
+        ]
@@ -0,0 +1,214 @@
+import json
+import random
+import asyncio
+import sqlite3
+import hashlib
+from datetime import datetime
+
+DEFAULT_LLM_CACHE = "llm_cache.sqlite"
+DEFAULT_MODEL = "gemini-pro"
+DEFAULT_CONCURRENCY = 4
+MAX_RETRIES = 5
+BASE_DELAY = 1.0  # Segundos; se duplica en cada reintento (con jitter)
+CHARS_PER_TOKEN = 4  # Estimación conservadora para español/JSON
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    created_at TEXT
+);
+"""
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def token_batches(items, max_tokens, overhead_tokens=0):
+    """
+    Parte `items` en lotes cuyo JSON (más el texto fijo del prompt) quepa en `max_tokens`.
+    Un elemento que por sí solo excede el presupuesto va en un lote propio.
+    """
+    batch, used = [], overhead_tokens
+    for item in items:
+        cost = estimate_tokens(json.dumps(item, ensure_ascii=False)) + 1
+        if batch and used + cost > max_tokens:
+            yield batch
+            batch, used = [], overhead_tokens
+        batch.append(item)
+        used += cost
+    if batch:
+        yield batch
+
+
+# Errores pasajeros de red o del servicio (nombres de google.api_core, sin importarlo)
+TRANSIENT_ERRORS = ('ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError', 'BadGateway',
+                    'GatewayTimeout', 'Aborted', 'Unavailable')
+TRANSIENT_STATUS = ('500', '502', '503', '504')
+
+
+class InvalidResponse(ValueError):
+    """Respuesta del modelo que no pasa la validación: no se guarda en la caché"""
+
+
+def is_rate_limit(error):
+    """429 / ResourceExhausted de la API (sin depender de las clases de google.api_core)"""
+    name = type(error).__name__
+    return name in ('ResourceExhausted', 'TooManyRequests') or '429' in str(error) or 'quota' in str(error).lower()
+
+
+def is_transient(error):
+    """Caída de conexión, timeout o 5xx del servicio: vale la pena reintentar"""
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    text = str(error)
+    return type(error).__name__ in TRANSIENT_ERRORS or any(f"{status} " in f"{text} " for status in TRANSIENT_STATUS)
+
+
+def is_retryable(error):
+    # Credenciales, prompts inválidos o errores de programación fallan igual en cada intento
+    return is_rate_limit(error) or is_transient(error)
+
+
+class GeminiClient:
+    """Cliente asíncrono de Gemini; google.generativeai se importa solo al usarlo"""
+
+    def __init__(self, api_key, model_name=DEFAULT_MODEL):
+        from google import generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt):
+        if hasattr(self.model, 'generate_content_async'):
+            response = await self.model.generate_content_async(prompt)
+        else:
+            response = await asyncio.to_thread(self.model.generate_content, prompt)
+        return response.text
+
+
+class FakeClient:
+    """
+    Cliente sin red para pruebas: `responder(prompt)` devuelve el texto de la respuesta
+    (o lanza una excepción para simular errores / límites de cuota).
+    """
+
+    def __init__(self, responder, model_name="fake", delay=0.0):
+        self.responder = responder
+        self.model_name = model_name
+        self.delay = delay
+        self.calls = 0
+
+    async def generate(self, prompt):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.responder(prompt)
+
+
+class ResponseCache:
+    """Respuestas del modelo en SQLite, por hash de (modelo, prompt): repetir una corrida no llama a la API"""
+
+    def __init__(self, db_path=DEFAULT_LLM_CACHE):
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    @staticmethod
+    def key(model_name, prompt):
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, model_name, response):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                              (key, model_name, response, datetime.now().isoformat()))
+
+    def close(self):
+        self.conn.close()
+
+
+class LLMRunner:
+    """
+    Capa asíncrona sobre un cliente (Gemini o FakeClient): caché en disco, concurrencia
+    acotada con un semáforo y reintentos con backoff exponencial ante límites de cuota y
+    errores pasajeros. Solo se guardan en la caché las respuestas que pasan `validate`.
+    """
+
+    def __init__(self, client, cache=None, concurrency=DEFAULT_CONCURRENCY, max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY):
+        self.client = client
+        self.cache = cache
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.stats = {'calls': 0, 'cached': 0, 'retries': 0, 'invalid': 0}
+
+    @staticmethod
+    def _check(text, validate):
+        """Valor validado de una respuesta; InvalidResponse si está vacía o `validate` la rechaza"""
+        if not text or not text.strip():
+            raise InvalidResponse("respuesta vacía")
+        if validate is None:
+            return text
+        try:
+            return validate(text)
+        except Exception as e:
+            raise InvalidResponse(f"respuesta inválida: {e}") from e
+
+    async def complete(self, prompt, semaphore=None, validate=None):
+        """
+        Respuesta para `prompt` (desde la caché si ya se pidió antes). Con `validate(texto)`
+        devuelve su resultado; si la rechaza (ej. JSON truncado) lanza InvalidResponse y la
+        respuesta no se guarda, así la siguiente corrida la vuelve a pedir.
+        """
+        model_name = getattr(self.client, 'model_name', '')
+        key = ResponseCache.key(model_name, prompt)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                try:
+                    value = self._check(cached, validate)
+                    self.stats['cached'] += 1
+                    return value
+                except InvalidResponse:
+                    # Entrada inválida de una versión anterior: se vuelve a pedir
+                    pass
+
+        semaphore = semaphore or asyncio.Semaphore(self.concurrency)
+        attempt = 0
+        while True:
+            async with semaphore:
+                try:
+                    self.stats['calls'] += 1
+                    text = await self.client.generate(prompt)
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    error = e
+            # La espera ocurre fuera del semáforo: no bloquea a las demás peticiones
+            attempt += 1
+            self.stats['retries'] += 1
+            delay = self.base_delay * (2 ** (attempt - 1)) * (2 if is_rate_limit(error) else 1)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+        try:
+            value = self._check(text, validate)
+        except InvalidResponse:
+            self.stats['invalid'] += 1
+            raise
+        if self.cache is not None:
+            self.cache.put(key, model_name, text)
+        return value
+
+    async def complete_many(self, prompts, validate=None):
+        """Respuestas en el mismo orden que `prompts`; un error queda como la excepción en su posición"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self.complete(prompt, semaphore, validate) for prompt in prompts),
+                                    return_exceptions=True)
@@ -0,0 +1,367 @@
+import json
+import struct
+import argparse
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Páginas de datos de SQL Server dentro del respaldo (Microsoft Tape Format).
+# No se recorren los encabezados de stream MTF hasta el stream de datos de SQL: sus IDs y
+# rellenos no están documentados para SQL Server y no hay respaldos reales con qué validarlos.
+# En su lugar se usa una heurística: el contenedor alinea los bloques a 512 bytes y las páginas
+# de 8 KB van una tras otra dentro de los streams, así que se validan encabezados de página en
+# posiciones múltiplo de 512 y, encontrada una página, se salta de 8 KB en 8 KB. Los descriptores
+# MTF solo se usan para reconocer el contenedor.
+PAGE_SIZE = 8192
+PAGE_HEADER_SIZE = 96
+MTF_ALIGN = 512
+RESYNC_MIN = 16 * 1024
+RESYNC_MAX = 1024 * 1024
+
+PAGE_TYPES = {1: 'data', 2: 'index', 3: 'text_mix', 4: 'text_tree', 7: 'sort', 8: 'gam', 9: 'sgam',
+              10: 'iam', 11: 'pfs', 13: 'boot', 15: 'file_header', 16: 'diff_map', 17: 'ml_map'}
+DATA_PAGE = 1
+
+# Descriptores MTF (DBLK) que pueden aparecer en un .bak
+MTF_BLOCKS = {b'TAPE', b'SSET', b'VOLB', b'DIRB', b'FILE', b'CFIL', b'ESPB', b'ESET', b'EOTM', b'SFMB'}
+
+# Tablas base del catálogo (ID de objeto = m_objId de sus páginas)
+SYSROWSETS = 5
+SYSALLOCUNITS = 7
+SYSSCHOBJS = 34
+SYSCOLPARS = 41
+CATALOG_OBJECTS = {SYSROWSETS, SYSALLOCUNITS, SYSSCHOBJS, SYSCOLPARS}
+
+# Tablas contables de ASPEL COI (llevan sufijo de ejercicio/empresa, ej. POLIZAS24, AUXILIAR01)
+COI_TABLE_PREFIXES = ('POLIZA', 'AUXILIAR', 'CUENTA', 'CATALOGO', 'SALDO', 'BALANZA')
+
+PageHeader = namedtuple('PageHeader', ['offset', 'type', 'level', 'index_id', 'obj_id', 'slot_count',
+                                       'free_data', 'page_id', 'file_id'])
+# Registro FixedVar: parte fija, número de columnas, bitmap de nulos y columnas variables (bytes o None si es LOB)
+Record = namedtuple('Record', ['fixed', 'column_count', 'null_bitmap', 'variable'])
+Column = namedtuple('Column', ['colid', 'name', 'xtype', 'length', 'prec', 'scale'])
+
+# Tipos de SQL Server (xtype) de longitud variable
+VARIABLE_TYPES = {34, 35, 99, 165, 167, 231, 241}
+BIT_TYPE = 104
+
+
+def parse_header(data, pos, offset):
+    """Encabezado de página en data[pos:pos+96] si es válido, o None"""
+    if data[pos] != 1 or data[pos + 1] not in PAGE_TYPES:
+        return None
+    (page_type, level, index_id, slot_count, obj_id, free_count, free_data,
+     page_id, file_id) = struct.unpack_from('<xBxBxxH14xH i HH IH', data, pos)
+    if not 1 <= file_id <= 32767 or slot_count * 2 > PAGE_SIZE - PAGE_HEADER_SIZE:
+        return None
+    if not PAGE_HEADER_SIZE <= free_data <= PAGE_SIZE or free_count > PAGE_SIZE - PAGE_HEADER_SIZE:
+        return None
+    return PageHeader(offset, page_type, level, index_id, obj_id, slot_count, free_data, page_id, file_id)
+
+
+def allocation_unit(header):
+    """ID de la unidad de asignación a la que pertenece la página"""
+    return (header.index_id << 48) | ((header.obj_id & 0xFFFFFFFF) << 16)
+
+
+def mtf_descriptors(file_path, limit=64 * 1024 * 1024):
+    """
+    Descriptores MTF (tipo, offset) en los primeros `limit` bytes: solo identifica el contenedor,
+    las páginas las localiza PageReader por sus encabezados
+    """
+    found = []
+    with open(file_path, 'rb') as f:
+        data = f.read(limit)
+    for pos in range(0, len(data) - 4, MTF_ALIGN):
+        block = data[pos:pos + 4]
+        if block in MTF_BLOCKS:
+            found.append((block.decode('ascii'), pos))
+    return found
+
+
+class PageReader:
+    """
+    Recorre las páginas de 8 KB del respaldo leyendo solo sus encabezados (96 bytes):
+    mientras las páginas son consecutivas se salta de página en página, y al perder
+    la alineación (encabezados MTF, log, relleno) se resincroniza por bloques crecientes
+    (16 KB hasta 1 MB): los huecos cortos entre streams cuestan poco y los largos pocas lecturas.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.bytes_read = 0
+
+    def iter_headers(self, start=0, end=None):
+        with open(self.file_path, 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell() if end is None else min(end, f.tell())
+            pos = start - start % MTF_ALIGN
+            while pos + PAGE_SIZE <= size:
+                f.seek(pos)
+                head = f.read(PAGE_HEADER_SIZE)
+                self.bytes_read += len(head)
+                header = parse_header(head, 0, pos) if len(head) == PAGE_HEADER_SIZE else None
+                if header is not None:
+                    yield header
+                    pos += PAGE_SIZE
+                    continue
+                pos = yield from self._resync(f, pos, size)
+
+    def _resync(self, f, pos, size):
+        """Busca el siguiente encabezado válido; devuelve la posición posterior a la página encontrada"""
+        block_size = RESYNC_MIN
+        while pos + PAGE_SIZE <= size:
+            f.seek(pos)
+            block = f.read(block_size + PAGE_HEADER_SIZE)
+            self.bytes_read += len(block)
+            for rel in range(0, min(block_size, len(block) - PAGE_HEADER_SIZE + 1), MTF_ALIGN):
+                if pos + rel + PAGE_SIZE > size:
+                    return size
+                header = parse_header(block, rel, pos + rel)
+                if header is not None:
+                    yield header
+                    return pos + rel + PAGE_SIZE
+            pos += block_size
+            block_size = min(block_size * 2, RESYNC_MAX)
+        return size
+
+    def read_page(self, f, offset):
+        f.seek(offset)
+        page = f.read(PAGE_SIZE)
+        self.bytes_read += len(page)
+        return page
+
+
+def iter_records(page, slot_count):
+    """Registros de datos de una página (arreglo de slots al final de la página)"""
+    for slot in range(slot_count):
+        (offset,) = struct.unpack_from('<H', page, PAGE_SIZE - 2 * (slot + 1))
+        if not PAGE_HEADER_SIZE <= offset < PAGE_SIZE - 4:
+            continue
+        record = parse_record(page, offset)
+        if record is not None:
+            yield record
+
+
+def parse_record(page, offset):
+    """Decodifica un registro FixedVar primario; None si es fantasma, reenviado o está dañado"""
+    status = page[offset]
+    if (status >> 1) & 7 != 0:
+        return None
+    try:
+        (fixed_end,) = struct.unpack_from('<H', page, offset + 2)
+        if fixed_end < 4 or offset + fixed_end + 2 > PAGE_SIZE:
+            return None
+        fixed = page[offset + 4:offset + fixed_end]
+        (column_count,) = struct.unpack_from('<H', page, offset + fixed_end)
+        pos = offset + fixed_end + 2
+        null_bitmap = b''
+        if status & 0x10:
+            size = (column_count + 7) // 8
+            null_bitmap = page[pos:pos + size]
+            pos += size
+        variable = []
+        if status & 0x20:
+            (var_count,) = struct.unpack_from('<H', page, pos)
+            ends = struct.unpack_from(f'<{var_count}H', page, pos + 2)
+            start = pos + 2 + 2 * var_count - offset
+            for end in ends:
+                complex_column, end = end & 0x8000, end & 0x7FFF
+                if end < start or offset + end > PAGE_SIZE:
+                    return None
+                # Columnas complejas: apuntadores a LOB / row-overflow fuera del registro
+                variable.append(None if complex_column else page[offset + start:offset + end])
+                start = end
+    except struct.error:
+        return None
+    return Record(fixed, column_count, null_bitmap, variable)
+
+
+def _is_null(record, index):
+    bitmap = record.null_bitmap
+    return index // 8 < len(bitmap) and bitmap[index // 8] >> (index % 8) & 1
+
+
+def decode_value(raw, column):
+    """Valor Python de una columna según su tipo de SQL Server"""
+    xtype = column.xtype
+    if xtype in (48, 52, 56, 127):
+        return int.from_bytes(raw, 'little', signed=xtype != 48)
+    if xtype in (60, 122):
+        return int.from_bytes(raw, 'little', signed=True) / 10000
+    if xtype in (106, 108):
+        value = int.from_bytes(raw[1:], 'little') / 10 ** column.scale
+        return value if raw[:1] == b'\x01' else -value
+    if xtype == 62:
+        return struct.unpack('<d', raw)[0]
+    if xtype == 59:
+        return struct.unpack('<f', raw)[0]
+    if xtype == 61:
+        ticks, days = struct.unpack('<Ii', raw)
+        return (datetime(1900, 1, 1) + timedelta(days=days, milliseconds=round(ticks * 10 / 3))).isoformat()
+    if xtype == 58:
+        minutes, days = struct.unpack('<HH', raw)
+        return (datetime(1900, 1, 1) + timedelta(days=days, minutes=minutes)).isoformat()
+    if xtype == 40:
+        return (date(1, 1, 1) + timedelta(days=int.from_bytes(raw, 'little'))).isoformat()
+    if xtype in (231, 239, 99):
+        return raw.decode('utf-16-le', errors='replace').rstrip()
+    if xtype in (167, 175, 35):
+        return raw.decode('latin-1').rstrip()
+    return raw.hex()
+
+
+def decode_row(record, columns):
+    """
+    Columnas de un registro según el esquema de syscolpars: las de longitud fija van en
+    orden de colid en la parte fija (los bit se empaquetan de 8 en 8) y las variables en
+    el arreglo de columnas variables.
+    """
+    row = {}
+    fixed_pos = var_index = bit_index = 0
+    bit_byte = None
+    for index, column in enumerate(columns):
+        null = _is_null(record, index)
+        if column.xtype in VARIABLE_TYPES:
+            raw = record.variable[var_index] if var_index < len(record.variable) else None
+            var_index += 1
+            row[column.name] = None if null or raw is None else decode_value(raw, column)
+        elif column.xtype == BIT_TYPE:
+            if bit_index % 8 == 0:
+                bit_byte, fixed_pos = fixed_pos, fixed_pos + 1
+            value = record.fixed[bit_byte] >> (bit_index % 8) & 1 if bit_byte < len(record.fixed) else None
+            bit_index += 1
+            row[column.name] = None if null or value is None else bool(value)
+        else:
+            raw = record.fixed[fixed_pos:fixed_pos + column.length]
+            fixed_pos += column.length
+            row[column.name] = None if null or len(raw) < column.length else decode_value(raw, column)
+    return row
+
+
+class Catalog:
+    """Catálogo mínimo reconstruido de las tablas base: unidad de asignación -> tabla y columnas"""
+
+    def __init__(self):
+        self.rowset_owner = {}     # auid -> rowsetid
+        self.rowset_object = {}    # rowsetid -> id de objeto
+        self.objects = {}          # id de objeto -> (nombre, tipo)
+        self.columns = {}          # id de objeto -> [Column]
+
+    def add_page(self, obj_id, page, header):
+        for record in iter_records(page, header.slot_count):
+            fixed = record.fixed
+            try:
+                if obj_id == SYSALLOCUNITS:
+                    auid, _, ownerid = struct.unpack_from('<qBq', fixed)
+                    self.rowset_owner[auid] = ownerid
+                elif obj_id == SYSROWSETS:
+                    rowsetid, _, idmajor = struct.unpack_from('<qBi', fixed)
+                    self.rowset_object[rowsetid] = idmajor
+                elif obj_id == SYSSCHOBJS and record.variable and record.variable[0]:
+                    object_id = struct.unpack_from('<i', fixed)[0]
+                    obj_type = fixed[13:15].decode('ascii', errors='replace').strip()
+                    self.objects[object_id] = (record.variable[0].decode('utf-16-le', errors='replace'), obj_type)
+                elif obj_id == SYSCOLPARS and record.variable and record.variable[0]:
+                    object_id, number, colid, xtype, _, length, prec, scale = struct.unpack_from('<ihiBihBB', fixed)
+                    if number == 0:
+                        name = record.variable[0].decode('utf-16-le', errors='replace')
+                        self.columns.setdefault(object_id, []).append(Column(colid, name, xtype, length, prec, scale))
+            except struct.error:
+                continue
+
+    def table_for(self, auid):
+        """(id de objeto, nombre) de la tabla dueña de la unidad de asignación, o None"""
+        object_id = self.rowset_object.get(self.rowset_owner.get(auid))
+        if object_id is None or object_id not in self.objects:
+            return None
+        return object_id, self.objects[object_id][0]
+
+    def schema(self, object_id):
+        return sorted(self.columns.get(object_id, []))
+
+
+def is_coi_table(name, prefixes=COI_TABLE_PREFIXES):
+    return name.upper().startswith(prefixes)
+
+
+class BakPageIndex:
+    """
+    Mapa de páginas del respaldo: un primer recorrido lee solo encabezados, decodifica las
+    tablas base del catálogo y agrupa las páginas de datos por unidad de asignación; después
+    solo se leen completas las páginas de las tablas pedidas.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.reader = PageReader(file_path)
+        self.catalog = Catalog()
+        self.pages_by_unit = {}
+        self.page_count = 0
+        self._build()
+
+    def _build(self):
+        catalog_pages = []
+        for header in self.reader.iter_headers():
+            self.page_count += 1
+            if header.type != DATA_PAGE or header.level != 0:
+                continue
+            if header.obj_id in CATALOG_OBJECTS and header.index_id in (0, 1):
+                catalog_pages.append(header)
+            else:
+                self.pages_by_unit.setdefault(allocation_unit(header), []).append(header)
+        with open(self.file_path, 'rb') as f:
+            for header in catalog_pages:
+                self.catalog.add_page(header.obj_id, self.reader.read_page(f, header.offset), header)
+
+    def tables(self):
+        """{nombre: (id de objeto, páginas de datos)} de las tablas con páginas en el respaldo"""
+        found = {}
+        for auid, headers in self.pages_by_unit.items():
+            table = self.catalog.table_for(auid)
+            if table is not None:
+                object_id, name = table
+                found.setdefault(name, [object_id, 0])[1] += len(headers)
+        return {name: tuple(value) for name, value in found.items()}
+
+    def iter_rows(self, table_names):
+        """Genera (tabla, offset de página, fila decodificada) de las tablas pedidas"""
+        wanted = {}
+        for auid, headers in self.pages_by_unit.items():
+            table = self.catalog.table_for(auid)
+            if table is not None and table[1] in table_names:
+                wanted.setdefault(table, []).extend(headers)
+        with open(self.file_path, 'rb') as f:
+            for (object_id, name), headers in wanted.items():
+                columns = self.catalog.schema(object_id)
+                for header in sorted(headers, key=lambda h: h.offset):
+                    page = self.reader.read_page(f, header.offset)
+                    for record in iter_records(page, header.slot_count):
+                        yield name, header.offset, decode_row(record, columns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lectura por páginas (8 KB) de las tablas de ASPEL COI en un respaldo .bak")
+    parser.add_argument("bak_path")
+    parser.add_argument("--tables", nargs="*", default=None, help="Tablas a decodificar (por defecto: pólizas, auxiliares y catálogo)")
+    parser.add_argument("--output", default="coi_rows.jsonl", help="Filas decodificadas en JSON Lines")
+    args = parser.parse_args()
+
+    size = Path(args.bak_path).stat().st_size
+    blocks = mtf_descriptors(args.bak_path)
+    print(f"📦 Contenedor: {'MTF (' + ', '.join(sorted({b for b, _ in blocks})) + ')' if blocks else 'sin descriptores MTF'}")
+    index = BakPageIndex(args.bak_path)
+    tables = index.tables()
+    print(f"📄 {index.page_count} páginas de 8 KB | {len(tables)} tablas con datos en el catálogo")
+    selected = set(args.tables) if args.tables else {name for name in tables if is_coi_table(name)}
+    for name in sorted(selected):
+        if name in tables:
+            print(f"  {name}: {tables[name][1]} páginas")
+
+    rows = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for table, offset, row in index.iter_rows(selected):
+            f.write(json.dumps({"table": table, "page_offset": offset, "row": row}, ensure_ascii=False) + "\n")
+            rows += 1
+    print(f"✅ {rows} filas decodificadas en: {args.output}")
+    print(f"   Bytes leídos: {index.reader.bytes_read / (1024 * 1024):.1f} MB de {size / (1024 * 1024):.1f} MB")
@@ -0,0 +1,391 @@
+import os
+import zlib
+import struct
+import argparse
+from array import array
+from pathlib import Path
+
+from anomaly_hunter import SUSPICIOUS_KEYWORDS
+from extract_accounting_data import TABLE_KEYWORDS
+from chunk_reader import DualScanner
+from dual_encoding import narrow
+from keyword_automaton import KeywordAutomaton
+from mssql_pages import MTF_ALIGN, PAGE_HEADER_SIZE, parse_header
+from payroll_hunter import RISK_KEYWORDS, VALID_KEYWORDS
+from rfc_validator import RFCFilter
+from scan_cache import fingerprint
+from scan_engine import AMOUNT_PATTERN, RFC_PATTERN, parse_cents, run_plugins
+
+BLOCK_SIZE = 8192
+BLOOM_BYTES = 64  # 512 bits por bloque
+BLOOM_HASHES = 4
+# Con más de la mitad de los bits en 1 el Bloom ya da >6% de falsos positivos (0.5^4):
+# en bloques tan densos se descarta y el bloque es candidato para cualquier token de su tipo
+BLOOM_MAX_FILL = BLOOM_BYTES * 8 // 2
+# v2: tokens de texto UTF-16LE (NVARCHAR) además de los de un byte
+# v3: bloques de borde entre rangos combinados (no sobrescritos) y Blooms saturados marcados
+MAGIC = b'BAKPIDX3'
+SIDECAR_SUFFIX = '.pidx'
+# Bytes extra al releer un bloque: un token se asigna al bloque donde inicia
+READ_TAIL = 64
+
+# Banderas por bloque
+HAS_PAGE = 0x01
+HAS_RFC = 0x02
+HAS_AMOUNT = 0x04
+HAS_PAYROLL = 0x08
+HAS_RISK = 0x10
+HAS_ACCOUNTING = 0x20
+BLOOM_FULL = 0x40
+FLAG_NAMES = {'page': HAS_PAGE, 'rfc': HAS_RFC, 'amount': HAS_AMOUNT, 'payroll': HAS_PAYROLL,
+              'risk': HAS_RISK, 'accounting': HAS_ACCOUNTING}
+
+KEYWORD_FLAGS = {}
+for _keywords, _flag in ((RISK_KEYWORDS + VALID_KEYWORDS, HAS_PAYROLL), (SUSPICIOUS_KEYWORDS, HAS_RISK),
+                         (TABLE_KEYWORDS, HAS_ACCOUNTING)):
+    for _keyword in _keywords:
+        _keyword = (_keyword.encode('ascii') if isinstance(_keyword, str) else _keyword).lower()
+        KEYWORD_FLAGS[_keyword] = KEYWORD_FLAGS.get(_keyword, 0) | _flag
+
+PRINTABLE = bytes(range(0x20, 0x7f)) + b'\t\r\n'
+COUNT_MAX = 0xFFFF
+BIT_COUNTS = bytes(bin(value).count('1') for value in range(256))
+
+
+def rfc_token(rfc):
+    return 'R:' + (rfc.decode('ascii') if isinstance(rfc, bytes) else rfc.strip().upper())
+
+
+def amount_token(cents):
+    return f'A:{cents}'
+
+
+def keyword_token(keyword):
+    return 'K:' + (keyword.decode('ascii') if isinstance(keyword, bytes) else keyword).lower()
+
+
+def _bloom_bits(token):
+    data = token.encode('utf-8')
+    h1 = zlib.crc32(data)
+    h2 = zlib.crc32(data, 0x9E3779B9) | 1
+    return [(h1 + i * h2) & (BLOOM_BYTES * 8 - 1) for i in range(BLOOM_HASHES)]
+
+
+class BlockColumns:
+    """Estado por bloque de 8 KB en columnas compactas (76 bytes por bloque)"""
+
+    def __init__(self, count):
+        self.count = count
+        self.flags = bytearray(count)
+        self.density = bytearray(count)      # bytes imprimibles, 0-255
+        # Bytes imprimibles contados durante el escaneo (no se guarda): un bloque partido
+        # entre dos rangos suma las dos partes y la densidad se calcula al final
+        self.printable = array('H', bytes(2 * count))
+        self.page_type = bytearray(count)    # tipo de página de SQL Server (0 = sin encabezado)
+        self.obj_id = array('i', bytes(4 * count))
+        self.rfcs = array('H', bytes(2 * count))
+        self.amounts = array('H', bytes(2 * count))
+        self.keywords = array('H', bytes(2 * count))
+        self.bloom = bytearray(count * BLOOM_BYTES)
+
+    def columns(self):
+        return (self.flags, self.density, self.page_type, self.obj_id, self.rfcs, self.amounts, self.keywords,
+                self.bloom)
+
+    def copy_range(self, other, first, last):
+        """Copia los bloques [first, last) de otro parcial que este no ha tocado"""
+        for mine, theirs in zip(self.columns() + (self.printable,), other.columns() + (other.printable,)):
+            width = BLOOM_BYTES if mine is self.bloom else 1
+            mine[first * width:last * width] = theirs[first * width:last * width]
+
+    def combine(self, other, block):
+        """
+        Bloque partido entre dos rangos (chunk_size no múltiplo de 8 KB): cada parcial vio
+        solo su parte, así que banderas y Bloom se unen con OR y los conteos se suman
+        """
+        self.flags[block] |= other.flags[block]
+        self.printable[block] += other.printable[block]
+        for mine, theirs in ((self.rfcs, other.rfcs), (self.amounts, other.amounts), (self.keywords, other.keywords)):
+            mine[block] = min(mine[block] + theirs[block], COUNT_MAX)
+        if not self.page_type[block]:
+            # Los rangos se fusionan en orden: la primera página del bloque es la de este parcial
+            self.page_type[block] = other.page_type[block]
+            self.obj_id[block] = other.obj_id[block]
+        base = block * BLOOM_BYTES
+        for i in range(base, base + BLOOM_BYTES):
+            self.bloom[i] |= other.bloom[i]
+
+    def finalize(self, size):
+        """Densidad 0-255 de cada bloque y marca de los Blooms saturados"""
+        # Bits en 1 de cada byte del Bloom en una sola traducción
+        bits = self.bloom.translate(BIT_COUNTS)
+        for block in range(self.count):
+            length = min(BLOCK_SIZE, size - block * BLOCK_SIZE)
+            if length > 0:
+                self.density[block] = self.printable[block] * 255 // length
+            if sum(bits[block * BLOOM_BYTES:(block + 1) * BLOOM_BYTES]) > BLOOM_MAX_FILL:
+                self.flags[block] |= BLOOM_FULL
+
+    def add_token(self, block, token):
+        base = block * BLOOM_BYTES
+        for bit in _bloom_bits(token):
+            self.bloom[base + (bit >> 3)] |= 1 << (bit & 7)
+
+    def may_contain(self, block, token):
+        if self.flags[block] & BLOOM_FULL:
+            return True
+        base = block * BLOOM_BYTES
+        return all(self.bloom[base + (bit >> 3)] >> (bit & 7) & 1 for bit in _bloom_bits(token))
+
+
+class BlockIndexConsumer:
+    """
+    Consumidor del ScanEngine que no entrega matches: resume cada bloque de 8 KB
+    (densidad de texto, encabezado de página, RFCs, montos y keywords con su Bloom).
+    """
+
+    kind = 'page_index'
+
+    def __init__(self, index):
+        self.index = index
+        self.automaton = KeywordAutomaton(list(KEYWORD_FLAGS), ignore_case=True)
+        self.rfc_filter = RFCFilter()
+        # VARCHAR y NVARCHAR (UTF-16LE) en la misma pasada
+        self._rfcs = DualScanner(RFC_PATTERN)
+        self._amounts = DualScanner(AMOUNT_PATTERN)
+        self._keywords = DualScanner(self.automaton.pattern)
+
+    def wants(self, offset):
+        return True
+
+    def feed(self, window):
+        data, base, begin, lo, hi, end = window
+        columns = self.index.ensure_columns()
+        first = (base + lo) // BLOCK_SIZE
+        last = -(-(base + hi) // BLOCK_SIZE)
+        self.index.covered(first, last)
+        self._summarize_blocks(columns, window, first, last)
+        self._scan_tokens(columns, window)
+
+    def _summarize_blocks(self, columns, window, first, last):
+        # Solo los bytes propios de la ventana [lo, hi): un bloque partido entre ventanas
+        # o rangos se resume por partes que se suman sin contar dos veces
+        data, base, begin, lo, hi, end = window
+        for block in range(first, last):
+            start = max(block * BLOCK_SIZE - base, lo)
+            stop = min((block + 1) * BLOCK_SIZE - base, hi)
+            piece = bytes(data[start:stop])
+            columns.printable[block] += len(piece) - len(piece.translate(None, PRINTABLE))
+            if columns.flags[block] & HAS_PAGE:
+                continue
+            # Páginas de SQL Server alineadas a 512 dentro del bloque (contenedor MTF)
+            pos = -(-(base + start) // MTF_ALIGN) * MTF_ALIGN - base
+            while pos < stop and pos + PAGE_HEADER_SIZE <= end:
+                if data[pos] == 1:
+                    header = parse_header(data, pos, base + pos)
+                    if header is not None:
+                        columns.flags[block] |= HAS_PAGE
+                        columns.page_type[block] = header.type
+                        columns.obj_id[block] = header.obj_id
+                        break
+                pos += MTF_ALIGN
+
+    def _scan_tokens(self, columns, window):
+        flags, rfcs, amounts, keywords = columns.flags, columns.rfcs, columns.amounts, columns.keywords
+        # Un token se repite mucho dentro de un bloque: el Bloom se actualiza una vez por (bloque, token)
+        tokens = set()
+        # El bloque dueño de un token es donde inicia (los que cruzan el borde se completan con el traslape)
+        for offset, match, width in self._rfcs.scan(window):
+            value = bytes(narrow(match.group(0), width))
+            if self.rfc_filter.accepts(value):
+                block = offset // BLOCK_SIZE
+                flags[block] |= HAS_RFC
+                rfcs[block] = min(rfcs[block] + 1, COUNT_MAX)
+                tokens.add((block, rfc_token(value)))
+        for offset, match, width in self._amounts.scan(window):
+            block = offset // BLOCK_SIZE
+            flags[block] |= HAS_AMOUNT
+            amounts[block] = min(amounts[block] + 1, COUNT_MAX)
+            tokens.add((block, amount_token(parse_cents(narrow(match.group(0), width)))))
+        keywords_at, data, end = self.automaton.keywords_at, window.data, window.end
+        for offset, match, width in self._keywords.scan(window):
+            block = offset // BLOCK_SIZE
+            for keyword in keywords_at(data, match.start(), end, width=width):
+                flags[block] |= KEYWORD_FLAGS[keyword]
+                keywords[block] = min(keywords[block] + 1, COUNT_MAX)
+                tokens.add((block, keyword))
+        for block, token in tokens:
+            columns.add_token(block, keyword_token(token) if isinstance(token, bytes) else token)
+
+
+class PageIndex:
+    """
+    Índice lateral (sidecar) del respaldo por bloques de 8 KB: se construye una vez y
+    permite ir directo a los bloques con un RFC, monto o keyword sin reescanear desde el byte 0.
+    También es un plugin del ScanEngine (con merge por rangos para el escaneo paralelo).
+    """
+
+    def __init__(self, bak_file_path):
+        self.bak_file = str(bak_file_path)
+        self.size = os.path.getsize(self.bak_file)
+        self.fingerprint = None
+        self.blocks = None
+        self.first = None
+        self.last = None
+
+    @property
+    def block_count(self):
+        return -(-self.size // BLOCK_SIZE)
+
+    def ensure_columns(self):
+        if self.blocks is None:
+            self.blocks = BlockColumns(self.block_count)
+        return self.blocks
+
+    def covered(self, first, last):
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+
+    def consumers(self):
+        return [BlockIndexConsumer(self)]
+
+    def merge(self, other):
+        if other.blocks is None:
+            return
+        blocks = self.ensure_columns()
+        first, last = other.first, other.last
+        if self.first is not None:
+            # Bloques que ambos parciales tocaron: el borde entre rangos
+            shared_lo, shared_hi = max(self.first, first), min(self.last, last)
+            for block in range(shared_lo, shared_hi):
+                blocks.combine(other.blocks, block)
+            if shared_lo < shared_hi:
+                blocks.copy_range(other.blocks, first, shared_lo)
+                first = shared_hi
+        blocks.copy_range(other.blocks, first, last)
+        self.covered(other.first, other.last)
+
+    def finish(self):
+        blocks = self.ensure_columns()
+        blocks.finalize(self.size)
+        marked = sum(1 for flag in blocks.flags if flag)
+        full = sum(1 for flag in blocks.flags if flag & BLOOM_FULL)
+        print(f"✓ Índice de bloques: {blocks.count} bloques de 8 KB, {marked} con datos de interés"
+              f"{f', {full} con Bloom saturado' if full else ''}")
+
+    def build(self, workers=1):
+        # El índice es la caché: no pasa por la caché de matches
+        run_plugins(self.bak_file, [self], workers=workers, cache=None)
+        self.fingerprint = fingerprint(self.bak_file)
+        return self
+
+    def save(self, path=None):
+        path = path or self.bak_file + SIDECAR_SUFFIX
+        blocks = self.ensure_columns()
+        with open(path, 'wb') as f:
+            f.write(MAGIC + struct.pack('<IQQ', BLOCK_SIZE, self.size, blocks.count))
+            f.write(self.fingerprint.encode('ascii'))
+            for column in blocks.columns():
+                f.write(column.tobytes() if isinstance(column, array) else column)
+        return path
+
+    @classmethod
+    def load(cls, bak_file_path, path=None):
+        """Índice guardado, o None si no existe o el respaldo cambió (otra huella)"""
+        path = path or str(bak_file_path) + SIDECAR_SUFFIX
+        if not os.path.exists(path):
+            return None
+        index = cls(bak_file_path)
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            block_size, size, count = struct.unpack('<IQQ', f.read(20))
+            stored = f.read(40).decode('ascii')
+            if block_size != BLOCK_SIZE or size != index.size or stored != fingerprint(index.bak_file):
+                return None
+            index.fingerprint = stored
+            blocks = index.blocks = BlockColumns(count)
+            for column in blocks.columns():
+                if isinstance(column, array):
+                    column[:] = array(column.typecode, f.read(len(column) * column.itemsize))
+                else:
+                    column[:] = f.read(len(column))
+        return index
+
+    # Consultas
+
+    def blocks_with(self, mask):
+        """Bloques con alguna de las banderas de `mask`"""
+        return [block for block, flag in enumerate(self.blocks.flags) if flag & mask]
+
+    def candidates(self, token):
+        """Bloques que quizá contienen el token (Bloom: sin falsos negativos)"""
+        blocks = self.blocks
+        flag = {'R': HAS_RFC, 'A': HAS_AMOUNT}.get(token[0], HAS_PAYROLL | HAS_RISK | HAS_ACCOUNTING)
+        return [block for block, value in enumerate(blocks.flags) if value & flag and blocks.may_contain(block, token)]
+
+    def read_block(self, f, block):
+        f.seek(block * BLOCK_SIZE)
+        return f.read(BLOCK_SIZE + READ_TAIL)
+
+    def find(self, token, needle):
+        """Confirma los candidatos leyendo solo esos bloques; devuelve offsets absolutos de `needle` (un byte o UTF-16LE)"""
+        offsets = []
+        needles = (needle, needle.decode('latin-1').encode('utf-16-le'))
+        with open(self.bak_file, 'rb') as f:
+            for block in self.candidates(token):
+                data = self.read_block(f, block)
+                for form in needles:
+                    pos = data.find(form)
+                    while 0 <= pos < BLOCK_SIZE:
+                        offsets.append(block * BLOCK_SIZE + pos)
+                        pos = data.find(form, pos + 1)
+        return sorted(offsets)
+
+
+def ranges(blocks):
+    """Agrupa bloques consecutivos en rangos de bytes [inicio, fin) para releerlos con seek"""
+    result = []
+    for block in blocks:
+        if result and result[-1][1] == block * BLOCK_SIZE:
+            result[-1][1] += BLOCK_SIZE
+        else:
+            result.append([block * BLOCK_SIZE, (block + 1) * BLOCK_SIZE])
+    return [tuple(item) for item in result]
+
+
+def ensure_index(bak_file_path, workers=1, path=None):
+    """Carga el índice lateral del respaldo o lo construye (una vez por respaldo)"""
+    index = PageIndex.load(bak_file_path, path)
+    if index is None:
+        index = PageIndex(bak_file_path).build(workers=workers)
+        print(f"💾 Índice guardado en: {index.save(path)}")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice lateral por bloques de 8 KB de un respaldo .bak")
+    parser.add_argument("bak_path")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para construir el índice")
+    parser.add_argument("--index", default=None, help="Ruta del índice (por defecto: <respaldo>.pidx)")
+    parser.add_argument("--rfc", default=None, help="Bloques que mencionan este RFC")
+    parser.add_argument("--amount", type=float, default=None, help="Bloques con este monto")
+    parser.add_argument("--keyword", default=None, help="Bloques con esta keyword")
+    parser.add_argument("--flag", choices=sorted(FLAG_NAMES), default=None, help="Bloques con esta bandera")
+    args = parser.parse_args()
+
+    index = ensure_index(args.bak_path, workers=args.workers, path=args.index)
+    if args.rfc:
+        offsets = index.find(rfc_token(args.rfc), args.rfc.strip().upper().encode('ascii'))
+        print(f"🔎 RFC {args.rfc}: {len(offsets)} ocurrencias en {len({o // BLOCK_SIZE for o in offsets})} bloques")
+        print(f"   Offsets: {offsets[:20]}")
+    if args.amount is not None:
+        cents = int(round(args.amount * 100))
+        blocks = index.candidates(amount_token(cents))
+        print(f"🔎 Monto {cents / 100:.2f}: {len(blocks)} bloques candidatos {blocks[:20]}")
+    if args.keyword:
+        blocks = index.candidates(keyword_token(args.keyword))
+        print(f"🔎 Keyword '{args.keyword}': {len(blocks)} bloques candidatos {blocks[:20]}")
+    if args.flag:
+        blocks = index.blocks_with(FLAG_NAMES[args.flag])
+        print(f"🔎 Bandera {args.flag}: {len(blocks)} bloques en {len(ranges(blocks))} rangos")
@@ -1,77 +1,103 @@
 import re
 import json
+import argparse
 import collections
 from pathlib import Path
 
+from dedupe import DEDUPE_BACKENDS, make_deduper
+from rfc_validator import FISICA
+from scan_engine import RFCConsumer, KeywordConsumer, run_plugins
+from scan_cache import DEFAULT_CACHE_PATH
+from result_store import RowSpool, save_report as save_store_report
+from streaming_stats import Reservoir
+
+# Regex para RFCs de personas físicas (4 letras iniciales)
+RFC_FISICA_PATTERN = re.compile(rb'[A-Z&]{4}[0-9]{6}[A-Z0-9]{3}')
+
+# Keywords de alto riesgo en nómina
+RISK_KEYWORDS = [
+    b"asimilados", b"prevision social", b"sindicato", b"efectivo", 
+    b"viaticos", b"compensacion", b"bono", b"gratificacion",
+    b"finiquito", b"indemnizacion", b"no acumulable"
+]
+
+# Keywords de nómina estándar (para validar que es nómina)
+VALID_KEYWORDS = [b"sueldo", b"salario", b"imss", b"infonavit", b"isr", b"subsidio"]
+
 class PayrollHunter:
-    def __init__(self, bak_file_path):
+    def __init__(self, bak_file_path, max_bytes=None, dedupe='exact', dedupe_mb=256):
         self.bak_file = bak_file_path
+        # None = archivo completo en modo streaming; un límite solo para pruebas rápidas
+        self.max_bytes = max_bytes
         self.results = {
-            "employee_rfcs": set(),
-            "suspicious_concepts": [],
+            # RFCs en slots de ancho fijo (exacto) o Bloom + HyperLogLog (aproximado)
+            "employee_rfcs": make_deduper(dedupe, 'key', dedupe_mb),
+            # Memoria acotada: conteo por keyword + muestra de evidencias
+            "risk_counts": collections.Counter(),
+            "suspicious_concepts": Reservoir(20),
+            # Todas las evidencias, para el almacén de resultados (el JSON solo lleva la muestra),
+            # grabadas por lotes a disco
+            "evidence": RowSpool('evidence'),
             "payroll_stats": {},
             "evasion_indicators": []
         }
         self.strings = []
 
-    def hunt(self):
-        print(f"🕵️ Escaneando NÓMINA en: {Path(self.bak_file).name}")
-        
-        # Regex para RFCs de personas físicas (4 letras iniciales)
-        rfc_fisica_pattern = re.compile(rb'[A-Z&]{4}[0-9]{6}[A-Z0-9]{3}')
-        
-        # Keywords de alto riesgo en nómina
-        risk_keywords = [
-            "asimilados", "prevision social", "sindicato", "efectivo", 
-            "viaticos", "compensacion", "bono", "gratificacion",
-            "finiquito", "indemnizacion", "no acumulable"
+    def consumers(self):
+        """Consumidores para el ScanEngine: RFCs de empleados y conceptos de riesgo"""
+        max_bytes = self.max_bytes
+        return [
+            # 1. Buscar RFCs de Empleados
+            RFCConsumer(self._on_rfc, pattern=RFC_FISICA_PATTERN, types=(FISICA,), max_bytes=max_bytes),
+            # 2. Buscar Conceptos de Riesgo (20 chars antes y después)
+            KeywordConsumer(self._on_keyword, RISK_KEYWORDS, ignore_case=True,
+                            context=(20, 40), max_bytes=max_bytes),
         ]
-        
-        # Keywords de nómina estándar (para validar que es nómina)
-        valid_keywords = ["sueldo", "salario", "imss", "infonavit", "isr", "subsidio"]
 
-        with open(self.bak_file, 'rb') as f:
-            chunk_size = 10 * 1024 * 1024 
-            chunk_count = 0
-            max_chunks = 50 # 500MB de escaneo profundo
-            
-            while chunk_count < max_chunks:
-                data = f.read(chunk_size)
-                if not data: break
-                
-                # 1. Buscar RFCs de Empleados
-                for match in rfc_fisica_pattern.finditer(data):
-                    try:
-                        rfc = match.group(0).decode('ascii')
-                        # Validar que parezca fecha válida en el RFC
-                        self.results["employee_rfcs"].add(rfc)
-                    except: pass
-                
-                # 2. Buscar Conceptos de Riesgo
-                data_str = data.decode('ascii', errors='ignore').lower()
-                for kw in risk_keywords:
-                    if kw in data_str:
-                        # Extraer contexto (20 chars antes y después)
-                        idx = data_str.find(kw)
-                        context = data_str[max(0, idx-20):min(len(data_str), idx+40)]
-                        self.results["suspicious_concepts"].append({
-                            "keyword": kw,
-                            "context": context.replace('\n', ' ').strip()
-                        })
+    def _on_rfc(self, value, offset):
+        try:
+            # Fecha y dígito verificador ya validados por el RFCConsumer
+            rfc = value.decode('ascii')
+            self.results["employee_rfcs"].add(rfc)
+        except: pass
 
-                chunk_count += 1
-                if chunk_count % 5 == 0:
-                    print(f"  ... Procesados {chunk_count * 10} MB | Empleados detectados: {len(self.results['employee_rfcs'])}")
+    def _on_keyword(self, keyword, offset, context):
+        # Cada ocurrencia de cada keyword, con su offset en el respaldo
+        kw = keyword.decode('ascii')
+        self.results["risk_counts"][kw] += 1
+        context = context.decode('ascii', errors='ignore').lower().replace('\n', ' ').strip()
+        self.results["suspicious_concepts"].add({
+            "keyword": kw,
+            "offset": offset,
+            "context": context
+        }, (offset, kw))
+        self.results["evidence"].add(kw, offset, context)
+
+    def merge(self, other):
+        """Fusiona el estado parcial de un worker (escaneo paralelo por rangos)"""
+        self.results["employee_rfcs"].merge(other.results["employee_rfcs"])
+        self.results["risk_counts"].update(other.results["risk_counts"])
+        self.results["suspicious_concepts"].merge(other.results["suspicious_concepts"])
+        self.results["evidence"].extend(other.results["evidence"])
+
+    def finish(self):
+        print(f"  Empleados detectados: {len(self.results['employee_rfcs'])} | Conceptos de riesgo: {sum(self.results['risk_counts'].values())}")
+
+    def hunt(self, workers=1, cache=None):
+        print(f"🕵️ Escaneando NÓMINA en: {Path(self.bak_file).name}")
+        run_plugins(self.bak_file, [self], workers=workers, cache=cache)
 
     def save_report(self, output_path):
         """Genera el reporte final de nómina"""
+        employees = self.results["employee_rfcs"]
         final_report = {
-            "total_employees_detected": len(self.results["employee_rfcs"]),
-            "sample_employees": list(self.results["employee_rfcs"])[:50],
+            "total_employees_detected": len(employees),
+            # El backend aproximado solo estima el total, no enumera RFCs
+            "sample_employees": sorted(employees)[:50] if employees.exact else [],
             "risk_findings": {
-                "total_risks": len(self.results["suspicious_concepts"]),
-                "breakdown": dict(collections.Counter(item['keyword'] for item in self.results["suspicious_concepts"])),
-                "evidence": self.results["suspicious_concepts"][:20]
+                "total_risks": sum(self.results["risk_counts"].values()),
+                "breakdown": dict(self.results["risk_counts"]),
+                "evidence": self.results["suspicious_concepts"].items
             }
         }
         
@@ -79,13 +105,44 @@ class PayrollHunter:
             json.dump(final_report, f, indent=2, ensure_ascii=False)
         print(f"✅ Reporte de Nómina guardado en: {output_path}")
 
+    def save_store(self, store_path, report="payroll"):
+        """Guarda el resumen, todos los RFCs de empleados y todas las evidencias en el almacén de resultados"""
+        employees = self.results["employee_rfcs"]
+        summary = {
+            "total_employees_detected": len(employees),
+            "risk_findings": {
+                "total_risks": sum(self.results["risk_counts"].values()),
+                "breakdown": dict(self.results["risk_counts"])
+            },
+            # El backend aproximado solo estima el total: la tabla `rfcs` queda vacía
+            "rfcs_enumerated": employees.exact
+        }
+        if not employees.exact:
+            print("⚠️  Dedupe aproximado: el almacén solo guarda el total estimado de empleados, no sus RFCs")
+        rfcs = ((rfc,) for rfc in sorted(employees)) if employees.exact else ()
+        counts = save_store_report(store_path, report, summary, rfcs=rfcs, evidence=self.results["evidence"])
+        print(f"💾 Almacén de resultados: {store_path} ({counts['rfcs']} empleados, {counts['evidence']} evidencias)")
+
 if __name__ == "__main__":
     print("="*60)
     print("💼 AUDITORÍA ESPECIAL DE NÓMINAS - MAJOBA")
     print("="*60)
     
-    archivo_bak = r"C:\IA_nubes\auditorIA_1\ctTransportes_Majoba_SA_De_CV-20251027-1050\document_584def9a-95e2-4822-83db-889de0d559d0_content.bak"
+    parser = argparse.ArgumentParser(description="Auditoría de nómina en un respaldo .bak")
+    parser.add_argument("bak_path", nargs="?", default=r"C:\IA_nubes\auditorIA_1\ctTransportes_Majoba_SA_De_CV-20251027-1050\document_584def9a-95e2-4822-83db-889de0d559d0_content.bak")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para escaneo paralelo por rangos")
+    parser.add_argument("--max-mb", type=int, default=None, help="Limitar el escaneo a los primeros N MB (por defecto: completo)")
+    parser.add_argument("--dedupe", choices=DEDUPE_BACKENDS, default="exact", help="Deduplicación de RFCs: exacta o aproximada (Bloom + HyperLogLog)")
+    parser.add_argument("--dedupe-mb", type=int, default=256, help="Presupuesto de memoria para la deduplicación en MB")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true", help="Reescanear sin usar ni actualizar la caché")
+    parser.add_argument("--store", default=None, help="Almacén SQLite de resultados con el detalle completo (opcional)")
+    args = parser.parse_args()
+    archivo_bak = args.bak_path
     
-    hunter = PayrollHunter(archivo_bak)
-    hunter.hunt()
+    hunter = PayrollHunter(archivo_bak, max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None,
+                           dedupe=args.dedupe, dedupe_mb=args.dedupe_mb)
+    hunter.hunt(workers=args.workers, cache=None if args.no_cache else args.cache)
     hunter.save_report("payroll_report_majoba.json")
+    if args.store:
+        hunter.save_store(args.store)
@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import sqlite3
+import argparse
+import tempfile
+from array import array
+from datetime import date, datetime
+from pathlib import Path
+
+from anomaly_hunter import SUSPICIOUS_KEYWORDS
+from benford_stats import DigitStatsAccumulator
+from result_store import SPOOL_FLUSH_ROWS, RowSpool
+from scan_engine import (EPOCH_ORDINAL, AmountConsumer, DateConsumer, KeywordConsumer, PatternConsumer, parse_cents,
+                         run_plugins)
+from scan_cache import DEFAULT_CACHE_PATH
+from typed_records import DATE_LINK_BYTES, NO_DATE, link_nearest, parse_date
+
+# Reducciones agrupadas con NumPy si está instalado; Python puro como respaldo
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Cuentas contables con máscara de ASPEL COI (ej. 1101-001-000, 601-84-001); las fechas ISO se descartan
+ACCOUNT_PATTERN = re.compile(rb'(?<![0-9A-Za-z-])[0-9]{3,4}-[0-9]{2,4}(?:-[0-9]{2,4}){0,2}(?![0-9-])')
+# Una cuenta se asocia al monto si aparece dentro de estos bytes antes de él (mismo movimiento)
+ACCOUNT_LINK_BYTES = 256
+NO_ACCOUNT = -1
+# Debajo de esta muestra la prueba de Benford de una celda no es concluyente
+MIN_BENFORD_N = 50
+# Porcentaje de cifras redondas para riesgo MEDIO / ALTO (mismos umbrales que AnomalyHunter)
+ROUND_MEDIUM = 15
+ROUND_HIGH = 30
+
+
+class AccountConsumer(PatternConsumer):
+    kind = 'account'
+    pattern = ACCOUNT_PATTERN
+
+
+def month_key(month):
+    """Mes desde 1970-01 (0 = enero de 1970) a 'YYYY-MM'"""
+    return f"{1970 + month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def _months_of(days):
+    """Mes (desde 1970-01) de cada día; memoizado porque los días se repiten mucho"""
+    if np is not None:
+        return array('q', np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype('int64').tolist())
+    memo = {}
+    months = array('q')
+    for day in days:
+        month = memo.get(day)
+        if month is None:
+            d = date.fromordinal(day + EPOCH_ORDINAL)
+            month = memo[day] = (d.year - 1970) * 12 + d.month - 1
+        months.append(month)
+    return months
+
+
+def _digit_stats_numpy(groups, cents, size):
+    """Un DigitStatsAccumulator por grupo con `np.bincount` (sin recorrer montos en Python)"""
+    groups = np.asarray(groups, dtype=np.int64)
+    cents = np.asarray(cents, dtype=np.int64)
+    power = 10 ** np.floor(np.log10(cents)).astype(np.int64)
+    # Corregir el redondeo del logaritmo en potencias exactas de 10
+    power = np.where(cents < power, power // 10, power)
+    power = np.where(cents >= power * 10, power * 10, power)
+    first = cents // power
+    two = cents >= 10
+    first_two = cents[two] // (power[two] // 10)
+    cents_part = cents % 100
+    first_counts = np.bincount(groups * 10 + first, minlength=size * 10).reshape(size, 10)
+    first_two_counts = np.bincount(groups[two] * 100 + first_two, minlength=size * 100).reshape(size, 100)
+    last_two_counts = np.bincount(groups * 100 + cents_part, minlength=size * 100).reshape(size, 100)
+    units = cents_part == 0
+    round_units = np.bincount(groups[units], minlength=size)
+    round_hundreds = np.bincount(groups[cents % 10000 == 0], minlength=size)
+    round_thousands = np.bincount(groups[cents % 100000 == 0], minlength=size)
+    stats = []
+    for g in range(size):
+        acc = DigitStatsAccumulator()
+        acc.first = first_counts[g].tolist()
+        acc.first_two = first_two_counts[g].tolist()
+        acc.last_two = last_two_counts[g].tolist()
+        acc.count = int(sum(acc.first))
+        acc.round_units = int(round_units[g])
+        acc.round_hundreds = int(round_hundreds[g])
+        acc.round_thousands = int(round_thousands[g])
+        stats.append(acc)
+    return stats
+
+
+def _digit_stats_python(groups, cents, size):
+    stats = [DigitStatsAccumulator() for _ in range(size)]
+    for group, value in zip(groups, cents):
+        stats[group].add_cents(value)
+    return stats
+
+
+def digit_stats_by_group(groups, cents, size):
+    """Histogramas de Benford y cifras redondas por grupo (ids 0..size-1); montos en centavos > 0"""
+    if np is not None and len(cents):
+        return _digit_stats_numpy(groups, cents, size)
+    return _digit_stats_python(groups, cents, size)
+
+
+def _round_level(pct):
+    if pct > ROUND_HIGH:
+        return "ALTO"
+    return "MEDIO" if pct > ROUND_MEDIUM else "BAJO"
+
+
+def cell_summary(stats, total_cents, keywords, full=False):
+    """Métricas de una celda del cubo; `full` agrega las pruebas de dos dígitos (resumen mensual)"""
+    summary = {"amounts": stats.count, "total": total_cents / 100}
+    if stats.count >= MIN_BENFORD_N:
+        summary["benford"] = stats.first_digit_test()
+        if full:
+            summary["first_two_digits_test"] = stats.first_two_digits_test()
+            summary["last_two_digits_test"] = stats.last_two_digits_test()
+    else:
+        summary["benford"] = {"status": "Muestra insuficiente", "n": stats.count}
+    pct = stats.round_units / stats.count * 100 if stats.count else 0.0
+    summary["round_numbers"] = {
+        "percentage": round(pct, 2),
+        "count": stats.round_units,
+        "multiples_of_100": stats.round_hundreds,
+        "multiples_of_1000": stats.round_thousands,
+        "risk_level": _round_level(pct),
+    }
+    summary["keywords"] = dict(sorted(keywords.items(), key=lambda item: -item[1]))
+    return summary
+
+
+class PeriodCubes:
+    """
+    Plugin del ScanEngine: liga cada monto a la fecha y a la cuenta contable más cercanas
+    antes de él y agrega Benford, cifras redondas y keywords de riesgo por mes y por
+    mes x cuenta. El resultado es un cubo chico que el dashboard carga sin reescanear.
+    Los hits se graban en RowSpools mientras se escanea y el cubo se arma leyéndolos en
+    flujo: la memoria depende de las celdas del cubo, no del número de montos.
+    """
+
+    def __init__(self, bak_file_path=None, max_bytes=None, keywords=SUSPICIOUS_KEYWORDS):
+        self.bak_file = bak_file_path
+        self.max_bytes = max_bytes
+        self.keyword_list = keywords
+        # (offset, valor) en orden de offset: centavos, día, nombre de cuenta, keyword
+        self.amounts = RowSpool('period_amounts', ('byte_offset', 'cents'))
+        self.dates = RowSpool('period_dates', ('byte_offset', 'day'))
+        self.accounts = RowSpool('period_accounts', ('byte_offset', 'account'))
+        self.keywords = RowSpool('period_keywords', ('byte_offset', 'keyword'))
+        self.account_names = []
+        self.cubes = None
+
+    def consumers(self):
+        return [
+            AmountConsumer(self._on_amount, max_bytes=self.max_bytes),
+            DateConsumer(self._on_date, max_bytes=self.max_bytes),
+            AccountConsumer(self._on_account, max_bytes=self.max_bytes),
+            KeywordConsumer(self._on_keyword, self.keyword_list, ignore_case=True, max_bytes=self.max_bytes),
+        ]
+
+    def _on_amount(self, value, offset):
+        cents = parse_cents(value)
+        if cents > 0:
+            self.amounts.add(offset, cents)
+
+    def _on_date(self, value, offset):
+        parsed = parse_date(value)
+        if parsed is not None:
+            self.dates.add(offset, parsed[0])
+
+    def _on_account(self, value, offset):
+        # 2024-01-31 también tiene forma de cuenta: si es fecha válida, no es cuenta
+        if parse_date(value) is not None:
+            return
+        self.accounts.add(offset, bytes(value).decode('ascii'))
+
+    def _on_keyword(self, keyword, offset, context):
+        self.keywords.add(offset, keyword.decode('ascii'))
+
+    def merge(self, other):
+        # Los parciales llegan en orden de rango: los spools siguen ordenados por offset
+        for mine, theirs in ((self.amounts, other.amounts), (self.dates, other.dates),
+                             (self.accounts, other.accounts), (self.keywords, other.keywords)):
+            mine.extend(theirs)
+
+    def finish(self):
+        self.cubes = self.build()
+        months = self.cubes["months"]
+        print(f"✓ Cubos por periodo: {len(months)} meses, {len(self.cubes['accounts'])} celdas mes x cuenta "
+              f"({self.cubes['undated']['amounts']} montos sin fecha)")
+        # El cubo ya está armado: los archivos temporales no se necesitan más
+        for spool in (self.amounts, self.dates, self.accounts, self.keywords):
+            spool.discard()
+
+    def _account_ids(self):
+        """Ids de cuenta en orden de primera aparición (una pasada por el spool; memoria por cuenta única)"""
+        index = {}
+        self.account_names = []
+        for _, name in self.accounts:
+            if name not in index:
+                index[name] = len(self.account_names)
+                self.account_names.append(name)
+        return index
+
+    def _link(self, spool, account_ids):
+        """Lotes de (valor, día, mes, cuenta) de los hits del spool con fecha cercana; cuenta los que no"""
+        dated = link_nearest(spool, self.dates, DATE_LINK_BYTES, NO_DATE)
+        anchors = ((offset, account_ids[name]) for offset, name in self.accounts)
+        linked = link_nearest(((offset, (value, day)) for offset, value, day in dated), anchors,
+                              ACCOUNT_LINK_BYTES, NO_ACCOUNT)
+        batch = []
+        for _, (value, day), account in linked:
+            batch.append((value, day, account))
+            if len(batch) >= SPOOL_FLUSH_ROWS:
+                yield self._dated(batch)
+                batch = []
+        if batch:
+            yield self._dated(batch)
+
+    @staticmethod
+    def _dated(batch):
+        rows = [row for row in batch if row[1] != NO_DATE]
+        months = _months_of(array('q', (day for _, day, _ in rows)))
+        return len(batch) - len(rows), [(value, day, month, account)
+                                         for (value, day, account), month in zip(rows, months)]
+
+    def _movement_batches(self, account_ids, undated):
+        """
+        Montos fechados sin copias del mismo movimiento (mismo día, cuenta e importe: páginas
+        repetidas, log), deduplicados en un SQLite temporal; se leen por lotes
+        """
+        fd, path = tempfile.mkstemp(prefix="period_movements_", suffix=".sqlite")
+        os.close(fd)
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("CREATE TABLE movements (day INTEGER, account INTEGER, month INTEGER, cents INTEGER, "
+                         "PRIMARY KEY (day, account, cents)) WITHOUT ROWID")
+            for missing, rows in self._link(self.amounts, account_ids):
+                undated[0] += missing
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO movements VALUES (?, ?, ?, ?)",
+                                     [(day, account, month, cents) for cents, day, month, account in rows])
+            cursor = conn.execute("SELECT month, account, cents FROM movements")
+            while True:
+                rows = cursor.fetchmany(SPOOL_FLUSH_ROWS)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+            Path(path).unlink(missing_ok=True)
+
+    def build(self):
+        """Calcula el cubo: resumen por mes (todas las cuentas) y por mes x cuenta"""
+        account_ids = self._account_ids()
+        stats, totals = {}, {}
+        undated = [0]
+        for rows in self._movement_batches(account_ids, undated):
+            # Histogramas del lote por celda (NumPy si está) y se suman a los acumulados de la celda
+            local = {}
+            groups = array('q', (local.setdefault((month, account), len(local)) for month, account, _ in rows))
+            cents = array('q', (value for _, _, value in rows))
+            batch_stats = digit_stats_by_group(groups, cents, len(local))
+            for cell, group in local.items():
+                stats.setdefault(cell, DigitStatsAccumulator()).merge(batch_stats[group])
+            for (month, account, value) in rows:
+                totals[(month, account)] = totals.get((month, account), 0) + value
+
+        # Keywords ligadas a la fecha (y cuenta) más cercanas antes de ellas
+        keyword_cells = {}
+        kw_undated = 0
+        for missing, rows in self._link(self.keywords, account_ids):
+            kw_undated += missing
+            for name, _, month, account in rows:
+                counts = keyword_cells.setdefault((month, account), {})
+                counts[name] = counts.get(name, 0) + 1
+
+        month_stats, month_totals, month_keywords = {}, {}, {}
+        for (month, account), acc in sorted(stats.items()):
+            month_stats.setdefault(month, DigitStatsAccumulator()).merge(acc)
+            month_totals[month] = month_totals.get(month, 0) + totals[(month, account)]
+        for (month, account), counts in keyword_cells.items():
+            merged = month_keywords.setdefault(month, {})
+            for name, count in counts.items():
+                merged[name] = merged.get(name, 0) + count
+
+        by_month = []
+        for month in sorted(set(month_stats) | set(month_keywords)):
+            summary = cell_summary(month_stats.get(month, DigitStatsAccumulator()), month_totals.get(month, 0),
+                                   month_keywords.get(month, {}), full=True)
+            by_month.append(dict({"month": month_key(month)}, **summary))
+
+        by_account = []
+        for cell in sorted(set(stats) | set(keyword_cells)):
+            month, account = cell
+            summary = cell_summary(stats.get(cell, DigitStatsAccumulator()), totals.get(cell, 0),
+                                   keyword_cells.get(cell, {}))
+            by_account.append(dict({"month": month_key(month),
+                                    "account": self.account_names[account] if account != NO_ACCOUNT else None},
+                                   **summary))
+
+        return {
+            "source": Path(self.bak_file).name if self.bak_file else None,
+            "generated": datetime.now().isoformat(),
+            "months": by_month,
+            "accounts": by_account,
+            "undated": {"amounts": undated[0], "keywords": kw_undated},
+        }
+
+    def save(self, path):
+        """Guarda el cubo en JSON (chico: una fila por mes y por mes x cuenta)"""
+        if self.cubes is None:
+            self.cubes = self.build()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.cubes, f, indent=2, ensure_ascii=False)
+        print(f"💾 Cubos por periodo guardados en: {path}")
+
+
+def load_cubes(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def month_slice(cubes, month, account=None):
+    """Resumen de un mes ('YYYY-MM') y sus celdas por cuenta, leído del cubo precalculado"""
+    summary = next((row for row in cubes["months"] if row["month"] == month), None)
+    cells = [row for row in cubes["accounts"] if row["month"] == month and (account is None or row["account"] == account)]
+    return {"month": summary, "accounts": cells}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cubos mensuales (Benford, cifras redondas, keywords) por mes y cuenta")
+    parser.add_argument("bak_path", nargs="?", default=None)
+    parser.add_argument("--output", default="period_cubes.json", help="Archivo del cubo (JSON)")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para escaneo paralelo por rangos")
+    parser.add_argument("--max-mb", type=int, default=None, help="Limitar el escaneo a los primeros N MB (por defecto: completo)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true", help="Reescanear sin usar ni actualizar la caché")
+    parser.add_argument("--month", default=None, help="Mostrar un mes (YYYY-MM) del cubo sin reescanear")
+    parser.add_argument("--account", default=None, help="Filtrar el mes por cuenta contable")
+    args = parser.parse_args()
+
+    if args.bak_path:
+        cubes = PeriodCubes(args.bak_path, max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None)
+        run_plugins(args.bak_path, [cubes], workers=args.workers, cache=None if args.no_cache else args.cache)
+        cubes.save(args.output)
+
+    if args.month:
+        print(json.dumps(month_slice(load_cubes(args.output), args.month, args.account), indent=2, ensure_ascii=False))
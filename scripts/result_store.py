@@ -0,0 +1,290 @@
+import os
+import json
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+
+# Almacén de resultados por empresa: filas de resumen (JSON chico por sección) + tablas de
+# detalle completas (sin truncar) que el dashboard lee paginadas y filtradas
+STORE_FILE = "results_{slug}.sqlite"
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Filas en memoria antes de grabar un lote al archivo temporal de un RowSpool
+SPOOL_FLUSH_ROWS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary (
+    report TEXT NOT NULL, section TEXT NOT NULL, value TEXT NOT NULL,
+    PRIMARY KEY (report, section)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rfcs (
+    report TEXT NOT NULL, rfc TEXT NOT NULL,
+    PRIMARY KEY (report, rfc)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS amounts (
+    report TEXT NOT NULL, byte_offset INTEGER NOT NULL, cents INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS amounts_by_report ON amounts (report);
+CREATE INDEX IF NOT EXISTS amounts_by_cents ON amounts (report, cents);
+CREATE TABLE IF NOT EXISTS dates (
+    report TEXT NOT NULL, day TEXT NOT NULL,
+    PRIMARY KEY (report, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS evidence (
+    report TEXT NOT NULL, keyword TEXT NOT NULL, byte_offset INTEGER NOT NULL, context TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evidence_by_keyword ON evidence (report, keyword);
+"""
+
+# Por tabla de detalle: columnas de inserción, columnas de lectura, orden y filtros admitidos
+# (nombre del filtro -> condición SQL). Mismas definiciones que src/lib/resultStore.ts.
+# Montos y evidencias se insertan en orden de offset: el rowid ya es ese orden y no necesita índice
+
+DETAIL_TABLES = {
+    "rfcs": {
+        "insert": ("rfc",),
+        "select": "rfc",
+        "order": "rfc",
+        "filters": {"prefix": "rfc LIKE ? || '%'"},
+    },
+    "amounts": {
+        "insert": ("byte_offset", "cents"),
+        "select": 'byte_offset AS "offset", cents',
+        "order": "rowid",
+        "filters": {"min_cents": "cents >= ?", "max_cents": "cents <= ?"},
+    },
+    "dates": {
+        "insert": ("day",),
+        "select": "day",
+        "order": "day",
+        "filters": {"start": "day >= ?", "end": "day <= ?"},
+    },
+    "evidence": {
+        "insert": ("keyword", "byte_offset", "context"),
+        "select": 'keyword, byte_offset AS "offset", context',
+        "order": "rowid",
+        "filters": {"keyword": "keyword = ?", "text": "context LIKE '%' || ? || '%'"},
+    },
+}
+
+
+class RowSpool:
+    """
+    Filas completas de una tabla de detalle (montos, evidencias) grabadas por lotes en un
+    SQLite temporal mientras se escanea, en vez de acumularlas en memoria. En paralelo cada
+    rango graba su propio archivo y `extend` los agrega en orden de rango; `save_report`
+    copia el resultado al almacén.
+    """
+
+    def __init__(self, table, columns=None):
+        self.table = table
+        # Sin `columns` son las de la tabla del almacén; otras columnas sirven como spool de trabajo
+        self.columns = columns or DETAIL_TABLES[table]["insert"]
+        self.path = None
+        self.count = 0
+        self.rows = []
+        self._conn = None
+        # Solo el dueño del archivo lo borra: al viajar entre procesos pasa al que lo recibe
+        self._owned = False
+
+    def __len__(self):
+        return self.count + len(self.rows)
+
+    def add(self, *row):
+        self.rows.append(row)
+        if len(self.rows) >= SPOOL_FLUSH_ROWS:
+            self.flush()
+
+    def _open(self):
+        if self._conn is None:
+            if self.path is None:
+                fd, self.path = tempfile.mkstemp(prefix=f"spool_{self.table}_", suffix=".sqlite")
+                os.close(fd)
+                self._owned = True
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS rows ({', '.join(self.columns)})")
+        return self._conn
+
+    def flush(self):
+        if not self.rows:
+            return
+        conn = self._open()
+        with conn:
+            conn.executemany(f"INSERT INTO rows VALUES ({', '.join('?' * len(self.columns))})", self.rows)
+        self.count += len(self.rows)
+        self.rows.clear()
+
+    def __iter__(self):
+        """Filas en el orden en que se agregaron, leídas del archivo sin cargarlas todas"""
+        self.flush()
+        if not self.path:
+            return
+        conn = sqlite3.connect(self.path)
+        try:
+            yield from conn.execute("SELECT * FROM rows ORDER BY rowid")
+        finally:
+            conn.close()
+
+    def extend(self, other):
+        """Agrega las filas de un rango posterior (parcial de un worker) y borra su archivo"""
+        other.flush()
+        if self.path is None and not self.rows:
+            # Primer parcial: se adopta su archivo sin copiarlo
+            self.path, self.count, self._owned = other.path, other.count, other._owned
+            other.close()
+            other.path, other.count, other._owned = None, 0, False
+            return
+        self.flush()
+        if other.path:
+            conn = self._open()
+            conn.execute("ATTACH DATABASE ? AS part", (other.path,))
+            with conn:
+                conn.execute("INSERT INTO rows SELECT * FROM part.rows ORDER BY rowid")
+            conn.execute("DETACH DATABASE part")
+            self.count += other.count
+        other.discard()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def discard(self):
+        """Cierra y borra el archivo temporal"""
+        self.close()
+        if self.path and self._owned:
+            Path(self.path).unlink(missing_ok=True)
+        self.path, self.count, self._owned = None, 0, False
+        self.rows.clear()
+
+    def __getstate__(self):
+        # Entre procesos solo viaja la ruta: lo pendiente se graba antes y el archivo pasa al receptor
+        self.flush()
+        self.close()
+        state = dict(self.__dict__, _conn=None)
+        self._owned = False
+        return state
+
+    def __del__(self):
+        if self._owned:
+            self.discard()
+
+
+def _connect(path):
+    conn = sqlite3.connect(str(path), timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def save_report(path, report, summary, **details):
+    """
+    Reemplaza el reporte `report` del almacén en una sola transacción: cada sección de
+    `summary` es una fila JSON y cada `details[tabla]` un iterable de tuplas completas
+    o un RowSpool grabado durante el escaneo.
+    """
+    unknown = set(details) - set(DETAIL_TABLES)
+    if unknown:
+        raise ValueError(f"Tablas de detalle desconocidas: {sorted(unknown)}")
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = _connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        for table, rows in details.items():
+            if isinstance(rows, RowSpool):
+                rows.flush()
+                rows.close()
+                if rows.path:
+                    conn.execute(f"ATTACH DATABASE ? AS spool_{table}", (rows.path,))
+        with conn:
+            conn.execute("DELETE FROM summary WHERE report = ?", (report,))
+            conn.executemany("INSERT INTO summary (report, section, value) VALUES (?, ?, ?)",
+                             [(report, section, json.dumps(value, ensure_ascii=False, default=str))
+                              for section, value in summary.items()])
+            for table, spec in DETAIL_TABLES.items():
+                conn.execute(f"DELETE FROM {table} WHERE report = ?", (report,))
+                if table not in details:
+                    continue
+                columns = ", ".join(("report",) + spec["insert"])
+                rows = details[table]
+                if isinstance(rows, RowSpool):
+                    # Copia directa entre archivos SQLite, en el orden en que se grabaron
+                    if rows.path:
+                        conn.execute(f"INSERT OR IGNORE INTO {table} ({columns}) SELECT ?, {', '.join(spec['insert'])} "
+                                     f"FROM spool_{table}.rows ORDER BY rowid", (report,))
+                    continue
+                marks = ", ".join("?" * (len(spec["insert"]) + 1))
+                conn.executemany(f"INSERT OR IGNORE INTO {table} ({columns}) VALUES ({marks})",
+                                 ((report,) + tuple(row) for row in rows))
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE report = ?", (report,)).fetchone()[0]
+                  for table in details}
+    finally:
+        conn.close()
+    return counts
+
+
+def read_summary(path, report):
+    """Secciones de resumen de un reporte como dict (vacío si el reporte no está)"""
+    conn = _connect(path)
+    try:
+        rows = conn.execute("SELECT section, value FROM summary WHERE report = ?", (report,)).fetchall()
+    finally:
+        conn.close()
+    return {section: json.loads(value) for section, value in rows}
+
+
+def read_page(path, report, table, page=1, page_size=DEFAULT_PAGE_SIZE, **filters):
+    """Página `page` (desde 1) de una tabla de detalle, con filtros de DETAIL_TABLES[table]"""
+    spec = DETAIL_TABLES[table]
+    unknown = set(filters) - set(spec["filters"])
+    if unknown:
+        raise ValueError(f"Filtros no soportados en {table}: {sorted(unknown)}")
+    page = max(1, int(page))
+    page_size = min(max(1, int(page_size)), MAX_PAGE_SIZE)
+    where = ["report = ?"]
+    params = [report]
+    for name, value in filters.items():
+        if value is not None:
+            where.append(spec["filters"][name])
+            params.append(value)
+    where = " AND ".join(where)
+
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        total = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}", params).fetchone()[0]
+        rows = conn.execute(f"SELECT {spec['select']} FROM {table} WHERE {where} ORDER BY {spec['order']} "
+                            f"LIMIT ? OFFSET ?", params + [page_size, (page - 1) * page_size]).fetchall()
+    finally:
+        conn.close()
+    return {"table": table, "total": total, "page": page, "page_size": page_size, "rows": [dict(row) for row in rows]}
+
+
+def iter_rows(path, report, table):
+    """Todas las filas de una tabla de detalle en su orden, leídas del almacén sin paginar"""
+    spec = DETAIL_TABLES[table]
+    conn = _connect(path)
+    try:
+        yield from conn.execute(f"SELECT {', '.join(spec['insert'])} FROM {table} WHERE report = ? "
+                                f"ORDER BY {spec['order']}", (report,))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consulta del almacén de resultados (resumen o detalle paginado)")
+    parser.add_argument("store", help="Archivo results_<slug>.sqlite")
+    parser.add_argument("--report", required=True, help="Reporte: data, anomalies o payroll")
+    parser.add_argument("--table", choices=sorted(DETAIL_TABLES), default=None, help="Tabla de detalle (por defecto: resumen)")
+    parser.add_argument("--page", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--filter", action="append", default=[], metavar="NOMBRE=VALOR",
+                        help="Filtro de la tabla (ej. keyword=efectivo, min_cents=100000)")
+    args = parser.parse_args()
+
+    if args.table:
+        filters = dict(item.split("=", 1) for item in args.filter)
+        result = read_page(args.store, args.report, args.table, page=args.page, page_size=args.page_size, **filters)
+    else:
+        result = read_summary(args.store, args.report)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
@@ -0,0 +1,116 @@
+from datetime import date
+
+# Tipos de RFC
+FISICA = 'fisica'    # 4 letras + fecha + homoclave (13)
+MORAL = 'moral'      # 3 letras + fecha + homoclave (12)
+GENERICO = 'generico'  # RFCs genéricos del SAT (público en general / extranjeros)
+RFC_TYPES = (FISICA, MORAL, GENERICO)
+
+GENERIC_RFCS = {'XAXX010101000', 'XEXX010101000'}
+
+VALIDATOR_VERSION = 1
+
+# Valor de cada carácter para el dígito verificador (algoritmo del SAT, módulo 11)
+CHECK_VALUES = {c: i for i, c in enumerate('0123456789ABCDEFGHIJKLMN&OPQRSTUVWXYZ Ñ')}
+# Mismo mapa indexado por byte (ASCII); -1 = carácter no válido en un RFC
+_BYTE_VALUES = [-1] * 256
+for _char, _value in CHECK_VALUES.items():
+    if ord(_char) < 128:
+        _BYTE_VALUES[ord(_char)] = _value
+_LETTERS = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ&')
+_HOMOCLAVE = frozenset(b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+MEMO_LIMIT = 1 << 20
+
+
+def check_digit(rfc):
+    """Dígito verificador esperado para un RFC (str o bytes); las morales se completan con un espacio al inicio"""
+    if isinstance(rfc, str):
+        rfc = rfc.encode('ascii')
+    base = rfc[:-1].rjust(12)
+    total = 0
+    for weight, byte in zip(range(13, 1, -1), base):
+        total += _BYTE_VALUES[byte] * weight
+    remainder = total % 11
+    if remainder == 0:
+        return '0'
+    digit = 11 - remainder
+    return 'A' if digit == 10 else str(digit)
+
+
+def _valid_date(yy, mm, dd):
+    # El siglo no viene en el RFC: basta con que la fecha exista en 19xx o 20xx (29 de febrero)
+    for century in (2000, 1900):
+        try:
+            date(century + yy, mm, dd)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def classify(rfc):
+    """
+    Valida estructura, fecha de nacimiento/constitución y dígito verificador.
+    Devuelve FISICA, MORAL o GENERICO, o None si no es un RFC real.
+    """
+    if isinstance(rfc, str):
+        try:
+            rfc = rfc.strip().upper().encode('ascii')
+        except UnicodeEncodeError:
+            return None
+    if rfc.decode('ascii', errors='replace') in GENERIC_RFCS:
+        return GENERICO
+    size = len(rfc)
+    if size == 13:
+        kind = FISICA
+    elif size == 12:
+        kind = MORAL
+    else:
+        return None
+    letters = size - 9
+    if any(byte not in _LETTERS for byte in rfc[:letters]):
+        return None
+    digits = rfc[letters:letters + 6]
+    if not digits.isdigit():
+        return None
+    if not _valid_date(int(digits[:2]), int(digits[2:4]), int(digits[4:])):
+        return None
+    if any(byte not in _HOMOCLAVE for byte in rfc[-3:]):
+        return None
+    if check_digit(rfc) != chr(rfc[-1]):
+        return None
+    return kind
+
+
+def is_valid(rfc):
+    return classify(rfc) is not None
+
+
+class RFCFilter:
+    """
+    Filtro por lotes para los matches del escaneo: los mismos RFCs se repiten miles de
+    veces en un respaldo, así que cada valor distinto se valida una sola vez (memo acotado).
+    """
+
+    def __init__(self, types=RFC_TYPES):
+        self.types = frozenset(types)
+        self.memo = {}
+        self.checked = 0
+        self.rejected = 0
+
+    def accepts(self, value):
+        memo = self.memo
+        accepted = memo.get(value)
+        if accepted is None:
+            if len(memo) >= MEMO_LIMIT:
+                memo.clear()
+            accepted = memo[value] = classify(value) in self.types
+        self.checked += 1
+        if not accepted:
+            self.rejected += 1
+        return accepted
+
+    def filter(self, values):
+        """Solo los valores que son RFCs reales del tipo pedido"""
+        return [value for value in values if self.accepts(value)]
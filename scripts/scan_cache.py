@@ -0,0 +1,200 @@
+import hashlib
+import os
+import sqlite3
+from array import array
+from datetime import datetime
+
+# 2: los consumidores que comparten stream_key graban un solo flujo (antes se duplicaba)
+CACHE_VERSION = 2
+DEFAULT_CACHE_PATH = os.environ.get("AUDITOR_SCAN_CACHE", "scan_cache.sqlite")
+
+SAMPLE_BLOCKS = 16
+SAMPLE_BLOCK_SIZE = 64 * 1024
+FLUSH_ROWS = 20000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS streams (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    stream_key TEXT NOT NULL,
+    kind TEXT,
+    bak_path TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    match_count INTEGER NOT NULL DEFAULT 0,
+    windows BLOB,
+    created_at TEXT,
+    UNIQUE (fingerprint, stream_key)
+);
+CREATE TABLE IF NOT EXISTS matches (
+    stream_id INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    value BLOB,
+    context BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_matches_stream ON matches (stream_id, offset);
+"""
+
+
+def fingerprint(file_path, blocks=SAMPLE_BLOCKS, block_size=SAMPLE_BLOCK_SIZE, include_mtime=True):
+    """
+    Huella rápida del contenido de un respaldo: tamaño, mtime y hash de bloques
+    muestreados a lo largo del archivo (no se lee el .bak completo).
+    Sin mtime, dos copias del mismo respaldo tienen la misma huella.
+    """
+    stat = os.stat(file_path)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{stat.st_size}:{stat.st_mtime_ns if include_mtime else ''}".encode('ascii'))
+    with open(file_path, 'rb') as f:
+        last_start = max(0, stat.st_size - block_size)
+        for i in range(blocks):
+            f.seek(last_start * i // max(1, blocks - 1))
+            digest.update(f.read(block_size))
+    return digest.hexdigest()
+
+
+def stream_key(consumer):
+    """Identifica el flujo de matches de un consumidor (patrón, grupo, keywords, límites)"""
+    return hashlib.blake2b(repr((CACHE_VERSION,) + consumer.cache_key()).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ScanCache:
+    """
+    Caché persistente (SQLite) de los flujos crudos de matches por consumidor,
+    indexada por la huella del respaldo. Si todos los consumidores de un escaneo
+    ya tienen su flujo completo, el ScanEngine los reproduce sin releer el .bak.
+    """
+
+    def __init__(self, db_path=DEFAULT_CACHE_PATH):
+        self.db_path = str(db_path)
+        self.conn = _connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def lookup(self, fp, consumers):
+        """Devuelve {índice: stream_id} de los consumidores con flujo completo en caché"""
+        found = {}
+        for i, consumer in enumerate(consumers):
+            row = self.conn.execute(
+                "SELECT id FROM streams WHERE fingerprint = ? AND stream_key = ? AND complete = 1",
+                (fp, stream_key(consumer))
+            ).fetchone()
+            if row:
+                found[i] = row[0]
+        return found
+
+    def begin(self, fp, bak_path, consumers):
+        """Prepara flujos vacíos para grabar; devuelve {índice: stream_id}"""
+        streams = {}
+        for i, consumer in enumerate(consumers):
+            key = stream_key(consumer)
+            row = self.conn.execute(
+                "SELECT id FROM streams WHERE fingerprint = ? AND stream_key = ?", (fp, key)
+            ).fetchone()
+            if row:
+                # Flujo incompleto de un escaneo interrumpido: se descarta
+                self.conn.execute("DELETE FROM matches WHERE stream_id = ?", (row[0],))
+                self.conn.execute("UPDATE streams SET complete = 0, match_count = 0, windows = NULL WHERE id = ?",
+                                  (row[0],))
+                streams[i] = row[0]
+            else:
+                streams[i] = self.conn.execute(
+                    "INSERT INTO streams (fingerprint, stream_key, kind, bak_path, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (fp, key, consumer.kind, str(bak_path), datetime.now().isoformat())
+                ).lastrowid
+        self.conn.commit()
+        return streams
+
+    def complete(self, streams, windows):
+        """Marca los flujos grabados como completos junto con los límites de ventana del escaneo"""
+        blob = array('q', windows).tobytes()
+        for stream_id in streams.values():
+            count = self.conn.execute("SELECT COUNT(*) FROM matches WHERE stream_id = ?", (stream_id,)).fetchone()[0]
+            self.conn.execute("UPDATE streams SET complete = 1, match_count = ?, windows = ? WHERE id = ?",
+                              (count, blob, stream_id))
+        self.conn.commit()
+
+    def replay(self, consumers, streams):
+        """
+        Reproduce los flujos guardados en los handlers de los consumidores.
+        Respeta el orden del escaneo: ventana por ventana, consumidor por consumidor.
+        Devuelve (matches reproducidos, offset alcanzado).
+        """
+        windows = set()
+        for stream_id in streams.values():
+            blob = self.conn.execute("SELECT windows FROM streams WHERE id = ?", (stream_id,)).fetchone()[0]
+            if blob:
+                ends = array('q')
+                ends.frombytes(blob)
+                windows.update(ends)
+        windows = sorted(windows)
+
+        cursors = []
+        for i, consumer in enumerate(consumers):
+            rows = self.conn.execute(
+                "SELECT offset, value, context FROM matches WHERE stream_id = ? ORDER BY offset, rowid",
+                (streams[i],)
+            )
+            cursors.append([consumer, rows, next(rows, None)])
+
+        replayed = 0
+        for window_end in windows + [None]:
+            for entry in cursors:
+                consumer, rows, row = entry
+                while row is not None and (window_end is None or row[0] < window_end):
+                    consumer.replay_match(row[1], row[0], row[2])
+                    replayed += 1
+                    row = next(rows, None)
+                entry[2] = row
+        return replayed, (windows[-1] if windows else 0)
+
+
+class StreamRecorder:
+    """Graba los matches de cada consumidor en la caché mientras se escanea (por lotes)"""
+
+    def __init__(self, db_path, streams):
+        self.conn = _connect(db_path)
+        self.streams = streams
+        self.rows = []
+
+    def attach(self, consumers):
+        # Consumidores idénticos (mismo stream_key) comparten flujo: lo graba solo el primero
+        # y al reproducir cada uno lo lee completo
+        recorded = set()
+        for i, consumer in enumerate(consumers):
+            stream_id = self.streams.get(i)
+            if stream_id is not None and stream_id not in recorded:
+                recorded.add(stream_id)
+                consumer.on_match = self._wrap(stream_id, consumer.on_match)
+
+    def _wrap(self, stream_id, on_match):
+        rows = self.rows
+
+        def record(value, offset, context=None):
+            rows.append((stream_id, offset, bytes(value), context))
+            if context is None:
+                return on_match(value, offset)
+            return on_match(value, offset, context)
+
+        return record
+
+    def flush(self, force=False):
+        if not self.rows or (not force and len(self.rows) < FLUSH_ROWS):
+            return
+        self.conn.executemany("INSERT INTO matches (stream_id, offset, value, context) VALUES (?, ?, ?, ?)", self.rows)
+        self.conn.commit()
+        self.rows.clear()
+
+    def close(self):
+        self.flush(force=True)
+        self.conn.close()
+
+
+def _connect(db_path):
+    # WAL: los workers paralelos graban sus rangos mientras el proceso principal lee
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
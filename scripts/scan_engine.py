@@ -0,0 +1,336 @@
+import re
+import time
+import pickle
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from chunk_reader import DEFAULT_CHUNK_SIZE, DEFAULT_OVERLAP, DualScanner, open_reader
+from dual_encoding import ENCODINGS, narrow
+from keyword_automaton import KeywordAutomaton
+from scan_cache import ScanCache, StreamRecorder, fingerprint
+from rfc_validator import RFC_TYPES, VALIDATOR_VERSION, RFCFilter
+from streaming_stats import ProgressReporter
+
+# Patrones compartidos por todos los analizadores de respaldos .bak
+RFC_PATTERN = re.compile(rb'[A-Z&]{3,4}[0-9]{2}(0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])[A-Z0-9]{3}')
+AMOUNT_PATTERN = re.compile(rb'(?<![0-9])[0-9]{1,10}\.[0-9]{2}(?![0-9])')
+DATE_PATTERN = re.compile(
+    rb'20[0-9]{2}-(?:0[1-9]|1[0-2])-(?:0[1-9]|[12][0-9]|3[01])'
+    rb'|(?:0[1-9]|[12][0-9]|3[01])/(?:0[1-9]|1[0-2])/20[0-9]{2}'
+    rb'|20[0-9]{2}/(?:0[1-9]|1[0-2])/(?:0[1-9]|[12][0-9]|3[01])'
+    rb'|20[0-9]{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12][0-9]|3[01])'
+    rb'|(?:0[1-9]|1[0-2])/(?:0[1-9]|[12][0-9]|3[01])/20[0-9]{2}'
+)
+CFDI_ATTRIBUTE_PATTERN = re.compile(rb'(?:Total|SubTotal|Importe|ValorUnitario|Monto|Haber|Debe)="([0-9]+\.[0-9]+)"')
+PRINTABLE_PATTERN = re.compile(rb'[ -~]{4,}')
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_cents(value):
+    """Convierte un monto en bytes (ej. b'1234.5678') a centavos enteros, redondeando"""
+    whole, _, frac = bytes(value).partition(b'.')
+    frac = (frac + b'00')[:3]
+    cents = int(whole or b'0') * 100 + int(frac[:2])
+    return cents + 1 if frac[2:] >= b'5' else cents
+
+
+class PatternConsumer:
+    """
+    Consumidor registrado en el ScanEngine.
+    Recibe cada ventana leída y entrega los matches a `on_match(value, offset)`,
+    con `offset` absoluto dentro del respaldo. Por defecto reconoce texto de un byte
+    y UTF-16LE (NVARCHAR) en la misma pasada; los valores UTF-16 llegan normalizados a ASCII.
+    """
+
+    kind = 'pattern'
+    pattern = None
+    group = 0
+
+    def __init__(self, on_match, pattern=None, group=None, max_bytes=None, encodings=ENCODINGS):
+        self.on_match = on_match
+        if pattern is not None:
+            self.pattern = pattern
+        if group is not None:
+            self.group = group
+        # Límite opcional de bytes a escanear (None = archivo completo)
+        self.max_bytes = max_bytes
+        self._scanner = DualScanner(self.pattern, encodings)
+
+    @property
+    def encodings(self):
+        return self._scanner.encodings
+
+    def wants(self, offset):
+        return self.max_bytes is None or offset < self.max_bytes
+
+    def feed(self, window):
+        group = self.group
+        for offset, match, width in self._scanner.scan(window, limit=self.max_bytes):
+            self.on_match(narrow(match.group(group), width), offset)
+
+    def cache_key(self):
+        """Todo lo que determina el flujo de matches (llave de la caché de escaneo)"""
+        return (self.kind, self.pattern.pattern, self.pattern.flags, self.group, self.max_bytes, self.encodings)
+
+    def replay_match(self, value, offset, context=None):
+        self.on_match(value, offset)
+
+
+class RFCConsumer(PatternConsumer):
+    """
+    RFCs validados al escanear (fecha, dígito verificador y tipo): los falsos positivos
+    del binario no llegan a los conjuntos ni al análisis EFOS. `types=None` = sin validar.
+    """
+
+    kind = 'rfc'
+    pattern = RFC_PATTERN
+
+    def __init__(self, on_match, pattern=None, group=None, max_bytes=None, types=RFC_TYPES, encodings=ENCODINGS):
+        super().__init__(on_match, pattern=pattern, group=group, max_bytes=max_bytes, encodings=encodings)
+        self.types = tuple(sorted(types)) if types is not None else None
+        self.filter = RFCFilter(types) if types is not None else None
+
+    def feed(self, window):
+        if self.filter is None:
+            return super().feed(window)
+        accepts, on_match, group = self.filter.accepts, self.on_match, self.group
+        for offset, match, width in self._scanner.scan(window, limit=self.max_bytes):
+            value = narrow(match.group(group), width)
+            if accepts(value):
+                on_match(value, offset)
+
+    def cache_key(self):
+        return super().cache_key() + (self.types, VALIDATOR_VERSION if self.types else None)
+
+
+class AmountConsumer(PatternConsumer):
+    kind = 'amount'
+    pattern = AMOUNT_PATTERN
+
+
+class DateConsumer(PatternConsumer):
+    kind = 'date'
+    pattern = DATE_PATTERN
+
+
+class CFDIAttributeConsumer(PatternConsumer):
+    kind = 'cfdi_attribute'
+    pattern = CFDI_ATTRIBUTE_PATTERN
+    group = 1
+
+
+class StringConsumer(PatternConsumer):
+    kind = 'string'
+    pattern = PRINTABLE_PATTERN
+
+
+class KeywordConsumer(PatternConsumer):
+    """
+    Busca una lista de keywords literales con un KeywordAutomaton (una sola pasada).
+    Entrega `on_match(keyword, offset, context)` por cada ocurrencia de cada keyword
+    (incluidas las traslapadas), con una ventana de contexto de `context=(antes, después)` caracteres.
+    """
+
+    kind = 'keyword'
+
+    def __init__(self, on_match, keywords, ignore_case=False, context=(0, 0), max_bytes=None, encodings=ENCODINGS):
+        self.automaton = KeywordAutomaton(keywords, ignore_case=ignore_case)
+        super().__init__(on_match, pattern=self.automaton.pattern, max_bytes=max_bytes, encodings=encodings)
+        self.context = context
+
+    def feed(self, window):
+        before, after = self.context
+        data = window.data
+        for offset, match, width in self._scanner.scan(window, limit=self.max_bytes):
+            idx = match.start()
+            context = b''
+            if before or after:
+                # Solo se materializa el contexto de cada hit (data puede ser una vista mmap)
+                start = max(window.begin, idx - before * width)
+                start += (idx - start) % width
+                context = bytes(data[start:min(window.end, idx + after * width)])
+                if width == 2:
+                    # Contexto UTF-16LE alineado al hit: un byte por carácter
+                    context = context[::2]
+            for keyword in self.automaton.keywords_at(data, idx, window.end, width=width):
+                self.on_match(keyword, offset, context)
+
+    def cache_key(self):
+        return (self.kind, tuple(self.automaton.keywords), self.automaton.ignore_case, self.context, self.max_bytes,
+                self.encodings)
+
+    def replay_match(self, value, offset, context=None):
+        self.on_match(value, offset, context)
+
+
+class ScanEngine:
+    """
+    Motor de escaneo de una sola pasada.
+    Lee el respaldo .bak secuencialmente una vez y entrega cada bloque a todos
+    los consumidores registrados por los plugins (extractor, anomalías, nómina).
+    """
+
+    def __init__(self, bak_file_path, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, use_mmap=False,
+                 cache=None):
+        self.bak_file = bak_file_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        # mmap: ventanas sin copia sobre el respaldo mapeado en memoria
+        self.use_mmap = use_mmap
+        # Ruta de la caché SQLite de flujos de matches (None = sin caché)
+        self.cache = cache
+        self.plugins = []
+        self.consumers = []
+        self.windows = []
+        self._standalone = False
+        self._record = None
+
+    def register(self, plugin):
+        """Registra un plugin: cualquier objeto con `consumers()` y, opcionalmente, `finish()` y `merge()`"""
+        self.plugins.append(plugin)
+        self.consumers.extend(plugin.consumers())
+        return plugin
+
+    def add_consumer(self, consumer):
+        """Registra un consumidor suelto (sin plugin); solo se escanea en modo secuencial"""
+        self.consumers.append(consumer)
+        self._standalone = True
+        return consumer
+
+    def run(self, workers=1):
+        if not self.consumers:
+            return
+
+        start = time.time()
+        if self.cache and self.plugins and not self._standalone:
+            scanned = self._run_cached(workers)
+        else:
+            scanned = self._scan(workers)
+
+        for plugin in self.plugins:
+            finish = getattr(plugin, 'finish', None)
+            if finish:
+                finish()
+
+        print(f"✓ Escaneo de una pasada: {scanned / (1024*1024):.2f} MB en {time.time() - start:.1f}s")
+
+    def _scan(self, workers):
+        if workers > 1 and self.plugins and not self._standalone:
+            return self._run_parallel(workers)
+        return self.scan_range(0, None, report=True)
+
+    def _run_cached(self, workers):
+        """Reproduce los flujos guardados si el respaldo ya se escaneó; si no, escanea y los graba"""
+        cache = ScanCache(self.cache)
+        try:
+            fp = fingerprint(self.bak_file)
+            cached = cache.lookup(fp, self.consumers)
+            if len(cached) == len(self.consumers):
+                replayed, scanned = cache.replay(self.consumers, cached)
+                print(f"  ♻️ Caché de escaneo: {replayed} matches reproducidos sin releer el respaldo")
+                return scanned
+
+            streams = cache.begin(fp, self.bak_file, self.consumers)
+            self._record = (cache.db_path, streams)
+            scanned = self._scan(workers)
+            cache.complete(streams, self.windows)
+            print(f"  💾 Caché de escaneo actualizada: {Path(cache.db_path).name}")
+            return scanned
+        finally:
+            self._record = None
+            cache.close()
+
+    def scan_range(self, start=0, end=None, report=False):
+        """Escanea el rango [start, end) del respaldo; devuelve el offset alcanzado"""
+        progress = ProgressReporter(Path(self.bak_file).stat().st_size) if report else None
+        offset = start
+        recorder = None
+        if self._record:
+            recorder = StreamRecorder(*self._record)
+            recorder.attach(self.consumers)
+
+        reader = open_reader(self.bak_file, chunk_size=self.chunk_size, overlap=self.overlap,
+                             start=start, end=end, use_mmap=self.use_mmap)
+        for window in reader:
+            active = [c for c in self.consumers if c.wants(window.base + window.lo)]
+            if not active:
+                break
+            for consumer in active:
+                consumer.feed(window)
+            offset = window.base + window.hi
+            self.windows.append(offset)
+            if recorder:
+                recorder.flush()
+
+            if progress:
+                progress.update(offset - start)
+
+        if recorder:
+            recorder.close()
+        return offset
+
+    def split_ranges(self, workers):
+        """Divide el respaldo en rangos alineados a chunk_size (dos por worker)"""
+        total_size = Path(self.bak_file).stat().st_size
+        pieces = max(1, workers * 2)
+        step = -(-total_size // pieces)
+        step = max(self.chunk_size, -(-step // self.chunk_size) * self.chunk_size)
+        ranges = []
+        for range_start in range(0, total_size, step):
+            # Omitir rangos que ningún consumidor quiere (límites max_bytes)
+            if any(c.wants(range_start) for c in self.consumers):
+                ranges.append((range_start, min(range_start + step, total_size)))
+        return ranges
+
+    def _run_parallel(self, workers):
+        """
+        Escanea rangos de bytes (con traslape) en un ProcessPoolExecutor.
+        Cada worker recibe copias vacías de los plugins y devuelve su estado parcial;
+        los parciales se fusionan con `plugin.merge()` en orden de rango (determinista).
+        """
+        ranges = self.split_ranges(workers)
+        print(f"  ⚙️ Escaneo paralelo: {len(ranges)} rangos en {workers} procesos")
+        # Serializar una sola vez: los plugins se fusionan mientras otras tareas siguen en cola
+        payload = pickle.dumps(self.plugins)
+        progress = ProgressReporter(sum(range_end - range_start for range_start, range_end in ranges), every_bytes=1)
+        scanned = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_scan_range, self.bak_file, payload, range_start, range_end,
+                                self.chunk_size, self.overlap, self.use_mmap, self._record)
+                for range_start, range_end in ranges
+            ]
+            for future, (range_start, range_end) in zip(futures, ranges):
+                partials, reached, windows = future.result()
+                for plugin, partial in zip(self.plugins, partials):
+                    plugin.merge(partial)
+                self.windows.extend(windows)
+                scanned += reached - range_start
+                progress.update(scanned)
+        return scanned
+
+
+def _scan_range(bak_file_path, payload, start, end, chunk_size, overlap, use_mmap, record=None):
+    """Tarea de worker: escanea un rango con copias propias de los plugins (y graba sus matches si hay caché)"""
+    plugins = pickle.loads(payload)
+    engine = ScanEngine(bak_file_path, chunk_size=chunk_size, overlap=overlap, use_mmap=use_mmap)
+    engine._record = record
+    for plugin in plugins:
+        engine.register(plugin)
+    reached = engine.scan_range(start, end)
+    return plugins, reached, engine.windows
+
+
+def run_plugins(bak_file_path, plugins, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP, use_mmap=False, workers=1,
+                cache=None):
+    """
+    Ejecuta varios plugins sobre el mismo respaldo con una sola lectura (o en paralelo por rangos).
+    Con `cache` (ruta SQLite) un respaldo ya escaneado se reproduce desde la caché.
+    """
+    engine = ScanEngine(bak_file_path, chunk_size=chunk_size, overlap=overlap, use_mmap=use_mmap, cache=cache)
+    for plugin in plugins:
+        engine.register(plugin)
+    engine.run(workers=workers)
+    return engine
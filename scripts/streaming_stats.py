@@ -0,0 +1,132 @@
+import heapq
+import math
+import sys
+import time
+import zlib
+
+
+class RunningStats:
+    """
+    Conteo, suma, mínimo, máximo y promedio en línea (memoria O(1)).
+    La suma es exacta (parciales de Shewchuk, como math.fsum), así el promedio
+    no depende del orden en que se fusionan los parciales de cada worker.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._partials = []
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self._add_exact(value)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def _add_exact(self, x):
+        i = 0
+        for y in self._partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                self._partials[i] = lo
+                i += 1
+            x = hi
+        self._partials[i:] = [x]
+
+    @property
+    def total(self):
+        return math.fsum(self._partials)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def merge(self, other):
+        if not other.count:
+            return
+        self.count += other.count
+        for partial in other._partials:
+            self._add_exact(partial)
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+
+class Reservoir:
+    """
+    Muestra uniforme de tamaño fijo por prioridades hash (bottom-k).
+    Cada elemento se identifica por una llave estable y única (su offset en el
+    respaldo, o una tupla como (offset, keyword)):
+    se conservan los `size` elementos de menor prioridad, así la muestra es la
+    misma en escaneo secuencial o paralelo y la fusión de parciales es exacta.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.seen = 0
+        self._heap = []  # (-prioridad, llave, elemento): max-heap de las k menores
+
+    def add(self, item, key):
+        self.seen += 1
+        self._push(_priority(key), key, item)
+
+    def _push(self, priority, key, item):
+        entry = (-priority, key, item)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+        elif -self._heap[0][0] > priority:
+            heapq.heapreplace(self._heap, entry)
+
+    def merge(self, other):
+        self.seen += other.seen
+        for neg_priority, key, item in other._heap:
+            self._push(-neg_priority, key, item)
+
+    @property
+    def items(self):
+        """Elementos de la muestra ordenados por llave (orden de aparición)"""
+        return [item for _, _, item in sorted(self._heap, key=lambda entry: entry[1])]
+
+
+def _priority(key):
+    """Mezcla splitmix64: prioridad pseudoaleatoria y reproducible para una llave (int, str o tupla)"""
+    if isinstance(key, tuple):
+        z = 0
+        for part in key:
+            z = _priority(z ^ _priority(part))
+        return z
+    if isinstance(key, str):
+        key = zlib.crc32(key.encode('utf-8'))
+    z = (key + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return z ^ (z >> 31)
+
+
+class ProgressReporter:
+    """Reporta avance del escaneo con MB/s y tiempo estimado restante"""
+
+    def __init__(self, total_bytes, every_bytes=50 * 1024 * 1024, stream=sys.stdout):
+        self.total_bytes = total_bytes
+        self.every_bytes = every_bytes
+        self.stream = stream
+        self.start = time.time()
+        self.done = 0
+        self._next = every_bytes
+
+    def update(self, done_bytes):
+        self.done = done_bytes
+        if done_bytes < self._next:
+            return
+        self._next = done_bytes + self.every_bytes
+        elapsed = max(time.time() - self.start, 1e-6)
+        rate = done_bytes / elapsed
+        remaining = max(self.total_bytes - done_bytes, 0) / rate if rate else 0
+        pct = (done_bytes / self.total_bytes * 100) if self.total_bytes else 100
+        print(f"  ... Procesados {done_bytes / (1024*1024):.0f} MB de {self.total_bytes / (1024*1024):.0f} MB "
+              f"({pct:.1f}%) | {rate / (1024*1024):.1f} MB/s | ETA {remaining:.0f}s", file=self.stream)
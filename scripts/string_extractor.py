@@ -1,30 +1,153 @@
+import io
 import re
+import gzip
+import math
+import time
+import hashlib
+import argparse
+from collections import Counter
+from pathlib import Path
 
-def extract_strings(file_path, min_len=4):
-    with open(file_path, 'rb') as f:
-        # Leer por trozos para no saturar memoria
-        chunk_size = 1024 * 1024
-        while True:
-            data = f.read(chunk_size)
-            if not data:
-                break
-            # Buscar secuencias de caracteres imprimibles
-            yield from re.findall(rb'[ -~]{' + str(min_len).encode() + rb',}', data)
-
-# Prueba con Elizondo
-bak_path = r"C:\IA_nubes\auditorIA_1\ctTRANSPORTES_ELIZONDO_2024-20251024-1750\document_9aa3cd70-d41b-4905-8c9d-dc96db1a6e8a_content.bak"
-
-print(f"Buscando cadenas en {bak_path}...")
-count = 0
-with open('extracted_strings.txt', 'w', encoding='utf-8') as out:
-    for s in extract_strings(bak_path):
-        try:
-            line = s.decode('ascii')
-            out.write(line + '\n')
-            count += 1
-            if count > 10000: # Limitar para la prueba
-                break
-        except:
-            pass
-
-print(f"Se extrajeron {count} cadenas potenciales.")
+from chunk_reader import DEFAULT_OVERLAP, WindowScanner, iter_matches, open_reader
+from dedupe import ExactIntSet
+from streaming_stats import ProgressReporter
+
+# zstd es más rápido y comprime mejor si está instalado; gzip (stdlib) como respaldo
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FULL_CHUNK_SIZE = 16 * 1024 * 1024
+WRITE_BUFFER = 8 * 1024 * 1024
+MIN_LEN = 4
+MAX_LEN = 1024
+MIN_ENTROPY = 1.5  # Bits por carácter: descarta relleno como "--------" o "AAAAAA"
+DEDUPE_MB = 512
+
+ASCII = 'a'
+UTF16 = 'u'
+
+
+# Letras acentuadas del español en latin-1 (á é í ó ú ñ ü y mayúsculas): el resto de bytes altos es ruido binario
+SPANISH_LATIN1 = rb'\xc1\xc9\xcd\xd1\xd3\xda\xdc\xe1\xe9\xed\xf1\xf3\xfa\xfc'
+
+
+def string_pattern(min_len=MIN_LEN):
+    """
+    Texto de un byte (VARCHAR, latin-1) o UTF-16LE (NVARCHAR) en una sola alternativa: la rama
+    UTF-16 va primero, así 'N\\x00O\\x00' no se corta en letras sueltas. Ambas admiten acentos (á, é, ñ).
+    """
+    n = str(min_len).encode()
+    chars = rb'[ -~' + SPANISH_LATIN1 + rb']'
+    return re.compile(rb'(?P<u>(?:' + chars + rb'\x00){' + n + rb',})|(?P<a>' + chars + rb'{' + n + rb',})')
+
+
+def extract_strings(file_path, min_len=4, chunk_size=1024 * 1024, overlap=DEFAULT_OVERLAP):
+    # Buscar secuencias de caracteres imprimibles
+    pattern = re.compile(rb'[ -~]{' + str(min_len).encode() + rb',}')
+    # Leer por trozos (con traslape) para no saturar memoria
+    for offset, s in iter_matches(file_path, pattern, chunk_size=chunk_size, overlap=overlap):
+        yield s
+
+
+def entropy(text):
+    """Entropía de Shannon en bits por carácter"""
+    size = len(text)
+    return -sum(count / size * math.log2(count / size) for count in Counter(text).values())
+
+
+def _string_hash(text):
+    # Hash de 64 bits con signo para el ExactIntSet (8 bytes por cadena en vez del str completo)
+    value = int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+    return value if value != -(2 ** 63) else 0
+
+
+def open_output(path):
+    """Salida binaria comprimida por extensión (.zst, .gz o texto plano) con un búfer grande"""
+    suffix = Path(path).suffix.lower()
+    if suffix == '.zst':
+        if zstandard is None:
+            raise RuntimeError("La salida .zst requiere zstandard (pip install zstandard)")
+        raw = zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+    elif suffix == '.gz':
+        raw = gzip.open(path, 'wb', compresslevel=6)
+    else:
+        raw = open(path, 'wb')
+    return io.BufferedWriter(raw, buffer_size=WRITE_BUFFER)
+
+
+def iter_unique_strings(file_path, min_len=MIN_LEN, max_len=MAX_LEN, min_entropy=MIN_ENTROPY,
+                        dedupe_mb=DEDUPE_MB, chunk_size=FULL_CHUNK_SIZE, stats=None, progress=None):
+    """
+    Genera (offset, codificación, texto) de cada cadena única de todo el respaldo, en una pasada.
+    Filtra por longitud (en caracteres) y entropía; la primera aparición es la que se reporta.
+    """
+    stats = stats if stats is not None else {}
+    for key in ('matches', 'unique', 'filtered'):
+        stats.setdefault(key, 0)
+    seen = ExactIntSet(max_bytes=dedupe_mb * 1024 * 1024)
+    scanner = WindowScanner(string_pattern(min_len))
+    reader = open_reader(file_path, chunk_size=chunk_size, overlap=max(DEFAULT_OVERLAP, 2 * max_len))
+    for window in reader:
+        for offset, match in scanner.scan(window):
+            stats['matches'] += 1
+            raw = match.group()
+            if match.lastgroup == UTF16:
+                encoding, text = UTF16, bytes(raw).decode('utf-16-le')
+            else:
+                encoding, text = ASCII, bytes(raw).decode('latin-1')
+            text = text.strip()
+            if not min_len <= len(text) <= max_len:
+                stats['filtered'] += 1
+                continue
+            if not seen.add(_string_hash(text)):
+                continue
+            if entropy(text) < min_entropy:
+                stats['filtered'] += 1
+                continue
+            stats['unique'] += 1
+            yield offset, encoding, text
+        if progress:
+            progress.update(window.base + window.hi)
+
+
+def extract_to_file(file_path, output_path, **options):
+    """Escribe `offset<TAB>codificación<TAB>texto` por cadena única; devuelve estadísticas"""
+    stats = {}
+    start = time.time()
+    progress = ProgressReporter(Path(file_path).stat().st_size)
+    out = open_output(output_path)
+    try:
+        lines = []
+        for offset, encoding, text in iter_unique_strings(file_path, stats=stats, progress=progress, **options):
+            # El patrón no admite tabs ni saltos de línea: una cadena por línea sin escapar
+            lines.append(f"{offset}\t{encoding}\t{text}\n")
+            if len(lines) >= 4096:
+                out.write(''.join(lines).encode('utf-8'))
+                lines = []
+        out.write(''.join(lines).encode('utf-8'))
+    finally:
+        out.close()
+    stats['seconds'] = round(time.time() - start, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    # Prueba con Elizondo
+    bak_path = r"C:\IA_nubes\auditorIA_1\ctTRANSPORTES_ELIZONDO_2024-20251024-1750\document_9aa3cd70-d41b-4905-8c9d-dc96db1a6e8a_content.bak"
+
+    parser = argparse.ArgumentParser(description="Cadenas únicas (ASCII y UTF-16LE) de un respaldo completo")
+    parser.add_argument("bak_path", nargs="?", default=bak_path)
+    parser.add_argument("--output", default="extracted_strings.tsv.gz", help="Salida: .gz, .zst o texto plano")
+    parser.add_argument("--min-len", type=int, default=MIN_LEN, help="Longitud mínima en caracteres")
+    parser.add_argument("--max-len", type=int, default=MAX_LEN, help="Longitud máxima en caracteres")
+    parser.add_argument("--min-entropy", type=float, default=MIN_ENTROPY, help="Entropía mínima (bits por carácter)")
+    parser.add_argument("--dedupe-mb", type=int, default=DEDUPE_MB, help="Presupuesto de memoria del dedupe en MB")
+    args = parser.parse_args()
+
+    print(f"Buscando cadenas en {args.bak_path}...")
+    stats = extract_to_file(args.bak_path, args.output, min_len=args.min_len, max_len=args.max_len,
+                            min_entropy=args.min_entropy, dedupe_mb=args.dedupe_mb)
+    print(f"Se extrajeron {stats['unique']} cadenas únicas de {stats['matches']} encontradas "
+          f"({stats['filtered']} filtradas) en {stats['seconds']}s -> {args.output}")
@@ -0,0 +1,236 @@
+import json
+import struct
+import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from pathlib import Path
+
+from scan_engine import AmountConsumer, DateConsumer, EPOCH_ORDINAL, parse_cents, run_plugins
+from scan_cache import DEFAULT_CACHE_PATH
+
+# Código de formato de cada registro (1 byte en la columna `formats`)
+FMT_AMOUNT = 0
+FMT_ISO = 1        # 2024-01-31
+FMT_DMY = 2        # 31/01/2024 (formato mexicano)
+FMT_YMD = 3        # 2024/01/31
+FMT_COMPACT = 4    # 20240131
+FMT_MDY = 5        # 01/31/2024 (solo si el segundo campo no puede ser mes)
+FORMAT_NAMES = {FMT_AMOUNT: 'amount', FMT_ISO: 'iso', FMT_DMY: 'dmy', FMT_YMD: 'ymd',
+                FMT_COMPACT: 'compact', FMT_MDY: 'mdy'}
+
+# Una fecha se asocia al monto si aparece dentro de estos bytes antes de él (mismo registro)
+DATE_LINK_BYTES = 512
+NO_DATE = -1
+
+MAGIC = b'TYPEDREC'
+
+
+def parse_date(value):
+    """
+    Normaliza una fecha de DATE_PATTERN a (días desde 1970-01-01, código de formato), o None.
+    El formato se deduce de la forma del valor: el patrón ya resolvió la alternativa en su única pasada.
+    """
+    value = bytes(value)
+    try:
+        if len(value) == 8:
+            fmt, year, month, day = FMT_COMPACT, int(value[:4]), int(value[4:6]), int(value[6:])
+        elif value[4:5] == b'-':
+            fmt, year, month, day = FMT_ISO, int(value[:4]), int(value[5:7]), int(value[8:10])
+        elif value[4:5] == b'/':
+            fmt, year, month, day = FMT_YMD, int(value[:4]), int(value[5:7]), int(value[8:10])
+        else:
+            first, second, year = int(value[:2]), int(value[3:5]), int(value[6:10])
+            if second > 12:
+                fmt, day, month = FMT_MDY, second, first
+            else:
+                fmt, day, month = FMT_DMY, first, second
+        return date(year, month, day).toordinal() - EPOCH_ORDINAL, fmt
+    except ValueError:
+        return None
+
+
+def nearest_before(offsets, anchor_offsets, anchor_values, link_bytes, missing=NO_DATE):
+    """
+    Para cada offset, el valor del ancla más cercana antes de él (ambas columnas ordenadas
+    por offset) si está a no más de `link_bytes`; si no, `missing`.
+    """
+    linked = array('q')
+    for offset in offsets:
+        i = bisect_right(anchor_offsets, offset) - 1
+        linked.append(anchor_values[i] if i >= 0 and offset - anchor_offsets[i] <= link_bytes else missing)
+    return linked
+
+
+def link_nearest(events, anchors, link_bytes, missing=NO_DATE):
+    """
+    `nearest_before` en flujo: `events` y `anchors` son iterables de (offset, valor) ordenados
+    por offset (ej. un RowSpool); genera (offset, valor, ancla) con memoria constante.
+    """
+    anchors = iter(anchors)
+    current = None
+    upcoming = next(anchors, None)
+    for offset, value in events:
+        while upcoming is not None and upcoming[0] <= offset:
+            current = upcoming
+            upcoming = next(anchors, None)
+        linked = current[1] if current is not None and offset - current[0] <= link_bytes else missing
+        yield offset, value, linked
+
+
+def day_to_iso(days):
+    return None if days == NO_DATE else date.fromordinal(days + EPOCH_ORDINAL).isoformat()
+
+
+def iso_to_day(text):
+    return date.fromisoformat(text).toordinal() - EPOCH_ORDINAL
+
+
+class TypedColumns:
+    """
+    Registros tipados en columnas `array` (17 bytes por registro, sin objetos de Python):
+    offset en el respaldo, valor entero (centavos o día) y código de formato.
+    """
+
+    def __init__(self):
+        self.offsets = array('q')
+        self.values = array('q')
+        self.formats = array('b')
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, offset, value, fmt):
+        self.offsets.append(offset)
+        self.values.append(value)
+        self.formats.append(fmt)
+
+    def extend(self, other):
+        self.offsets.extend(other.offsets)
+        self.values.extend(other.values)
+        self.formats.extend(other.formats)
+
+    def write(self, f):
+        f.write(struct.pack('<Q', len(self)))
+        for column in (self.offsets, self.values, self.formats):
+            column.tofile(f)
+
+    @classmethod
+    def read(cls, f):
+        columns = cls()
+        count = struct.unpack('<Q', f.read(8))[0]
+        for column in (columns.offsets, columns.values, columns.formats):
+            column.fromfile(f, count)
+        return columns
+
+
+class TypedExtractor:
+    """
+    Plugin del ScanEngine: montos (centavos) y fechas (días) del respaldo como columnas
+    tipadas ordenadas por offset. Cada monto queda ligado a la fecha más cercana antes de él,
+    así las etapas siguientes filtran por periodo con bisect sin volver a parsear.
+    """
+
+    def __init__(self, bak_file_path=None, max_bytes=None):
+        self.bak_file = bak_file_path
+        self.max_bytes = max_bytes
+        self.amounts = TypedColumns()
+        self.dates = TypedColumns()
+        self._amount_days = None
+        self._period_index = None
+
+    def consumers(self):
+        return [
+            AmountConsumer(self._on_amount, max_bytes=self.max_bytes),
+            DateConsumer(self._on_date, max_bytes=self.max_bytes),
+        ]
+
+    def _on_amount(self, value, offset):
+        cents = parse_cents(value)
+        if cents > 0:
+            self.amounts.append(offset, cents, FMT_AMOUNT)
+
+    def _on_date(self, value, offset):
+        parsed = parse_date(value)
+        if parsed is not None:
+            self.dates.append(offset, parsed[0], parsed[1])
+
+    def merge(self, other):
+        # Los parciales llegan en orden de rango: las columnas siguen ordenadas por offset
+        self.amounts.extend(other.amounts)
+        self.dates.extend(other.dates)
+
+    def finish(self):
+        print(f"✓ Registros tipados: {len(self.amounts)} montos, {len(self.dates)} fechas")
+
+    def amount_days(self, link_bytes=DATE_LINK_BYTES):
+        """Día de la fecha más cercana antes de cada monto, o NO_DATE (columna calculada una vez)"""
+        if self._amount_days is not None and link_bytes == DATE_LINK_BYTES:
+            return self._amount_days
+        days = nearest_before(self.amounts.offsets, self.dates.offsets, self.dates.values, link_bytes)
+        if link_bytes == DATE_LINK_BYTES:
+            self._amount_days = days
+        return days
+
+    def _index(self):
+        # Posiciones de los montos ordenadas por día: cada periodo es un rango contiguo
+        if self._period_index is None:
+            days = self.amount_days()
+            order = sorted(range(len(days)), key=days.__getitem__)
+            self._period_index = (array('q', order), array('q', (days[i] for i in order)))
+        return self._period_index
+
+    def amounts_in_period(self, start_day, end_day):
+        """Posiciones (en `amounts`) de los montos fechados entre start_day y end_day, inclusive"""
+        order, sorted_days = self._index()
+        return order[bisect_left(sorted_days, start_day):bisect_right(sorted_days, end_day)]
+
+    def dates_in_period(self, start_day, end_day):
+        """Posiciones (en `dates`) de las fechas dentro del periodo"""
+        values = self.dates.values
+        return [i for i in range(len(values)) if start_day <= values[i] <= end_day]
+
+    def save(self, path):
+        """Columnas en un archivo binario compacto para etapas posteriores (sin reescanear ni reparsear)"""
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            self.amounts.write(f)
+            self.dates.write(f)
+
+    @classmethod
+    def load(cls, path):
+        extractor = cls()
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} no es un archivo de registros tipados")
+            extractor.amounts = TypedColumns.read(f)
+            extractor.dates = TypedColumns.read(f)
+        return extractor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Montos y fechas tipados (offset, centavos/día, formato) de un respaldo .bak")
+    parser.add_argument("bak_path")
+    parser.add_argument("--output", default=None, help="Archivo de columnas (por defecto: <respaldo>.typed)")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para escaneo paralelo por rangos")
+    parser.add_argument("--max-mb", type=int, default=None, help="Limitar el escaneo a los primeros N MB (por defecto: completo)")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Caché SQLite de matches por huella del respaldo")
+    parser.add_argument("--no-cache", action="store_true", help="Reescanear sin usar ni actualizar la caché")
+    parser.add_argument("--start", default=None, help="Inicio del periodo a resumir (YYYY-MM-DD)")
+    parser.add_argument("--end", default=None, help="Fin del periodo a resumir (YYYY-MM-DD)")
+    args = parser.parse_args()
+    output_path = args.output or str(Path(args.bak_path).with_suffix('.typed'))
+
+    extractor = TypedExtractor(args.bak_path, max_bytes=args.max_mb * 1024 * 1024 if args.max_mb else None)
+    run_plugins(args.bak_path, [extractor], workers=args.workers, cache=None if args.no_cache else args.cache)
+    extractor.save(output_path)
+    print(f"💾 Columnas guardadas en: {output_path} ({Path(output_path).stat().st_size / (1024 * 1024):.2f} MB)")
+
+    if args.start or args.end:
+        start = iso_to_day(args.start) if args.start else NO_DATE + 1
+        end = iso_to_day(args.end) if args.end else 1 << 30
+        positions = extractor.amounts_in_period(start, end)
+        values = extractor.amounts.values
+        total = sum(values[i] for i in positions)
+        print(json.dumps({"period": [args.start, args.end], "amounts": len(positions), "total": total / 100},
+                         ensure_ascii=False))
@@ -1,18 +1,47 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
-import path from 'path';
+import { resolveReport } from '@/lib/reports';
+import { firstRows, isDetailTable, readPage, readSummary } from '@/lib/resultStore';
 
 export async function GET(request: Request) {
     const { searchParams } = new URL(request.url);
     const company = searchParams.get('company');
 
     try {
-        // Definir la ruta del reporte de anomalías dinámicamente
-        const isMajoba = company?.includes('Majoba');
-        const filename = isMajoba ? 'anomaly_report_majoba.json' : 'anomaly_report_elizondo.json';
-        const reportPath = path.join(process.cwd(), filename);
+        // Almacén de resultados: detalle completo paginado (?table=...) o resumen con la primera página
+        const storePath = resolveReport(company, 'store');
+        if (storePath && fs.existsSync(storePath)) {
+            const table = searchParams.get('table');
+            if (table) {
+                if (!isDetailTable(table)) {
+                    return NextResponse.json({ error: `Unknown table: ${table}` }, { status: 400 });
+                }
+                return NextResponse.json({
+                    success: true,
+                    ...readPage(storePath, 'anomalies', table, searchParams),
+                    timestamp: new Date().toISOString()
+                });
+            }
+            const summary = readSummary(storePath, 'anomalies');
+            if (summary) {
+                summary.suspicious_concepts.samples = firstRows(storePath, 'anomalies', 'evidence', 20).map(row => ({
+                    keyword: row.keyword,
+                    offset: row.offset,
+                    text: row.context,
+                    category: 'Riesgo Fiscal/Contable'
+                }));
+                return NextResponse.json({
+                    success: true,
+                    data: summary,
+                    timestamp: new Date().toISOString()
+                });
+            }
+        }
+
+        // Reporte de anomalías de la empresa según reports/index.json (o el archivo histórico)
+        const reportPath = resolveReport(company, 'anomalies');
 
-        if (!fs.existsSync(reportPath)) {
+        if (!reportPath || !fs.existsSync(reportPath)) {
             return NextResponse.json({
                 found: false,
                 message: 'No anomaly report found'
@@ -1,16 +1,44 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
-import path from 'path';
+import { resolveReport } from '@/lib/reports';
+import { firstRows, isDetailTable, readPage, readSummary } from '@/lib/resultStore';
 
 export async function GET(request: Request) {
     const { searchParams } = new URL(request.url);
     const company = searchParams.get('company');
 
     try {
-        // En desarrollo, leer del archivo JSON extraído
-        const dataPath = path.join(process.cwd(), 'data_elizondo_extracted.json');
+        // Almacén de resultados: detalle completo paginado (?table=...) o resumen con la primera página
+        const storePath = resolveReport(company, 'store');
+        if (storePath && fs.existsSync(storePath)) {
+            const table = searchParams.get('table');
+            if (table) {
+                if (!isDetailTable(table)) {
+                    return NextResponse.json({ error: `Unknown table: ${table}` }, { status: 400 });
+                }
+                return NextResponse.json({
+                    success: true,
+                    ...readPage(storePath, 'data', table, searchParams),
+                    timestamp: new Date().toISOString()
+                });
+            }
+            const summary = readSummary(storePath, 'data');
+            if (summary) {
+                summary.rfcs = firstRows(storePath, 'data', 'rfcs', 50).map(row => row.rfc);
+                summary.sample_amounts = firstRows(storePath, 'data', 'amounts', 100).map(row => row.cents / 100);
+                summary.sample_dates = firstRows(storePath, 'data', 'dates', 50).map(row => row.day);
+                return NextResponse.json({
+                    success: true,
+                    data: summary,
+                    timestamp: new Date().toISOString()
+                });
+            }
+        }
+
+        // Leer el JSON extraído de la empresa según reports/index.json (o el archivo histórico)
+        const dataPath = resolveReport(company, 'data');
 
-        if (!fs.existsSync(dataPath)) {
+        if (!dataPath || !fs.existsSync(dataPath)) {
             return NextResponse.json({
                 error: 'No data available',
                 message: 'Please run the extraction script first'
@@ -1,24 +1,49 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
-import path from 'path';
+import { resolveReport } from '@/lib/reports';
+import { firstRows, isDetailTable, readPage, readSummary } from '@/lib/resultStore';
 
 export async function GET(request: Request) {
     const { searchParams } = new URL(request.url);
     const company = searchParams.get('company');
 
     try {
-        // Solo Majoba tiene reporte de nómina por ahora
-        const isMajoba = company?.includes('Majoba');
+        // Almacén de resultados: detalle completo paginado (?table=...) o resumen con la primera página
+        const storePath = resolveReport(company, 'store');
+        if (storePath && fs.existsSync(storePath)) {
+            const table = searchParams.get('table');
+            if (table) {
+                if (!isDetailTable(table)) {
+                    return NextResponse.json({ error: `Unknown table: ${table}` }, { status: 400 });
+                }
+                return NextResponse.json({
+                    success: true,
+                    ...readPage(storePath, 'payroll', table, searchParams),
+                    timestamp: new Date().toISOString()
+                });
+            }
+            const summary = readSummary(storePath, 'payroll');
+            if (summary) {
+                summary.sample_employees = firstRows(storePath, 'payroll', 'rfcs', 50).map(row => row.rfc);
+                summary.risk_findings.evidence = firstRows(storePath, 'payroll', 'evidence', 20);
+                return NextResponse.json({
+                    success: true,
+                    hasPayroll: true,
+                    data: summary
+                });
+            }
+        }
+
+        // Solo las empresas con nómina en COI tienen reporte (ver reports/index.json)
+        const reportPath = resolveReport(company, 'payroll');
 
-        if (!isMajoba) {
+        if (!reportPath) {
             return NextResponse.json({
                 hasPayroll: false,
                 message: 'No payroll data for this company'
             });
         }
 
-        const reportPath = path.join(process.cwd(), 'payroll_report_majoba.json');
-
         if (!fs.existsSync(reportPath)) {
             return NextResponse.json({
                 found: false,
@@ -0,0 +1,63 @@
+import fs from 'fs';
+import path from 'path';
+
+export type ReportKind = 'data' | 'anomalies' | 'payroll' | 'periods' | 'store' | 'cross_match' | 'efos';
+
+// Directorio de salida de scripts/batch_audit.py: index.json + un subdirectorio por empresa
+const REPORTS_DIR = process.env.AUDIT_REPORTS_DIR || path.join(process.cwd(), 'reports');
+
+// Reportes sueltos en la raíz de corridas manuales anteriores al lote
+const LEGACY_REPORTS: Record<string, Partial<Record<ReportKind, string>>> = {
+    majoba: {
+        anomalies: 'anomaly_report_majoba.json',
+        payroll: 'payroll_report_majoba.json'
+    },
+    elizondo: {
+        data: 'data_elizondo_extracted.json',
+        anomalies: 'anomaly_report_elizondo.json'
+    }
+};
+
+interface CompanyEntry {
+    name?: string;
+    rfc?: string;
+    reports?: Partial<Record<ReportKind, string>>;
+}
+
+function loadIndex(): Record<string, CompanyEntry> {
+    const indexPath = path.join(REPORTS_DIR, 'index.json');
+    if (!fs.existsSync(indexPath)) return {};
+    try {
+        return JSON.parse(fs.readFileSync(indexPath, 'utf-8')).companies || {};
+    } catch {
+        return {};
+    }
+}
+
+function normalize(value: string) {
+    return value.trim().toLowerCase();
+}
+
+function findCompany(companies: Record<string, CompanyEntry>, company: string) {
+    const wanted = normalize(company);
+    const slugs = Object.keys(companies);
+    // Primero coincidencia exacta por slug, nombre o RFC; luego el nombre que contenga el slug
+    return slugs.find(slug => [slug, companies[slug].name, companies[slug].rfc]
+        .some(value => value && normalize(value) === wanted))
+        || slugs.find(slug => wanted.includes(normalize(slug)));
+}
+
+/**
+ * Ruta absoluta del reporte `kind` de la empresa (slug o nombre), o null si no hay uno registrado.
+ * Usa reports/index.json y, si la empresa no está ahí, los archivos históricos de la raíz.
+ */
+export function resolveReport(company: string | null, kind: ReportKind): string | null {
+    const companies = loadIndex();
+    const slug = company ? findCompany(companies, company) : undefined;
+    const relative = slug ? companies[slug].reports?.[kind] : undefined;
+    if (relative) return path.join(REPORTS_DIR, relative);
+
+    const legacy = company && normalize(company).includes('majoba') ? 'majoba' : 'elizondo';
+    const filename = LEGACY_REPORTS[legacy][kind];
+    return filename ? path.join(process.cwd(), filename) : null;
+}
@@ -0,0 +1,76 @@
+import { execFileSync } from 'child_process';
+import fs from 'fs';
+import path from 'path';
+
+export type DetailTable = 'rfcs' | 'amounts' | 'dates' | 'evidence';
+
+const DEFAULT_PAGE_SIZE = 100;
+const MAX_PAGE_SIZE = 1000;
+
+// El almacén se consulta con la CLI de scripts/result_store.py (JSON por stdout): el dashboard
+// no necesita un binding nativo de SQLite y las consultas viven en un solo lugar
+const PYTHON = process.env.AUDIT_PYTHON || 'python3';
+const STORE_CLI = path.join(process.cwd(), 'scripts', 'result_store.py');
+
+// Filtros admitidos por tabla: mismos nombres que DETAIL_TABLES en scripts/result_store.py
+const DETAIL_FILTERS: Record<DetailTable, string[]> = {
+    rfcs: ['prefix'],
+    amounts: ['min_cents', 'max_cents'],
+    dates: ['start', 'end'],
+    evidence: ['keyword', 'text']
+};
+
+export function isDetailTable(table: string): table is DetailTable {
+    return table in DETAIL_FILTERS;
+}
+
+function queryStore(storePath: string, args: string[]) {
+    if (!fs.existsSync(storePath)) {
+        throw new Error(`Result store not found: ${storePath}`);
+    }
+    const output = execFileSync(PYTHON, [STORE_CLI, storePath, ...args], {
+        encoding: 'utf-8',
+        maxBuffer: 64 * 1024 * 1024
+    });
+    return JSON.parse(output);
+}
+
+/**
+ * Secciones de resumen de un reporte (data, anomalies, payroll), o null si el almacén no lo tiene.
+ */
+export function readSummary(storePath: string, report: string): Record<string, any> | null {
+    const summary = queryStore(storePath, ['--report', report]);
+    return Object.keys(summary).length === 0 ? null : summary;
+}
+
+/**
+ * Página de una tabla de detalle. Lee `page`, `page_size` y los filtros de la tabla
+ * (ej. keyword, text, min_cents) de los parámetros de la URL; el resto se ignora.
+ */
+export function readPage(storePath: string, report: string, table: DetailTable, params: URLSearchParams) {
+    const page = Math.max(1, parseInt(params.get('page') || '1', 10) || 1);
+    const pageSize = Math.min(Math.max(1, parseInt(params.get('page_size') || '', 10) || DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE);
+
+    const args = ['--report', report, '--table', table, '--page', String(page), '--page-size', String(pageSize)];
+    for (const name of DETAIL_FILTERS[table]) {
+        const value = params.get(name);
+        if (value !== null && value !== '') {
+            args.push('--filter', `${name}=${value}`);
+        }
+    }
+    const result = queryStore(storePath, args);
+    return {
+        table,
+        total: result.total as number,
+        page: result.page as number,
+        page_size: result.page_size as number,
+        rows: result.rows as Array<Record<string, any>>
+    };
+}
+
+/**
+ * Primeras `limit` filas de una tabla de detalle (muestra para las vistas que esperan el JSON anterior).
+ */
+export function firstRows(storePath: string, report: string, table: DetailTable, limit: number) {
+    return readPage(storePath, report, table, new URLSearchParams({ page_size: String(limit) })).rows;
+}
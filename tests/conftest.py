@@ -0,0 +1,48 @@
+import random
+import string
+import sys
+from pathlib import Path
+
+import pytest
+
+# Los scripts se importan entre sí como módulos hermanos (from scan_engine import ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from rfc_validator import check_digit  # noqa: E402
+
+KEYWORDS = ("efectivo", "ajuste", "varios", "bono", "viaticos", "sueldo")
+
+
+def valid_rfc(rng, letters=3):
+    """RFC con fecha y dígito verificador válidos"""
+    head = ''.join(rng.choice(string.ascii_uppercase) for _ in range(letters))
+    body = f"{head}{rng.randint(50, 99):02d}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}"
+    body += ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(2)) + '0'
+    return body[:-1] + check_digit(body)
+
+
+def write_bak(path, records=2000, seed=7, xml=True):
+    """
+    Respaldo sintético: registros tipo póliza (fecha, cuenta, RFC, importe, concepto)
+    separados por relleno binario, para probar escaneos por bloques y en paralelo.
+    """
+    rng = random.Random(seed)
+    rfcs = [valid_rfc(rng, 3 if i % 2 else 4) for i in range(150)]
+    parts = []
+    for i in range(records):
+        parts.append(bytes(rng.randrange(0, 32) for _ in range(rng.randint(20, 200))))
+        day = f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        account = f"{rng.randint(100, 999)}-{rng.randint(10, 99):02d}"
+        amount = f"{rng.randint(100, 999999)}.{rng.randint(0, 99):02d}"
+        # Sin `xml` los montos no son atributos CFDI: solo los encuentra el patrón genérico
+        importe = f'Importe="{amount}"' if xml else f'Importe {amount}'
+        record = f'{day} {account} {rng.choice(rfcs)} {importe} pago {rng.choice(KEYWORDS)} {i}'
+        parts.append(record.encode('ascii'))
+    data = b''.join(parts)
+    path.write_bytes(data)
+    return path
+
+
+@pytest.fixture
+def bak(tmp_path):
+    return write_bak(tmp_path / "test.bak")
@@ -0,0 +1,39 @@
+import pytest
+
+from anomaly_hunter import AnomalyHunter, GENERIC_FALLBACK_MIN
+from conftest import write_bak
+from scan_engine import run_plugins
+
+CHUNK = 64 * 1024
+
+
+def _report(bak, workers=1, chunk_size=CHUNK):
+    hunter = AnomalyHunter(str(bak))
+    run_plugins(str(bak), [hunter], chunk_size=chunk_size, workers=workers)
+    hunter.analyze_benford()
+    hunter.analyze_round_numbers()
+    hunter.hunt_suspicious_concepts()
+    return hunter
+
+
+@pytest.mark.parametrize("xml", [True, False])
+def test_parallel_report_equals_sequential(tmp_path, xml):
+    bak = write_bak(tmp_path / "test.bak", xml=xml)
+    sequential = _report(bak)
+    for workers in (2, 3):
+        assert _report(bak, workers=workers).results == sequential.results
+
+
+def test_generic_fallback_uses_whole_scan(tmp_path):
+    # Sin montos XML el genérico no se corta en los primeros ~500 montos
+    bak = write_bak(tmp_path / "test.bak", records=3000, xml=False)
+    hunter = _report(bak)
+    assert hunter.digit_stats.count > 2 * GENERIC_FALLBACK_MIN
+    assert hunter.digit_stats.count == _report(bak, chunk_size=1024 * 1024).digit_stats.count
+
+
+def test_xml_amounts_win_when_enough(tmp_path):
+    bak = write_bak(tmp_path / "test.bak", records=1000, xml=True)
+    hunter = _report(bak)
+    assert hunter.digit_stats.count == len(hunter.seen_cents) >= GENERIC_FALLBACK_MIN
+    assert hunter.digit_stats.count <= 1000
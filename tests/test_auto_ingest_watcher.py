@@ -0,0 +1,214 @@
+import json
+import shutil
+import sys
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import auto_ingest_watcher
+from auto_ingest_watcher import BakEventHandler, company_for, run_pipeline
+from conftest import write_bak
+from ingest_ledger import IngestLedger, content_fingerprint, content_hash
+from scan_cache import SAMPLE_BLOCK_SIZE
+
+
+def _light_stages(tmp_path, monkeypatch):
+    """
+    Etapas ligeras en lugar del escaneo completo: `scan` escribe la ruta del respaldo en el
+    reporte `data` y `efos` la copia al reporte `efos`; `efos` falla mientras exista FAIL
+    """
+    stage = tmp_path / "stage.py"
+    stage.write_text("import sys, pathlib\n"
+                     "if len(sys.argv) > 3 and pathlib.Path(sys.argv[3]).exists(): sys.exit(3)\n"
+                     "pathlib.Path(sys.argv[1]).parent.mkdir(parents=True, exist_ok=True)\n"
+                     "pathlib.Path(sys.argv[1]).write_text(sys.argv[2])\n")
+    monkeypatch.setattr(auto_ingest_watcher, "STAGES", [
+        ("scan", lambda company, paths, options: [sys.executable, str(stage), str(paths["data"]), company["bak"]],
+         lambda company, options: True, ("data",)),
+        ("efos", lambda company, paths, options: [sys.executable, str(stage), str(paths["efos"]),
+                                                  paths["data"].read_text(), str(tmp_path / "FAIL")],
+         lambda company, options: True, ("efos",)),
+    ])
+
+
+def _job_status(ledger, path):
+    return ledger._execute("SELECT status FROM jobs WHERE fingerprint = ?", (content_fingerprint(path),))[0][0]
+
+
+def test_concurrent_companies_write_their_own_reports(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Sin índice 69-B ni API key la etapa EFOS no aplica
+    monkeypatch.delenv('GOOGLE_GENERATIVE_AI_API_KEY', raising=False)
+    baks = []
+    for seed, folder in enumerate(("ctTransportes_Majoba_SA-20251027-1050", "ctElizondo_SA-20251027-1100"), 1):
+        (tmp_path / folder).mkdir()
+        baks.append(write_bak(tmp_path / folder / "respaldo.bak", records=300, seed=seed))
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    results = []
+    threads = [threading.Thread(target=lambda p=path: results.append(
+        run_pipeline(p, ledger, output_dir="reports", cache="cache.sqlite"))) for path in baks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [True, True]
+
+    index = json.loads((tmp_path / "reports" / "index.json").read_text(encoding='utf-8'))
+    assert set(index["companies"]) == {"transportes_majoba_sa", "elizondo_sa"}
+    for path in baks:
+        slug = company_for(path)["slug"]
+        reports = index["companies"][slug]["reports"]
+        assert reports["anomalies"] == f"{slug}/anomaly_report_{slug}.json"
+        # Cada etapa registra solo sus propios reportes, aunque otro worker escriba al mismo tiempo
+        outputs = ledger._execute("SELECT s.outputs FROM stages s JOIN jobs j USING (fingerprint) "
+                                  "WHERE j.bak_path = ?", (str(path.resolve()),))
+        assert outputs and all(f"/{slug}/" in out for out in json.loads(outputs[0][0]))
+    ledger.close()
+
+
+def test_same_fingerprint_with_different_content_is_processed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    folder = tmp_path / "ctElizondo_SA-20251027-1100"
+    folder.mkdir()
+    first = write_bak(folder / "respaldo.bak")
+    # Relleno para que los bloques muestreados por la huella no cubran todo el archivo
+    first.write_bytes(first.read_bytes() + bytes(8 * 1024 * 1024))
+    data = bytearray(first.read_bytes())
+    # Un byte entre los dos primeros bloques muestreados: la huella no lo ve
+    data[SAMPLE_BLOCK_SIZE + 10] ^= 0xFF
+    second = folder / "respaldo_nuevo.bak"
+    second.write_bytes(bytes(data))
+    fp = content_fingerprint(first)
+    assert content_fingerprint(second) == fp
+    _light_stages(tmp_path, monkeypatch)
+
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    assert run_pipeline(first, ledger, output_dir="reports", cache="cache.sqlite")
+    # Un respaldo nuevo no se lee completo: el hash solo se calcula ante una coincidencia de huella
+    assert ledger.stored_hash(fp) is None
+    assert run_pipeline(second, ledger, output_dir="reports", cache="cache.sqlite")
+    assert ledger.stored_hash(fp) == content_hash(second)
+    data_report = tmp_path / "reports" / "elizondo_sa" / "data_elizondo_sa_extracted.json"
+    assert data_report.read_text() == str(second.resolve())
+    # Una copia idéntica sí se omite sin repetir etapas
+    stages = ledger._execute("SELECT started_at FROM stages WHERE fingerprint = ?", (fp,))
+    copy = folder / "copia.bak"
+    copy.write_bytes(second.read_bytes())
+    assert run_pipeline(copy, ledger, output_dir="reports", cache="cache.sqlite")
+    assert ledger._execute("SELECT started_at FROM stages WHERE fingerprint = ?", (fp,)) == stages
+    ledger.close()
+
+
+def test_error_after_claim_marks_job_failed_and_next_drop_retries(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _light_stages(tmp_path, monkeypatch)
+    bak = write_bak(tmp_path / "respaldo.bak", records=200)
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+
+    def broken_index(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(auto_ingest_watcher, "update_index", broken_index)
+    assert run_pipeline(bak, ledger, output_dir="reports") is False
+    assert _job_status(ledger, bak) == 'failed'
+
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    _light_stages(tmp_path, monkeypatch)
+    # Sin el error el siguiente evento reclama el trabajo en vez de creer que otro worker lo tiene
+    assert run_pipeline(bak, ledger, output_dir="reports") is True
+    assert _job_status(ledger, bak) == 'done'
+    ledger.close()
+
+
+def test_stage_spawn_failure_marks_stage_failed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(auto_ingest_watcher, "STAGES", [
+        ("scan", lambda company, paths, options: ["x.py"], lambda company, options: True, ())])
+
+    def no_spawn(*args, **kwargs):
+        raise OSError("no se pudo crear el proceso")
+
+    monkeypatch.setattr(auto_ingest_watcher.subprocess, "run", no_spawn)
+    bak = write_bak(tmp_path / "respaldo.bak", records=200)
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    assert run_pipeline(bak, ledger, output_dir="reports") is False
+    fp = content_fingerprint(bak)
+    assert ledger._execute("SELECT status, error FROM stages WHERE fingerprint = ?", (fp,)) == \
+        [('failed', 'no se pudo crear el proceso')]
+    assert _job_status(ledger, bak) == 'failed'
+    ledger.close()
+
+
+def test_job_held_by_another_worker_is_not_reported_as_success(tmp_path):
+    bak = write_bak(tmp_path / "respaldo.bak", records=200)
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    ledger.register(content_fingerprint(bak), bak)
+    assert run_pipeline(bak, ledger, output_dir=tmp_path / "reports") is None
+    ledger.close()
+
+
+def test_done_file_is_skipped_without_reading_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _light_stages(tmp_path, monkeypatch)
+    bak = write_bak(tmp_path / "respaldo.bak", records=200)
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    assert run_pipeline(bak, ledger, output_dir="reports") is True
+    assert ledger.is_done(bak)
+
+    def no_read(path):
+        raise AssertionError("no debe leerse un respaldo ya auditado")
+
+    monkeypatch.setattr(auto_ingest_watcher, "content_fingerprint", no_read)
+    monkeypatch.setattr(auto_ingest_watcher, "content_hash", no_read)
+    assert run_pipeline(bak, ledger, output_dir="reports") is True
+    ledger.close()
+
+
+def test_event_handler_ignores_reads():
+    touched = []
+    handler = BakEventHandler(touched.append)
+    for event_type in ("opened", "closed_no_write", "deleted", "created", "modified", "closed"):
+        handler.on_any_event(SimpleNamespace(event_type=event_type, is_directory=False, src_path="/a/x.bak"))
+    handler.on_any_event(SimpleNamespace(event_type="moved", is_directory=False, src_path="/a/x.tmp",
+                                         dest_path="/a/y.bak"))
+    assert touched == [Path("/a/x.bak")] * 3 + [Path("/a/y.bak")]
+
+
+def test_copy_with_same_mtime_is_trusted_without_full_hash(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _light_stages(tmp_path, monkeypatch)
+    bak = write_bak(tmp_path / "respaldo.bak", records=200)
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    assert run_pipeline(bak, ledger, output_dir="reports") is True
+    copy = tmp_path / "copia.bak"
+    shutil.copy2(bak, copy)
+
+    def no_full_read(path):
+        raise AssertionError("huella + tamaño + mtime bastan para una copia")
+
+    monkeypatch.setattr(auto_ingest_watcher, "content_hash", no_full_read)
+    assert run_pipeline(copy, ledger, output_dir="reports") is True
+    assert ledger.is_done(copy)
+    ledger.close()
+
+
+def test_restart_resumes_only_the_failed_stage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _light_stages(tmp_path, monkeypatch)
+    bak = write_bak(tmp_path / "respaldo.bak", records=200)
+    ledger = IngestLedger(tmp_path / "ledger.sqlite")
+    (tmp_path / "FAIL").touch()
+    assert run_pipeline(bak, ledger, output_dir="reports") is False
+    fp = content_fingerprint(bak)
+    first = dict(ledger._execute("SELECT stage, started_at FROM stages WHERE fingerprint = ?", (fp,)))
+    assert set(first) == {"scan", "efos"}
+
+    (tmp_path / "FAIL").unlink()
+    assert run_pipeline(bak, ledger, output_dir="reports") is True
+    second = dict(ledger._execute("SELECT stage, started_at FROM stages WHERE fingerprint = ?", (fp,)))
+    assert second["scan"] == first["scan"]
+    assert second["efos"] != first["efos"]
+    efos_report = tmp_path / "reports" / company_for(bak)["slug"] / f"efos_analysis_{company_for(bak)['slug']}.json"
+    assert efos_report.read_text() == str(bak.resolve())
+    ledger.close()
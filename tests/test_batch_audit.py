@@ -0,0 +1,48 @@
+import json
+
+from batch_audit import BatchRunner, load_manifest
+from conftest import write_bak
+from efos_list import build_index
+from scan_engine import RFCConsumer, run_plugins
+
+
+class _Collector:
+    def __init__(self):
+        self.rfcs = set()
+
+    def consumers(self):
+        return [RFCConsumer(self._on_rfc)]
+
+    def _on_rfc(self, value, offset):
+        self.rfcs.add(bytes(value).decode('ascii'))
+
+    def merge(self, other):
+        self.rfcs |= other.rfcs
+
+
+def test_efos_stage_screens_every_rfc_with_relative_output_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('GOOGLE_GENERATIVE_AI_API_KEY', raising=False)
+    bak = write_bak(tmp_path / "empresa.bak")
+    collector = _Collector()
+    run_plugins(str(bak), [collector])
+    rfcs = sorted(collector.rfcs)
+    assert len(rfcs) > 50
+    # El RFC que ordena al final nunca entra en la muestra de 50 del resumen
+    listed = rfcs[-1]
+    (tmp_path / "69b.csv").write_text(f"No,RFC,Nombre,Situación\n1,{listed},EMPRESA FANTASMA,Definitivo\n",
+                                      encoding='latin-1')
+    build_index(tmp_path / "69b.csv", tmp_path / "69b.idx")
+    (tmp_path / "manifest.json").write_text(json.dumps(
+        {"companies": [{"slug": "emp", "name": "Empresa", "rfc": "EMP010101AAA", "bak": "empresa.bak"}]}))
+
+    runner = BatchRunner(load_manifest("manifest.json"), output_dir="reports", workers=2,
+                         cache="cache.sqlite", efos_index="69b.idx")
+    counts = runner.run()
+    assert not counts.get("failed")
+    assert runner.tasks[("emp", "efos")].status == "done"
+
+    with open(tmp_path / "reports" / "emp" / "efos_analysis_emp.json", encoding='utf-8') as f:
+        analysis = json.load(f)
+    assert analysis["total_rfcs_analyzed"] == len(rfcs)
+    assert [item["rfc"] for item in analysis["flagged_rfcs"]] == [listed]
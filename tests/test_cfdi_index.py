@@ -0,0 +1,63 @@
+import os
+
+from cfdi_index import CFDIIndex
+
+UUID_A = "11111111-2222-4333-8444-555555555555"
+UUID_B = "AAAAAAAA-BBBB-4CCC-8DDD-EEEEEEEEEEEE"
+
+
+def _write(path, uuid, total="100.00", bump=0):
+    """CFDI mínimo; `bump` cambia el mtime para que el índice vea el archivo como modificado"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" '
+                    'xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" '
+                    f'Total="{total}" SubTotal="{total}" TipoDeComprobante="I" Fecha="2024-01-01T00:00:00">'
+                    '<cfdi:Emisor Rfc="EKU9003173C9" Nombre="EMISOR"/><cfdi:Receptor Rfc="XAXX010101000"/>'
+                    '<cfdi:Complemento><tfd:TimbreFiscalDigital UUID="' + uuid + '"/></cfdi:Complemento>'
+                    '</cfdi:Comprobante>', encoding='utf-8')
+    if bump:
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump * 1_000_000_000))
+
+
+def _rows(index):
+    return index.conn.execute("SELECT uuid, copies, path FROM cfdis ORDER BY uuid").fetchall()
+
+
+def test_copies_follow_the_files_that_hold_each_uuid(tmp_path):
+    first, second = tmp_path / "r1" / "a.xml", tmp_path / "r2" / "a.xml"
+    _write(first, UUID_A)
+    _write(second, UUID_A)
+    index = CFDIIndex(tmp_path / "index.sqlite")
+    stats = index.update(tmp_path, workers=1, batch_size=1)
+    assert (stats['new_cfdis'], stats['duplicates']) == (1, 1)
+    # La ruta es la de la primera copia recorrida (el orden del directorio no está definido)
+    assert _rows(index)[0][:2] == (UUID_A, 2) and _rows(index)[0][2] in (str(first), str(second))
+
+    # Reescribir una copia con el mismo UUID no suma copias
+    _write(second, UUID_A, total="100.0", bump=1)
+    assert index.update(tmp_path, workers=1)['changed'] == 1
+    assert _rows(index)[0][1] == 2
+
+    # La copia original cambia de UUID: el comprobante anterior conserva una copia y otra ruta
+    _write(first, UUID_B, bump=2)
+    index.update(tmp_path, workers=1)
+    assert _rows(index) == [(UUID_A, 1, str(second)), (UUID_B, 1, str(first))]
+
+    # La última copia deja de ser válida: el comprobante sale del índice
+    second.write_text("<no es un cfdi", encoding='utf-8')
+    stats = index.update(tmp_path, workers=1)
+    assert (stats['invalid'], stats['removed']) == (1, 1)
+    assert _rows(index) == [(UUID_B, 1, str(first))]
+    assert index.update(tmp_path, workers=1)['changed'] == 0
+    index.close()
+
+
+def test_many_batches_are_all_stored(tmp_path):
+    for i in range(60):
+        _write(tmp_path / "xml" / f"{i:02d}.xml", f"00000000-0000-4000-8000-{i:012d}")
+    index = CFDIIndex(tmp_path / "index.sqlite")
+    stats = index.update(tmp_path / "xml", workers=2, batch_size=3)
+    assert stats['seen'] == stats['changed'] == stats['new_cfdis'] == 60
+    assert index.count() == 60
+    index.close()
@@ -0,0 +1,78 @@
+import random
+import re
+
+import pytest
+
+from chunk_reader import MappedReader, OverlappingReader, WindowScanner, iter_matches
+from extract_accounting_data import AccountingDataExtractor
+from payroll_hunter import PayrollHunter
+from scan_engine import run_plugins
+
+RFC = re.compile(rb'[A-Z&]{3,4}\d{6}[A-Z0-9]{3}')
+
+
+def _data(seed=3, records=400):
+    """Relleno aleatorio con RFCs en posiciones arbitrarias (muchos cruzan bordes de bloque)"""
+    rng = random.Random(seed)
+    parts = []
+    for i in range(records):
+        parts.append(bytes(rng.randrange(0, 32) for _ in range(rng.randint(0, 90))))
+        parts.append(f"ABC{i % 100:02d}0101A{i % 10}{i % 7}".encode('ascii'))
+    return b''.join(parts)
+
+
+@pytest.mark.parametrize("chunk_size,overlap", [(64, 16), (100, 20), (257, 32), (4096, 64)])
+def test_matches_across_boundaries_equal_whole_file_regex(tmp_path, chunk_size, overlap):
+    data = _data()
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    expected = [(m.start(), m.group()) for m in RFC.finditer(data)]
+    assert list(iter_matches(path, RFC, chunk_size=chunk_size, overlap=overlap)) == expected
+
+
+def test_ranges_cover_the_file_once(tmp_path):
+    data = _data(seed=9) + bytes(5)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    expected = [(m.start(), m.group()) for m in RFC.finditer(data)]
+    # El último rango es más corto que el traslape, termina en el fin del archivo y empieza
+    # justo después de un match que pertenece al rango anterior
+    last = expected[-1][0]
+    cuts = [0, 333, 1000, 1001, 4321, last + 5, len(data)]
+    found = []
+    for start, end in zip(cuts, cuts[1:]):
+        scanner = WindowScanner(RFC)
+        for window in OverlappingReader(path, chunk_size=128, overlap=32, start=start, end=end):
+            found.extend((offset, match.group()) for offset, match in scanner.scan(window))
+    # Cada match pertenece al rango donde inicia: ni se pierde en un corte ni se repite
+    assert found == expected
+
+
+def test_overlap_must_fit_in_chunk(tmp_path):
+    with pytest.raises(ValueError):
+        OverlappingReader(tmp_path / "x", chunk_size=64, overlap=32)
+
+
+def test_mapped_reader_matches_read_mode_without_copies(tmp_path):
+    data = _data(seed=5)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    mapped = list(iter_matches(path, RFC, chunk_size=200, overlap=32, use_mmap=True))
+    assert mapped == list(iter_matches(path, RFC, chunk_size=200, overlap=32))
+    # Las ventanas son vistas del mapeo, no copias del bloque
+    windows = MappedReader(path, chunk_size=200, overlap=32)
+    assert all(isinstance(window.data, memoryview) for window in windows)
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b'')
+    assert list(MappedReader(empty)) == []
+
+
+def test_mmap_scan_equals_read_scan(bak):
+    results = []
+    for use_mmap in (False, True):
+        extractor = AccountingDataExtractor(str(bak))
+        hunter = PayrollHunter(str(bak))
+        run_plugins(str(bak), [extractor, hunter], chunk_size=64 * 1024, use_mmap=use_mmap)
+        results.append((sorted(extractor.data['rfcs']), extractor.amount_stats.count,
+                        dict(hunter.results["risk_counts"])))
+    assert results[0] == results[1]
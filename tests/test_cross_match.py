@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from cross_match import CrossMatcher
+from typed_records import NO_DATE
+
+
+def _reference(ledger_cents, ledger_days, requests, tolerance, window):
+    """Búsqueda exhaustiva: la partida libre con menor (diferencia, distancia en días, posición ordenada)"""
+    order = sorted(range(len(ledger_cents)), key=lambda i: (ledger_cents[i], ledger_days[i], i))
+    used = set()
+    result = []
+    for cents, day in requests:
+        best = None
+        for position, i in enumerate(order):
+            if position in used or abs(ledger_cents[i] - cents) > tolerance:
+                continue
+            dated = day != NO_DATE and ledger_days[i] != NO_DATE
+            if window is not None and dated and abs(ledger_days[i] - day) > window:
+                continue
+            score = (abs(ledger_cents[i] - cents), abs(ledger_days[i] - day) if dated else 1 << 30, position)
+            best = min(best, score) if best else score
+        if best:
+            used.add(best[2])
+        result.append(best[2] if best else None)
+    return result
+
+
+def test_window_reaches_past_many_earlier_entries():
+    matcher = CrossMatcher([100000] * 101, list(range(19000, 19100)) + [19500], date_window_days=3)
+    assert matcher.match_amount(100000, 19500) == 100
+    assert matcher.match_amount(100000, 19500) is None
+
+
+def test_picks_nearest_free_day_on_both_sides():
+    matcher = CrossMatcher([500] * 5, [10, 20, 30, 40, NO_DATE], date_window_days=15)
+    assert matcher.days[matcher.match_amount(500, 28)] == 30
+    assert matcher.days[matcher.match_amount(500, 28)] == 20
+    assert matcher.days[matcher.match_amount(500, 28)] == 40
+    # Sin partidas con fecha en la ventana queda la que no tiene fecha
+    assert matcher.days[matcher.match_amount(500, 28)] == NO_DATE
+    assert matcher.match_amount(500, 28) is None
+
+
+@pytest.mark.parametrize("tolerance,window", [(0, None), (0, 3), (2, 5), (3, None)])
+def test_matches_exhaustive_search(tolerance, window):
+    rng = random.Random(tolerance * 100 + (window or 0))
+    ledger_cents = [rng.randint(100, 130) for _ in range(400)]
+    ledger_days = [rng.choice([NO_DATE] + list(range(19000, 19060))) for _ in range(400)]
+    requests = [(rng.randint(98, 132), rng.choice([NO_DATE] + list(range(18995, 19065)))) for _ in range(450)]
+    matcher = CrossMatcher(ledger_cents, ledger_days, tolerance_cents=tolerance, date_window_days=window)
+    assert [matcher.match_amount(cents, day) for cents, day in requests] == \
+        _reference(ledger_cents, ledger_days, requests, tolerance, window)
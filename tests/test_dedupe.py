@@ -0,0 +1,83 @@
+import pickle
+
+import pytest
+
+import dedupe
+from dedupe import BloomFilter, ExactIntSet, ExactKeySet, make_deduper
+from extract_accounting_data import AccountingDataExtractor
+from scan_engine import run_plugins
+
+CHUNK = 64 * 1024
+
+
+def test_bloom_is_sized_from_expected_items_and_allocated_lazily():
+    deduper = make_deduper('approx', 'int', max_mb=256)
+    # Sin llaves solo existen los registros del HyperLogLog
+    assert deduper.memory_bytes == deduper.hll.memory_bytes
+    assert len(pickle.dumps(deduper)) < 2 * deduper.hll.memory_bytes
+    deduper.add(12345)
+    # 10 millones de llaves al 1% caben en ~12 MB, no en el tope de 256 MB
+    assert 11 * 1024 * 1024 < deduper.bloom.memory_bytes < 13 * 1024 * 1024
+
+
+def test_bloom_budget_caps_the_size():
+    bloom = BloomFilter(max_bytes=1024, expected_items=10_000_000)
+    bloom.add("x")
+    assert bloom.memory_bytes == 1024
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_bloom_merge_is_bytewise_or(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(dedupe, "np", None)
+    elif dedupe.np is None:
+        pytest.skip("NumPy no está instalado")
+    monkeypatch.setattr(dedupe, "_MERGE_BLOCK", 1000)
+    left, right, both = (BloomFilter(max_bytes=64 * 1024, expected_items=5000) for _ in range(3))
+    for key in range(3000):
+        (left if key % 2 else right).add(key)
+        both.add(key)
+    left.merge(right)
+    assert left._bits == both._bits
+    assert all(key in left for key in range(3000))
+
+
+def test_bloom_merge_into_empty_and_from_empty():
+    full, empty = BloomFilter(max_bytes=4096, expected_items=100), BloomFilter(max_bytes=4096, expected_items=100)
+    full.add("ABC010101AAA")
+    full.merge(BloomFilter(max_bytes=4096, expected_items=100))
+    empty.merge(full)
+    assert "ABC010101AAA" in empty and empty._bits == full._bits and empty._bits is not full._bits
+
+
+def test_bloom_pickles_compressed():
+    bloom = BloomFilter(max_bytes=4 * 1024 * 1024, expected_items=1_000_000)
+    for key in range(100):
+        bloom.add(key)
+    payload = pickle.dumps(bloom)
+    assert len(payload) < bloom.memory_bytes // 10
+    copy = pickle.loads(payload)
+    assert copy._bits == bloom._bits
+
+
+def test_parallel_approx_counts_equal_sequential(bak):
+    counts = []
+    for workers in (1, 3):
+        extractor = AccountingDataExtractor(str(bak), dedupe='approx', dedupe_mb=8)
+        run_plugins(str(bak), [extractor], chunk_size=CHUNK, workers=workers)
+        counts.append((len(extractor.data['rfcs']), bytes(extractor.data['rfcs'].bloom._bits)))
+    assert counts[0] == counts[1]
+
+
+def test_exact_sets_grow_and_enforce_budget():
+    ints = ExactIntSet(max_bytes=64 * 1024, initial_slots=8)
+    assert all(ints.add(value) for value in range(-500, 500))
+    assert not ints.add(7) and len(ints) == 1000 and sorted(ints) == list(range(-500, 500))
+    with pytest.raises(MemoryError):
+        for value in range(10_000):
+            ints.add(value)
+
+    keys = ExactKeySet(width=13, initial_slots=4)
+    for rfc in ("ABC010101AAA", "ABCD010101AAA", "ABC010101AAA"):
+        keys.add(rfc)
+    assert sorted(keys) == ["ABC010101AAA", "ABCD010101AAA"]
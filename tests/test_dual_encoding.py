@@ -0,0 +1,111 @@
+import random
+import re
+from functools import partial
+
+import pytest
+
+from conftest import valid_rfc
+from dual_encoding import ASCII, UTF16LE, compile_dual, narrow, widen
+from scan_engine import (AMOUNT_PATTERN, CFDI_ATTRIBUTE_PATTERN, DATE_PATTERN, RFC_PATTERN, AmountConsumer,
+                         KeywordConsumer, RFCConsumer, run_plugins)
+
+CHUNK = 64 * 1024
+
+
+class _Hits:
+    """Plugin mínimo: junta (valor, offset) de sus consumidores"""
+
+    def __init__(self, *factories):
+        self.factories = factories
+        self.hits = []
+
+    def consumers(self):
+        return [factory(lambda value, offset, *context: self.hits.append((bytes(value), offset) + context))
+                for factory in self.factories]
+
+    def merge(self, other):
+        self.hits.extend(other.hits)
+
+    def finish(self):
+        self.hits.sort(key=lambda hit: hit[1])
+
+
+@pytest.mark.parametrize("source,wide", [
+    (rb'ab', rb'a\x00b\x00'),
+    (rb'[0-9]{2,4}', rb'[0-9]\x00(?:[0-9]\x00){1,3}'),
+    (rb'x*y+', rb'(?:x\x00)*y\x00(?:y\x00)*'),
+    (rb'(?<![0-9])\.(?P<d>[0-9])?', rb'(?<![0-9]\x00)\.\x00(?P<d>[0-9]\x00)?'),
+    (rb'\bA|B\x41', rb'\bA\x00|B\x00\x41\x00'),
+])
+def test_widen_translates_each_atom(source, wide):
+    assert widen(source) == wide
+
+
+def test_unsupported_groups_and_encodings_are_rejected():
+    with pytest.raises(ValueError):
+        widen(rb'(?i)abc')
+    with pytest.raises(ValueError):
+        compile_dual(RFC_PATTERN, ('utf-8',))
+    with pytest.raises(ValueError):
+        compile_dual(RFC_PATTERN, ())
+
+
+@pytest.mark.parametrize("pattern", [RFC_PATTERN, AMOUNT_PATTERN, DATE_PATTERN, CFDI_ATTRIBUTE_PATTERN])
+def test_wide_pattern_finds_the_same_matches_and_groups(pattern):
+    rng = random.Random(8)
+    pieces = []
+    for i in range(300):
+        pieces.append(rng.choice([valid_rfc(rng, 3 + i % 2), f'{rng.randint(0, 99999)}.{rng.randint(0, 99):02d}',
+                                  f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                                  f'{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2023',
+                                  f'Importe="{rng.randint(1, 9999)}.50"', '1234567.891', 'ABC991332XYZ']))
+        pieces.append(rng.choice([' ', '|', 'x', '9', '"']))
+    text = ''.join(pieces)
+    (narrow_regex, _), (wide_regex, width) = compile_dual(pattern)
+    expected = [(match.start(), match.groups(), match.group(0)) for match in narrow_regex.finditer(text.encode('ascii'))]
+    found = [(match.start() // width, tuple(narrow(group, width) for group in match.groups()), narrow(match.group(0), width))
+             for match in wide_regex.finditer(text.encode('utf-16-le'))]
+    assert expected and found == expected
+
+
+def _mixed_backup(path, rng):
+    """Registros en VARCHAR y NVARCHAR; algunos NVARCHAR en offsets impares y cruzando bloques"""
+    rfcs = [valid_rfc(rng, 3 + i % 2) for i in range(40)]
+    parts, expected = [], []
+    size = 0
+    for i in range(1500):
+        padding = bytes(rng.randrange(1, 32) for _ in range(rng.randint(10, 90) | (i % 2)))
+        rfc = rng.choice(rfcs)
+        record = f'{rfc} Importe {rng.randint(1, 99999)}.{rng.randint(0, 99):02d} nomina'
+        wide = i % 3 == 0
+        data = record.encode('utf-16-le') if wide else record.encode('ascii')
+        expected.append((size + len(padding), rfc, wide))
+        parts += [padding, data]
+        size += len(padding) + len(data)
+    path.write_bytes(b''.join(parts))
+    return expected
+
+
+def test_utf16_hits_are_found_with_offsets_and_narrowed_values(tmp_path):
+    expected = _mixed_backup(tmp_path / "mixto.bak", random.Random(6))
+    results = {}
+    for workers in (1, 3):
+        plugins = [_Hits(RFCConsumer), _Hits(AmountConsumer),
+                   _Hits(partial(KeywordConsumer, keywords=['NOMINA'], ignore_case=True, context=(6, 0)))]
+        run_plugins(str(tmp_path / "mixto.bak"), plugins, chunk_size=20000, workers=workers)
+        results[workers] = [plugin.hits for plugin in plugins]
+    assert results[3] == results[1]
+    rfcs, amounts, keywords = results[1]
+    assert [(offset, value.decode('ascii')) for value, offset in rfcs] == [(offset, rfc) for offset, rfc, _ in expected]
+    assert len(amounts) == len(expected) and all(re.fullmatch(rb'[0-9]+\.[0-9]{2}', value) for value, _ in amounts)
+    # Contexto de la keyword en UTF-16: un byte por carácter, alineado al hit
+    assert len(keywords) == len(expected)
+    assert all(re.fullmatch(rb'[ 0-9]+\.[0-9]{2} ', context) and len(context) == 6 for _, _, context in keywords)
+
+
+def test_ascii_only_consumer_skips_utf16(tmp_path):
+    expected = _mixed_backup(tmp_path / "mixto.bak", random.Random(6))
+    for encodings, wide in (((ASCII,), False), ((UTF16LE,), True)):
+        plugin = _Hits(partial(RFCConsumer, encodings=encodings))
+        run_plugins(str(tmp_path / "mixto.bak"), [plugin], chunk_size=CHUNK)
+        assert [offset for _, offset in plugin.hits] == [offset for offset, _, is_wide in expected if is_wide == wide]
@@ -0,0 +1,72 @@
+import pytest
+
+from efos_detector import load_rfcs
+from efos_list import EFOSIndex, build_index
+from extract_accounting_data import AccountingDataExtractor
+from scan_engine import run_plugins
+
+
+def _index(tmp_path, rows):
+    csv_path = tmp_path / "69b.csv"
+    lines = ["Listado completo 69-B", "No,RFC,Nombre,Situación"]
+    lines += [f"{i},{rfc},CONTRIBUYENTE {i},{status}" for i, (rfc, status) in enumerate(rows, 1)]
+    csv_path.write_bytes("\n".join(lines).encode("latin-1"))
+    index_path = tmp_path / "69b.idx"
+    build_index(csv_path, index_path)
+    return EFOSIndex(index_path)
+
+
+def test_enie_rfcs_keep_byte_order(tmp_path):
+    # Ñ ordena después de Z en bytes: con '?' el archivo quedaba desordenado para la búsqueda binaria
+    index = _index(tmp_path, [
+        ("AÑO010101AB1", "Definitivo"),
+        ("ABC010101AB3", "Presunto"),
+        ("AZZ010101AB5", "Desvirtuado"),
+        ("A&B010101AB7", "Definitivo"),
+    ])
+    assert index.status("AÑO010101AB1") == b'D'
+    assert index.status("ABC010101AB3") == b'P'
+    assert index.status("AZZ010101AB5") == b'V'
+    assert index.status("A&B010101AB7") == b'D'
+    # La Ñ no se confunde con otro carácter reemplazado
+    assert index.status("A?O010101AB1") is None
+    assert index.status("ANO010101AB1") is None
+
+
+def test_screen_splits_hits_and_ambiguous(tmp_path):
+    index = _index(tmp_path, [("AÑO010101AB1", "Definitivo"), ("AZZ010101AB5", "Desvirtuado")])
+    result = index.screen(["AÑO010101AB1", "AZZ010101AB5", "XAXX010101000"])
+    assert result["hits"] == [{"rfc": "AÑO010101AB1", "status": "Definitivo"}]
+    assert result["ambiguous"] == [{"rfc": "AZZ010101AB5", "status": "Desvirtuado"}]
+    assert result["clean"] == 1
+
+
+def test_most_severe_status_wins(tmp_path):
+    index = _index(tmp_path, [("ABC010101AB3", "Desvirtuado"), ("ABC010101AB3", "Definitivo")])
+    assert len(index) == 1
+    assert index.status("abc010101ab3") == b'D'
+
+
+def _scanned(bak, tmp_path, dedupe='exact'):
+    extractor = AccountingDataExtractor(str(bak), dedupe=dedupe, dedupe_mb=8)
+    run_plugins(str(bak), [extractor], chunk_size=64 * 1024)
+    store = tmp_path / f"results_{dedupe}.sqlite"
+    extractor.save_store(store, "Empresa", "EMP010101AAA")
+    return extractor.generate_summary("Empresa", "EMP010101AAA"), store
+
+
+def test_detector_reads_every_rfc_not_the_summary_sample(bak, tmp_path):
+    summary, store = _scanned(bak, tmp_path)
+    assert summary['statistics']['total_rfcs'] == 150 and len(summary['rfcs']) == 50
+    rfcs = load_rfcs(summary, store=str(store))
+    assert len(rfcs) == 150 and set(summary['rfcs']) <= set(rfcs)
+    assert sorted(load_rfcs(summary, bak=str(bak), cache=None)) == sorted(rfcs)
+    # Sin respaldo ni almacén no se analiza en silencio la muestra truncada
+    with pytest.raises(ValueError, match="truncada"):
+        load_rfcs(summary)
+
+
+def test_detector_refuses_store_without_enumerated_rfcs(bak, tmp_path):
+    summary, store = _scanned(bak, tmp_path, dedupe='approx')
+    with pytest.raises(ValueError, match="--bak"):
+        load_rfcs(summary, store=str(store))
@@ -0,0 +1,90 @@
+import tracemalloc
+
+import pytest
+
+import extract_xmls
+from extract_xmls import read_cfdi, scan_directory
+
+UUID = "6F9A1C2E-4B7D-4E8A-9C3B-1D2E3F4A5B6C"
+
+
+def cfdi(conceptos=3, total="1160.00", addenda=0, broken_after=None):
+    """CFDI 4.0 con `conceptos` Conceptos; `broken_after` mete XML inválido tras ese Concepto"""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n'
+             '<cfdi:Comprobante xmlns:cfdi="http://www.sat.gob.mx/cfd/4" xmlns:tfd="http://www.sat.gob.mx/TimbreFiscalDigital" '
+             f'Version="4.0" Fecha="2024-05-01T10:00:00" SubTotal="1000.00" Total="{total}" Moneda="MXN" '
+             'TipoDeComprobante="I">',
+             '<cfdi:Emisor Rfc="EKU9003173C9" Nombre="ESCUELA KEMPER URGATE" RegimenFiscal="601"/>',
+             '<cfdi:Receptor Rfc="XAXX010101000" Nombre="PUBLICO EN GENERAL" UsoCFDI="S01"/>',
+             '<cfdi:Conceptos>']
+    for i in range(conceptos):
+        parts.append(f'<cfdi:Concepto ClaveProdServ="78101800" Cantidad="1" Descripcion="Flete {i}" '
+                     f'ValorUnitario="10.00" Importe="10.00"><cfdi:Impuestos><cfdi:Traslados>'
+                     f'<cfdi:Traslado Base="10.00" Impuesto="002" TasaOCuota="0.160000" Importe="1.60"/>'
+                     f'</cfdi:Traslados></cfdi:Impuestos></cfdi:Concepto>')
+        if i == broken_after:
+            parts.append('<cfdi:Concepto Descripcion=sin comillas>')
+    parts.append('</cfdi:Conceptos><cfdi:Complemento>'
+                 f'<tfd:TimbreFiscalDigital Version="1.1" UUID="{UUID}" FechaTimbrado="2024-05-01T10:05:00"/>'
+                 '</cfdi:Complemento>')
+    if addenda:
+        parts.append('<cfdi:Addenda>' + '<Nota Texto="relleno de la addenda"/>' * addenda + '</cfdi:Addenda>')
+    parts.append('</cfdi:Comprobante>')
+    return ''.join(parts).encode('utf-8')
+
+
+def test_fields_and_timbre_from_the_tail(tmp_path):
+    path = tmp_path / "a.xml"
+    path.write_bytes(cfdi())
+    data, reason = read_cfdi(path)
+    assert reason is None
+    assert data == {"uuid": UUID, "rfc_emisor": "EKU9003173C9", "nombre_emisor": "ESCUELA KEMPER URGATE",
+                    "rfc_receptor": "XAXX010101000", "total": 1160.0, "subtotal": 1000.0, "tipo": "I",
+                    "fecha": "2024-05-01T10:00:00", "moneda": "MXN"}
+
+
+def test_conceptos_are_not_parsed(tmp_path):
+    # Un Concepto inválido muy adentro no importa: el parseo termina tras el Receptor
+    path = tmp_path / "a.xml"
+    path.write_bytes(cfdi(conceptos=3000, broken_after=2500))
+    data, reason = read_cfdi(path)
+    assert reason is None and data["uuid"] == UUID
+
+
+def test_timbre_before_a_large_addenda_is_parsed_with_flat_memory(tmp_path):
+    path = tmp_path / "a.xml"
+    path.write_bytes(cfdi(conceptos=20000, addenda=2000))
+    assert path.stat().st_size > 20 * extract_xmls.TAIL_BYTES
+    tracemalloc.start()
+    data, reason = read_cfdi(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert reason is None and data["uuid"] == UUID
+    # Sin limpiar los elementos cerrados, 20 mil Conceptos ocupan decenas de MB
+    assert peak < 2 * 1024 * 1024
+
+
+@pytest.mark.parametrize("content,reason", [
+    (b'<cfdi:Comprobante Total="1.00"><sin cerrar', 'xml_mal_formado'),
+    (b'<Factura Total="1.00"/>', 'sin_comprobante'),
+    (cfdi(total="N/A"), 'importe_invalido'),
+])
+def test_discard_reasons(tmp_path, content, reason):
+    path = tmp_path / "a.xml"
+    path.write_bytes(content)
+    assert read_cfdi(path) == (None, reason)
+    assert read_cfdi(tmp_path / "no_existe.xml") == (None, 'error_lectura')
+
+
+def test_scan_directory_counts_discards_by_reason(tmp_path):
+    base = tmp_path / "xml" / "A"
+    base.mkdir(parents=True)
+    for i in range(5):
+        (base / f"ok{i}.xml").write_bytes(cfdi())
+    (base / "roto.xml").write_bytes(b'<a><b></a>')
+    (base / "otro.xml").write_bytes(b'<Factura/>')
+    stats = {}
+    written = scan_directory(tmp_path / "xml", tmp_path / "out.jsonl", workers=1, batch_size=2, stats=stats)
+    assert written == 5 and stats['files'] == 7
+    assert stats['discarded'] == {'xml_mal_formado': 1, 'sin_comprobante': 1}
+    assert len((tmp_path / "out.jsonl").read_text().splitlines()) == 5
@@ -0,0 +1,45 @@
+import random
+import re
+
+from keyword_automaton import KeywordAutomaton
+
+KEYWORDS = ["poliza", "cpoliza", "bono", "bonos", "sueldo", "sue", "efectivo", "viaticos"]
+
+
+def _brute_force(data, keywords, ignore_case=True):
+    haystack = data.lower() if ignore_case else data
+    hits = []
+    for keyword in keywords:
+        needle = keyword.encode('ascii')
+        needle = needle.lower() if ignore_case else needle
+        hits += [(m.start(), needle) for m in re.finditer(b'(?=' + re.escape(needle) + b')', haystack)]
+    return sorted(hits)
+
+
+def test_hits_equal_brute_force_including_overlaps():
+    rng = random.Random(11)
+    words = KEYWORDS + ["CPOLIZA", "Bonos", "SUELDOS", "xx", "pol", "\x00\x01"]
+    data = b' '.join(rng.choice(words).encode('ascii') + bytes(rng.randrange(0, 4)) for _ in range(2000))
+    automaton = KeywordAutomaton(KEYWORDS)
+    assert sorted(automaton.iter_hits(data)) == _brute_force(data, KEYWORDS)
+    # Mismo resultado sobre una vista (mmap)
+    assert sorted(automaton.iter_hits(memoryview(data))) == _brute_force(data, KEYWORDS)
+
+
+def test_nested_keywords_are_all_reported():
+    automaton = KeywordAutomaton(["poliza", "cpoliza", "bono", "bonos"])
+    assert list(automaton.iter_hits(b"CPOLIZA bonos")) == [(0, b"cpoliza"), (1, b"poliza"), (8, b"bono"),
+                                                         (8, b"bonos")]
+
+
+def test_case_sensitive_and_empty():
+    automaton = KeywordAutomaton(["Bono"], ignore_case=False)
+    assert list(automaton.iter_hits(b"bono Bono BONO")) == [(5, b"Bono")]
+    assert list(KeywordAutomaton([]).iter_hits(b"bono")) == []
+
+
+def test_utf16_hits_and_context():
+    automaton = KeywordAutomaton(["bono"])
+    data = "pago bono".encode('utf-16-le')
+    assert list(automaton.keywords_at(data, 10, width=2)) == [b"bono"]
+    assert automaton.find_all(b"pago de bono anual", context=(3, 8)) == [(8, b"bono", b"de bono anu")]
@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+
+import llm_client
+from efos_detector import EFOSDetector, parse_json_response
+from llm_client import FakeClient, InvalidResponse, LLMRunner, ResponseCache, estimate_tokens, token_batches
+
+
+class Unauthenticated(Exception):
+    pass
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Esperas del backoff registradas sin dormir"""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(llm_client.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def _scripted(*replies):
+    """Responder que devuelve (o lanza) cada respuesta en orden"""
+    replies = list(replies)
+
+    def responder(prompt):
+        reply = replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    return responder
+
+
+def test_token_batches_respect_budget_and_order():
+    items = [f"RFC{i:09d}" for i in range(200)]
+    batches = list(token_batches(items, max_tokens=60, overhead_tokens=10))
+    assert [item for batch in batches for item in batch] == items
+    for batch in batches:
+        assert 10 + sum(estimate_tokens(json.dumps(item)) + 1 for item in batch) <= 60
+    # Un elemento que no cabe solo va en su propio lote
+    assert list(token_batches(["x" * 1000, "a"], max_tokens=20)) == [["x" * 1000], ["a"]]
+
+
+def test_cache_avoids_second_call(tmp_path):
+    client = FakeClient(lambda prompt: '{"ok": 1}')
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    assert _run(LLMRunner(client, cache=cache).complete("p")) == '{"ok": 1}'
+    runner = LLMRunner(client, cache=cache)
+    assert _run(runner.complete("p")) == '{"ok": 1}'
+    assert client.calls == 1 and runner.stats['cached'] == 1
+    # Otro modelo es otra llave
+    other = FakeClient(lambda prompt: '{"ok": 2}', model_name="otro")
+    assert _run(LLMRunner(other, cache=cache).complete("p")) == '{"ok": 2}'
+    cache.close()
+
+
+def test_invalid_response_is_not_cached(tmp_path):
+    client = FakeClient(_scripted('{"total_rfcs_analyzed": 3, "flagged', '{"total_rfcs_analyzed": 3}'))
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    runner = LLMRunner(client, cache=cache)
+    with pytest.raises(InvalidResponse):
+        _run(runner.complete("p", validate=parse_json_response))
+    assert cache.get(ResponseCache.key("fake", "p")) is None and runner.stats['invalid'] == 1
+    assert _run(runner.complete("p", validate=parse_json_response)) == {"total_rfcs_analyzed": 3}
+    assert client.calls == 2
+    cache.close()
+
+
+def test_invalid_cached_entry_is_requested_again(tmp_path):
+    cache = ResponseCache(tmp_path / "llm.sqlite")
+    cache.put(ResponseCache.key("fake", "p"), "fake", '{"truncado"')
+    client = FakeClient(lambda prompt: '{"ok": true}')
+    assert _run(LLMRunner(client, cache=cache).complete("p", validate=parse_json_response)) == {"ok": True}
+    assert client.calls == 1
+    assert cache.get(ResponseCache.key("fake", "p")) == '{"ok": true}'
+    cache.close()
+
+
+def test_rate_limit_and_transient_errors_back_off_exponentially(sleeps):
+    client = FakeClient(_scripted(ResourceExhausted("429 quota"), ConnectionError("reset"),
+                                  RuntimeError("503 Service Unavailable"), "listo"))
+    runner = LLMRunner(client, base_delay=1.0)
+    assert _run(runner.complete("p")) == "listo"
+    assert client.calls == 4 and runner.stats['retries'] == 3
+    # Base * 2^intento (doble ante cuota), con jitter entre 50% y 100%
+    for delay, full in zip(sleeps, (2.0, 2.0, 4.0)):
+        assert full * 0.5 <= delay <= full
+
+
+@pytest.mark.parametrize("error", [Unauthenticated("API key not valid"), ValueError("prompt inválido"),
+                                   TypeError("bug")])
+def test_permanent_errors_are_not_retried(sleeps, error):
+    client = FakeClient(_scripted(error, "nunca"))
+    with pytest.raises(type(error)):
+        _run(LLMRunner(client).complete("p"))
+    assert client.calls == 1 and sleeps == []
+
+
+def test_retries_give_up_after_max(sleeps):
+    client = FakeClient(lambda prompt: (_ for _ in ()).throw(ResourceExhausted("429")))
+    with pytest.raises(ResourceExhausted):
+        _run(LLMRunner(client, max_retries=2).complete("p"))
+    assert client.calls == 3 and len(sleeps) == 2
+
+
+def test_concurrency_is_bounded():
+    active = {"now": 0, "max": 0}
+
+    class Tracking(FakeClient):
+        async def generate(self, prompt):
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            return prompt.upper()
+
+    runner = LLMRunner(Tracking(None), concurrency=2)
+    prompts = [f"p{i}" for i in range(8)]
+    assert _run(runner.complete_many(prompts)) == [p.upper() for p in prompts]
+    assert active["max"] == 2
+
+
+def test_efos_detector_merges_batches_and_reports_bad_ones(tmp_path):
+    def responder(prompt):
+        rfcs = json.loads(prompt.split("RFCs a analizar:")[1].split("INSTRUCCIONES")[0])
+        if "BAD010101AAA" in rfcs:
+            return '{"total_rfcs_analyzed": '
+        flagged = [{"rfc": rfc, "risk_level": "HIGH"} for rfc in rfcs if rfc.startswith("EFO")]
+        return json.dumps({"total_rfcs_analyzed": len(rfcs),
+                           "risk_summary": {"low": len(rfcs) - len(flagged), "medium": 0, "high": len(flagged),
+                                            "critical": 0},
+                           "flagged_rfcs": flagged, "general_observations": "", "compliance_score": 90})
+
+    client = FakeClient(responder)
+    detector = EFOSDetector(client=client, cache_path=tmp_path / "llm.sqlite", batch_tokens=400)
+    rfcs = ["EFO010101AAA"] + [f"AAA0101{i:02d}AAA" for i in range(40)] + ["BAD010101AAA"]
+    result = detector.analyze_rfcs_batch(rfcs)
+    assert client.calls > 1
+    assert [item["rfc"] for item in result["flagged_rfcs"]] == ["EFO010101AAA"]
+    assert "error" in result
+    # El lote con JSON truncado se vuelve a pedir en la siguiente corrida; los demás salen de la caché
+    calls = client.calls
+    detector.analyze_rfcs_batch(rfcs)
+    assert client.calls == calls + 1
@@ -0,0 +1,134 @@
+import struct
+from datetime import datetime
+
+from mssql_pages import (PAGE_HEADER_SIZE, PAGE_SIZE, SYSALLOCUNITS, SYSCOLPARS, SYSROWSETS, SYSSCHOBJS,
+                         BakPageIndex, is_coi_table, mtf_descriptors, parse_header, parse_record)
+
+POLIZAS, OTRA = 1001, 1002
+
+
+def _record(fixed, variable=(), nulls=(), columns=None, status=0x30):
+    """Registro FixedVar: estado, fin de la parte fija, columnas, bitmap de nulos y columnas variables"""
+    columns = columns or 8
+    bitmap = bytearray((columns + 7) // 8)
+    for index in nulls:
+        bitmap[index // 8] |= 1 << (index % 8)
+    head = struct.pack('<BBH', status, 0, 4 + len(fixed)) + fixed + struct.pack('<H', columns) + bytes(bitmap)
+    end = len(head) + 2 + 2 * len(variable)
+    ends = []
+    for value in variable:
+        end += len(value)
+        ends.append(end)
+    return head + struct.pack(f'<H{len(variable)}H', len(variable), *ends) + b''.join(variable)
+
+
+def _page(obj_id, records, index_id=0, page_id=1):
+    body = b''.join(records)
+    page = bytearray(PAGE_SIZE)
+    struct.pack_into('<BBBBHH', page, 0, 1, 1, 0, 0, 0, index_id)
+    struct.pack_into('<H i HH IH', page, 22, len(records), obj_id, 0, PAGE_HEADER_SIZE + len(body), page_id, 1)
+    page[PAGE_HEADER_SIZE:PAGE_HEADER_SIZE + len(body)] = body
+    offset = PAGE_HEADER_SIZE
+    for slot, record in enumerate(records):
+        struct.pack_into('<H', page, PAGE_SIZE - 2 * (slot + 1), offset)
+        offset += len(record)
+    return bytes(page)
+
+
+def _table(object_id, name):
+    """Filas de catálogo de una tabla de usuario con su única unidad de asignación (índice 0)"""
+    auid = rowset = object_id << 16
+    return ([_record(struct.pack('<qBq', auid, 1, rowset))],
+            [_record(struct.pack('<qBi', rowset, 1, object_id))],
+            [_record(struct.pack('<i', object_id) + bytes(9) + b'U ', [name.encode('utf-16-le')])])
+
+
+def _column(object_id, colid, name, xtype, length, prec=0, scale=0):
+    return _record(struct.pack('<ihiBihBB', object_id, 0, colid, xtype, 0, length, prec, scale),
+                   [name.encode('utf-16-le')])
+
+
+def _datetime(value):
+    delta = value - datetime(1900, 1, 1)
+    return struct.pack('<Ii', delta.seconds * 300, delta.days)
+
+
+def _poliza(number, when, cents, active, concept):
+    fixed = struct.pack('<i', number) + _datetime(when) + struct.pack('<q', cents * 100) + bytes([active])
+    return _record(fixed, [concept.encode('latin-1')] if concept is not None else [b''],
+                   nulls=() if concept is not None else (4,), columns=5)
+
+
+def _write_backup(path):
+    """
+    Respaldo sintético: descriptor MTF, relleno, páginas del catálogo y de dos tablas,
+    un hueco largo (como el que dejan los encabezados de stream) y más páginas de datos
+    """
+    polizas, otra = _table(POLIZAS, 'POLIZAS24'), _table(OTRA, 'BITACORA')
+    columns = [_column(POLIZAS, 1, 'NUM_POLIZ', 56, 4), _column(POLIZAS, 2, 'FECHA', 61, 8),
+               _column(POLIZAS, 3, 'IMPORTE', 60, 8), _column(POLIZAS, 4, 'ACTIVA', 104, 1),
+               _column(POLIZAS, 5, 'CONCEPTO', 167, 120), _column(OTRA, 1, 'TEXTO', 167, 200)]
+    first = [_poliza(1, datetime(2024, 3, 15, 10, 30), 123456, 1, 'Pago a proveedor Ñandú'),
+             _poliza(2, datetime(2024, 3, 16), 500, 0, None)]
+    second = [_poliza(3, datetime(2024, 4, 1, 8), 99, 1, 'Nómina quincenal')]
+    # Un registro fantasma (estado con bits de tipo) no es una fila
+    ghost = _record(bytes(21), [b'x'], columns=5, status=0x30 | (5 << 1))
+    dblk = bytearray(1024)
+    dblk[:4] = b'TAPE'
+    dblk[512:516] = b'SSET'
+    pages = [_page(SYSALLOCUNITS, polizas[0] + otra[0]), _page(SYSROWSETS, polizas[1] + otra[1]),
+             _page(SYSSCHOBJS, polizas[2] + otra[2]), _page(SYSCOLPARS, columns),
+             _page(POLIZAS, first + [ghost], page_id=20), _page(OTRA, [_record(b'', [b'x' * 200])] * 30, page_id=21)]
+    tail = [_page(OTRA, [_record(b'', [b'y' * 200])] * 30, page_id=22), _page(POLIZAS, second, page_id=23)]
+    data = bytes(dblk) + b''.join(pages) + b'\xff' * (40 * 1024 + 512) + b''.join(tail) + bytes(512)
+    path.write_bytes(data)
+    return path
+
+
+def test_parse_header_rejects_non_pages():
+    page = _page(POLIZAS, [])
+    assert parse_header(page, 0, 0).obj_id == POLIZAS
+    assert parse_header(b'\x00' * PAGE_HEADER_SIZE, 0, 0) is None
+    broken = bytearray(page)
+    struct.pack_into('<H', broken, 36, 0)
+    assert parse_header(bytes(broken), 0, 0) is None
+
+
+def test_catalog_maps_pages_to_tables(tmp_path):
+    path = _write_backup(tmp_path / "coi.bak")
+    assert [block for block, _ in mtf_descriptors(path)] == ['TAPE', 'SSET']
+    index = BakPageIndex(path)
+    # Las páginas tras el hueco también se encuentran al resincronizar
+    assert index.page_count == 8
+    assert index.tables() == {'POLIZAS24': (POLIZAS, 2), 'BITACORA': (OTRA, 2)}
+    assert [column.name for column in index.catalog.schema(POLIZAS)] == \
+        ['NUM_POLIZ', 'FECHA', 'IMPORTE', 'ACTIVA', 'CONCEPTO']
+    assert is_coi_table('POLIZAS24') and not is_coi_table('BITACORA')
+
+
+def test_rows_are_decoded_and_only_wanted_pages_are_read(tmp_path):
+    path = _write_backup(tmp_path / "coi.bak")
+    index = BakPageIndex(path)
+    before = index.reader.bytes_read
+    rows = list(index.iter_rows({'POLIZAS24'}))
+    assert [row for _, _, row in rows] == [
+        {'NUM_POLIZ': 1, 'FECHA': '2024-03-15T10:30:00', 'IMPORTE': 1234.56, 'ACTIVA': True,
+         'CONCEPTO': 'Pago a proveedor Ñandú'},
+        {'NUM_POLIZ': 2, 'FECHA': '2024-03-16T00:00:00', 'IMPORTE': 5.0, 'ACTIVA': False, 'CONCEPTO': None},
+        {'NUM_POLIZ': 3, 'FECHA': '2024-04-01T08:00:00', 'IMPORTE': 0.99, 'ACTIVA': True,
+         'CONCEPTO': 'Nómina quincenal'},
+    ]
+    assert {table for table, _, _ in rows} == {'POLIZAS24'}
+    # Solo las dos páginas de la tabla se leen completas; las de BITACORA no
+    assert index.reader.bytes_read - before == 2 * PAGE_SIZE
+
+
+def test_ghost_and_truncated_records_are_skipped():
+    ghost = _record(bytes(4), [b'x'], status=0x30 | (5 << 1))
+    page = bytearray(PAGE_SIZE)
+    page[PAGE_HEADER_SIZE:PAGE_HEADER_SIZE + len(ghost)] = ghost
+    assert parse_record(bytes(page), PAGE_HEADER_SIZE) is None
+    record = _record(bytes(4), [b'abc'])
+    # Fin de columna variable fuera de la página
+    page[PAGE_SIZE - len(record):] = record[:-5] + struct.pack('<H', 0x7FFF) + b'abc'
+    assert parse_record(bytes(page), PAGE_SIZE - len(record)) is None
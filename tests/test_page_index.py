@@ -0,0 +1,82 @@
+import os
+import random
+import re
+
+import page_index
+from conftest import valid_rfc
+from page_index import (BLOCK_SIZE, BLOOM_FULL, HAS_AMOUNT, HAS_RFC, PageIndex, amount_token, ensure_index,
+                        ranges, rfc_token)
+from scan_engine import AMOUNT_PATTERN, run_plugins
+
+CHUNK = 64 * 1024
+
+
+def _build(bak, chunk_size=CHUNK, workers=1):
+    index = PageIndex(bak)
+    run_plugins(str(bak), [index], chunk_size=chunk_size, workers=workers)
+    return index
+
+
+def _columns(index):
+    return [bytes(column) for column in index.blocks.columns()]
+
+
+def test_split_blocks_are_combined_not_overwritten(bak):
+    reference = _build(bak)
+    # 20000 no es múltiplo de 8 KB: ventanas y rangos parten bloques por la mitad
+    for workers in (1, 3):
+        assert _columns(_build(bak, chunk_size=20000, workers=workers)) == _columns(reference)
+    # Cada monto se cuenta una sola vez
+    assert sum(reference.blocks.amounts) == len(AMOUNT_PATTERN.findall(bak.read_bytes())) == 2000
+    density = reference.blocks.density
+    assert all(density[block] > 0 for block in range(reference.blocks.count))
+
+
+def test_find_confirms_candidates(bak):
+    index = _build(bak, chunk_size=20000, workers=3)
+    data = bak.read_bytes()
+    rfc = re.search(rb'[A-Z]{4}[0-9]{6}[A-Z0-9]{3}', data).group(0)
+    expected = [match.start() for match in re.finditer(re.escape(rfc), data)]
+    assert index.find(rfc_token(rfc), rfc) == expected
+    assert set(index.candidates(rfc_token(rfc))) >= {offset // BLOCK_SIZE for offset in expected}
+    assert all(index.blocks.flags[offset // BLOCK_SIZE] & HAS_RFC for offset in expected)
+    assert ranges([1, 2, 3, 7]) == [(BLOCK_SIZE, 4 * BLOCK_SIZE), (7 * BLOCK_SIZE, 8 * BLOCK_SIZE)]
+
+
+def test_dense_block_drops_its_bloom(tmp_path, capsys):
+    rng = random.Random(4)
+    # Bloque 0 con cientos de montos distintos; bloque 1 con uno solo
+    dense = b' '.join(f'{rng.randint(1000, 999999)}.{rng.randint(0, 99):02d}'.encode('ascii')
+                      for _ in range(700))
+    bak = tmp_path / "denso.bak"
+    bak.write_bytes(dense[:BLOCK_SIZE - 16].ljust(BLOCK_SIZE, b'\x00') + b'1234.56'.ljust(BLOCK_SIZE, b'\x00'))
+    index = _build(bak)
+    assert index.blocks.flags[0] & BLOOM_FULL and not index.blocks.flags[1] & BLOOM_FULL
+    assert "1 con Bloom saturado" in capsys.readouterr().out
+    # El bloque denso siempre es candidato; el disperso solo para su monto
+    assert index.candidates(amount_token(123456)) == [0, 1]
+    assert index.candidates(amount_token(777)) == [0]
+    assert index.blocks_with(HAS_AMOUNT) == [0, 1]
+
+
+def test_sidecar_is_rejected_when_the_backup_changes(bak, tmp_path):
+    index = ensure_index(bak)
+    path = index.save()
+    assert path == str(bak) + page_index.SIDECAR_SUFFIX
+    loaded = PageIndex.load(bak)
+    assert _columns(loaded) == _columns(index) and loaded.fingerprint == index.fingerprint
+
+    # Mismo tamaño y contenido distinto en un bloque muestreado: otra huella
+    data = bytearray(bak.read_bytes())
+    data[10] ^= 0xFF
+    stat = os.stat(bak)
+    bak.write_bytes(bytes(data))
+    os.utime(bak, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert PageIndex.load(bak) is None
+
+    # Un sidecar de otra versión del formato se reconstruye
+    with open(path, 'r+b') as f:
+        f.write(b'BAKPIDX2')
+    assert PageIndex.load(bak) is None
+    rebuilt = ensure_index(bak)
+    assert PageIndex.load(bak).fingerprint == rebuilt.fingerprint
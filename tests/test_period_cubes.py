@@ -0,0 +1,92 @@
+import gc
+import random
+import tempfile
+from array import array
+
+import pytest
+
+import period_cubes
+import result_store
+from conftest import write_bak
+from period_cubes import PeriodCubes
+from scan_engine import run_plugins
+
+CHUNK = 64 * 1024
+
+
+def _cubes(bak, **kwargs):
+    cubes = PeriodCubes(str(bak))
+    run_plugins(str(bak), [cubes], chunk_size=CHUNK, **kwargs)
+    cubes.cubes.pop("generated")
+    return cubes.cubes
+
+
+def test_copies_are_deduped_and_undated_hits_counted(tmp_path):
+    record = b'2024-03-05 601-84 Importe="1500.00" pago en efectivo'
+    padding = bytes(1000)
+    bak = tmp_path / "test.bak"
+    bak.write_bytes(padding + record + padding + record + padding + b'Importe="99.00" varios' + padding)
+    cubes = _cubes(bak)
+    # La segunda copia del mismo movimiento no se suma; las keywords sí se cuentan por ocurrencia
+    assert [(row["month"], row["amounts"], row["total"], row["keywords"]) for row in cubes["months"]] == \
+        [("2024-03", 1, 1500.0, {"efectivo": 2})]
+    assert [(row["month"], row["account"]) for row in cubes["accounts"]] == [("2024-03", "601-84")]
+    assert cubes["undated"] == {"amounts": 1, "keywords": 1}
+
+
+def test_hits_are_spooled_and_parallel_equals_sequential(tmp_path, monkeypatch):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(spool_dir))
+    monkeypatch.setattr(result_store, "SPOOL_FLUSH_ROWS", 100)
+    monkeypatch.setattr(period_cubes, "SPOOL_FLUSH_ROWS", 100)
+    pending = []
+    finish = PeriodCubes.finish
+
+    def tracked_finish(self):
+        pending.append(max(len(spool.rows) for spool in (self.amounts, self.dates, self.accounts, self.keywords)))
+        pending.append(len(self.amounts))
+        finish(self)
+
+    monkeypatch.setattr(PeriodCubes, "finish", tracked_finish)
+    bak = write_bak(tmp_path / "test.bak", records=1500)
+    sequential = _cubes(bak)
+    # En memoria queda a lo más un lote por spool; el resto está en archivos temporales
+    assert pending[0] < 100 and pending[1] == 1500
+    assert _cubes(bak, workers=3) == sequential
+    cache = str(tmp_path / "cache.sqlite")
+    _cubes(bak, cache=cache)
+    assert _cubes(bak, cache=cache) == sequential
+    assert sum(row["amounts"] for row in sequential["months"]) == 1500
+    gc.collect()
+    assert list(spool_dir.iterdir()) == []
+
+
+def _numpy_or_skip():
+    if period_cubes.np is None:
+        pytest.skip("NumPy no está instalado")
+
+
+def test_digit_stats_numpy_equals_pure_python(monkeypatch):
+    _numpy_or_skip()
+    rng = random.Random(12)
+    # Potencias exactas de 10 y sus vecinos: ahí el log10 en punto flotante se equivoca de dígito
+    edges = [10 ** k + delta for k in range(16) for delta in (-1, 0, 1) if 10 ** k + delta > 0]
+    cents = edges + [rng.randint(1, 10 ** rng.randint(1, 12)) for _ in range(5000)]
+    groups = [rng.randrange(7) for _ in cents]
+    fast = period_cubes.digit_stats_by_group(array('q', groups), array('q', cents), 8)
+    monkeypatch.setattr(period_cubes, "np", None)
+    slow = period_cubes.digit_stats_by_group(array('q', groups), array('q', cents), 8)
+    assert [vars(stats) for stats in fast] == [vars(stats) for stats in slow]
+    # El grupo sin montos queda vacío en ambas rutas
+    assert fast[7].count == 0
+
+
+def test_months_and_cubes_numpy_equal_pure_python(bak, monkeypatch):
+    _numpy_or_skip()
+    days = array('q', [0, 30, 31, 59, 365, 19723, 19754, 20000, -365])
+    fast = period_cubes._months_of(days)
+    with_numpy = _cubes(bak)
+    monkeypatch.setattr(period_cubes, "np", None)
+    assert period_cubes._months_of(days) == fast
+    assert _cubes(bak) == with_numpy
@@ -0,0 +1,67 @@
+import gc
+import sqlite3
+import tempfile
+
+import result_store
+from conftest import write_bak
+from extract_accounting_data import AccountingDataExtractor
+from full_scan import full_scan
+from payroll_hunter import PayrollHunter
+from scan_engine import run_plugins
+
+CHUNK = 64 * 1024
+
+
+def _store_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f"SELECT * FROM {table} ORDER BY rowid").fetchall()
+                for table in ("amounts", "evidence")}
+    finally:
+        conn.close()
+
+
+def test_spooled_rows_are_batched_and_parallel_equals_sequential(tmp_path, monkeypatch):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(spool_dir))
+    monkeypatch.setattr(result_store, "SPOOL_FLUSH_ROWS", 100)
+    pending = []
+    add = result_store.RowSpool.add
+
+    def tracked_add(self, *row):
+        add(self, *row)
+        pending.append(len(self.rows))
+
+    monkeypatch.setattr(result_store.RowSpool, "add", tracked_add)
+    bak = write_bak(tmp_path / "test.bak")
+
+    stores = {}
+    for workers in (1, 3):
+        outputs = full_scan(str(bak), "Empresa", "EMP010101AAA", "emp", chunk_size=CHUNK, workers=workers,
+                            output_dir=tmp_path / f"w{workers}")
+        stores[workers] = _store_rows(outputs["store"])
+    # En memoria nunca hay más de un lote: el resto ya está en el archivo temporal
+    assert pending and max(pending) < 100
+    assert len(stores[1]["amounts"]) == 2000
+    assert len(stores[1]["evidence"]) > 1000
+    assert stores[3] == stores[1]
+    # Los archivos temporales de cada rango se borran al fusionar y al liberar los analizadores
+    gc.collect()
+    assert list(spool_dir.iterdir()) == []
+
+
+def test_approx_dedupe_says_rfcs_are_not_enumerated(tmp_path):
+    bak = write_bak(tmp_path / "test.bak", records=300)
+    for dedupe in ("exact", "approx"):
+        extractor = AccountingDataExtractor(str(bak), dedupe=dedupe, dedupe_mb=8)
+        hunter = PayrollHunter(str(bak), dedupe=dedupe, dedupe_mb=8)
+        run_plugins(str(bak), [extractor, hunter], chunk_size=CHUNK)
+        store = tmp_path / f"results_{dedupe}.sqlite"
+        extractor.save_store(store, "Empresa", "EMP010101AAA")
+        hunter.save_store(store)
+        for report in ("data", "payroll"):
+            summary = result_store.read_summary(store, report)
+            rows = result_store.read_page(store, report, "rfcs")["total"]
+            assert summary["rfcs_enumerated"] is (dedupe == "exact")
+            assert (rows > 0) is summary["rfcs_enumerated"]
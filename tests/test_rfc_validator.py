@@ -0,0 +1,111 @@
+import random
+
+import pytest
+
+import rfc_validator
+from conftest import valid_rfc
+from rfc_validator import FISICA, GENERICO, MORAL, RFCFilter, check_digit, classify, is_valid
+
+# RFCs públicos (ejemplos y ambiente de pruebas del SAT) con su dígito verificador real
+KNOWN_RFCS = [
+    ("EKU9003173C9", MORAL),
+    ("XIA190128J61", MORAL),
+    ("IIA040805DZ4", MORAL),
+    ("SAT970701NN3", MORAL),
+    ("URE180429TM6", MORAL),
+    ("CACX7605101P8", FISICA),
+    ("KAHO641101B39", FISICA),
+    ("JUFA7608212V6", FISICA),
+    ("GOYA780416GM0", FISICA),
+]
+
+
+@pytest.mark.parametrize("rfc,kind", KNOWN_RFCS)
+def test_known_rfcs_have_valid_check_digit(rfc, kind):
+    assert check_digit(rfc) == rfc[-1]
+    assert check_digit(rfc.encode('ascii')) == rfc[-1]
+    assert classify(rfc) == kind
+    assert classify(rfc.lower()) == kind
+    assert classify(rfc.encode('ascii')) == kind
+
+
+@pytest.mark.parametrize("rfc,kind", KNOWN_RFCS)
+def test_any_other_check_digit_is_rejected(rfc, kind):
+    for digit in "0123456789A":
+        if digit != rfc[-1]:
+            assert classify(rfc[:-1] + digit) is None
+
+
+def test_generated_rfcs_are_valid():
+    rng = random.Random(3)
+    for letters, kind in ((3, MORAL), (4, FISICA)):
+        for _ in range(200):
+            assert classify(valid_rfc(rng, letters)) == kind
+
+
+def test_remainders_zero_and_one_map_to_0_and_a():
+    # Residuo 0 → '0' y residuo 1 → 'A'; se buscan cuerpos que produzcan cada caso
+    seen = set()
+    rng = random.Random(5)
+    while len(seen) < 2:
+        rfc = valid_rfc(rng, 4)
+        if rfc[-1] in "0A":
+            seen.add(rfc[-1])
+            assert classify(rfc) == FISICA
+    assert seen == {"0", "A"}
+
+
+def test_generic_rfcs():
+    assert classify("XAXX010101000") == GENERICO
+    assert classify(b"XEXX010101000") == GENERICO
+    assert classify(" xaxx010101000 ") == GENERICO
+
+
+@pytest.mark.parametrize("rfc", [
+    "EKU9002303C9",      # 30 de febrero
+    "EKU9013173C9",      # mes 13
+    "EK19003173C9",      # dígito donde va letra
+    "EKU90031A3C9",      # letra en la fecha
+    "EKU9003173-9",      # homoclave con guion
+    "EKU9003173C",       # longitud 11
+    "EKU9003173C99X",    # longitud 14
+    "ÑKU9003173C9",      # fuera de ASCII
+    "",
+])
+def test_malformed_rfcs_are_rejected(rfc):
+    assert classify(rfc) is None
+    assert not is_valid(rfc)
+
+
+def test_leap_day_is_accepted_in_either_century():
+    # 29/02 existe en 2000 y en 1900 no: basta con un siglo válido; en 2001/1901 no existe
+    body = "ABC000229AB0"
+    assert classify(body[:-1] + check_digit(body)) == MORAL
+    body = "ABC010229AB0"
+    assert classify(body[:-1] + check_digit(body)) is None
+
+
+def test_filter_memoizes_and_counts(monkeypatch):
+    calls = []
+    original = rfc_validator.classify
+
+    def counted(value):
+        calls.append(value)
+        return original(value)
+
+    monkeypatch.setattr(rfc_validator, "classify", counted)
+    rfc_filter = RFCFilter(types=(MORAL,))
+    values = ["EKU9003173C9", "CACX7605101P8", "EKU9003173C0", "EKU9003173C9", "XAXX010101000"] * 3
+    assert rfc_filter.filter(values) == ["EKU9003173C9", "EKU9003173C9"] * 3
+    assert rfc_filter.checked == 15 and rfc_filter.rejected == 9
+    # Cada valor distinto se valida una sola vez
+    assert sorted(calls) == sorted(set(values))
+
+
+def test_filter_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(rfc_validator, "MEMO_LIMIT", 4)
+    rfc_filter = RFCFilter()
+    rng = random.Random(9)
+    rfcs = [valid_rfc(rng) for _ in range(10)]
+    assert rfc_filter.filter(rfcs) == rfcs
+    assert len(rfc_filter.memo) <= 4
@@ -0,0 +1,80 @@
+import random
+
+import scan_engine
+from conftest import valid_rfc
+from extract_accounting_data import AccountingDataExtractor
+from payroll_hunter import PayrollHunter
+from scan_cache import ScanCache, fingerprint
+from scan_engine import run_plugins
+from typed_records import TypedExtractor
+
+CHUNK = 64 * 1024
+
+
+def _scan(bak, cache, workers=1):
+    # Extractor y TypedExtractor tienen consumidores idénticos de montos (mismo stream_key)
+    extractor = AccountingDataExtractor(str(bak))
+    typed = TypedExtractor(str(bak))
+    run_plugins(str(bak), [extractor, typed], chunk_size=CHUNK, workers=workers, cache=cache)
+    return extractor, typed
+
+
+def test_shared_stream_replays_once_per_consumer(bak, tmp_path):
+    cache = str(tmp_path / "cache.sqlite")
+    cold, cold_typed = _scan(bak, cache)
+    warm, warm_typed = _scan(bak, cache)
+    assert cold.amount_stats.count > 0
+    assert warm.amount_stats.count == cold.amount_stats.count
+    assert list(warm_typed.amounts.offsets) == list(cold_typed.amounts.offsets)
+    assert list(warm_typed.dates.values) == list(cold_typed.dates.values)
+
+
+def test_cache_matches_uncached_scan(bak, tmp_path):
+    plain, plain_typed = _scan(bak, None)
+    cache = str(tmp_path / "cache.sqlite")
+    _scan(bak, cache, workers=2)
+    warm, warm_typed = _scan(bak, cache)
+    assert warm.amount_stats.count == plain.amount_stats.count
+    assert sorted(warm.data['rfcs']) == sorted(plain.data['rfcs'])
+    assert list(warm_typed.amounts.values) == list(plain_typed.amounts.values)
+
+
+def test_warm_scan_does_not_read_the_backup(bak, tmp_path, monkeypatch):
+    cache = str(tmp_path / "cache.sqlite")
+    cold = PayrollHunter(str(bak))
+    run_plugins(str(bak), [cold], chunk_size=CHUNK, cache=cache)
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("un escaneo en caché no debe abrir el respaldo")
+
+    monkeypatch.setattr(scan_engine, "open_reader", no_read)
+    warm = PayrollHunter(str(bak))
+    run_plugins(str(bak), [warm], chunk_size=CHUNK, cache=cache)
+    # Las keywords se reproducen con su contexto
+    assert warm.results["suspicious_concepts"].items == cold.results["suspicious_concepts"].items
+    assert dict(warm.results["risk_counts"]) == dict(cold.results["risk_counts"])
+
+
+def test_changed_backup_or_interrupted_stream_is_rescanned(bak, tmp_path):
+    cache = str(tmp_path / "cache.sqlite")
+    _scan(bak, cache)
+    first = fingerprint(bak)
+    data = bytearray(bak.read_bytes())
+    rfc = valid_rfc(random.Random(99))
+    data[:len(rfc) + 2] = f" {rfc} ".encode('ascii')
+    bak.write_bytes(bytes(data))
+    assert fingerprint(bak) != first
+    changed, _ = _scan(bak, cache)
+    assert rfc in set(changed.data['rfcs'])
+
+    # Un flujo que quedó a medias (escaneo interrumpido) no se reproduce: se vuelve a grabar
+    store = ScanCache(cache)
+    store.conn.execute("UPDATE streams SET complete = 0 WHERE fingerprint = ?", (fingerprint(bak),))
+    store.conn.commit()
+    store.close()
+    again, _ = _scan(bak, cache)
+    assert sorted(again.data['rfcs']) == sorted(changed.data['rfcs'])
+    store = ScanCache(cache)
+    assert store.conn.execute("SELECT COUNT(*) FROM streams WHERE fingerprint = ? AND complete = 0",
+                              (fingerprint(bak),)).fetchone()[0] == 0
+    store.close()
@@ -0,0 +1,86 @@
+import math
+import random
+
+from benford_stats import DigitStatsAccumulator
+from streaming_stats import Reservoir, RunningStats
+
+
+def _values(seed=1, n=3000):
+    rng = random.Random(seed)
+    # Magnitudes muy distintas: una suma ingenua pierde los valores chicos
+    return [rng.choice((1e16, -1e16, 0.1, 3.3, 1e-3)) * rng.random() for _ in range(n)]
+
+
+def test_running_sum_is_exact_in_any_merge_order():
+    values = _values()
+    sequential = RunningStats()
+    for value in values:
+        sequential.add(value)
+    assert sequential.total == math.fsum(values)
+    assert sequential.min == min(values) and sequential.max == max(values)
+
+    parts = []
+    for start in range(0, len(values), 700):
+        part = RunningStats()
+        for value in values[start:start + 700]:
+            part.add(value)
+        parts.append(part)
+    merged = RunningStats()
+    for part in reversed(parts):
+        merged.merge(part)
+    merged.merge(RunningStats())
+    assert (merged.count, merged.total, merged.mean) == (sequential.count, sequential.total, sequential.mean)
+
+
+def test_reservoir_merge_equals_sequential_sample():
+    sequential = Reservoir(50)
+    for offset in range(5000):
+        sequential.add(f"item {offset}", offset)
+    merged = Reservoir(50)
+    for start in (4000, 0, 2500):
+        part = Reservoir(50)
+        for offset in range(start, {0: 2500, 2500: 4000, 4000: 5000}[start]):
+            part.add(f"item {offset}", offset)
+        merged.merge(part)
+    assert merged.items == sequential.items and merged.seen == sequential.seen == 5000
+    assert len(sequential.items) == 50
+    # La muestra se reparte por todo el rango, no se queda con los primeros
+    offsets = [int(item.split()[1]) for item in sequential.items]
+    assert offsets == sorted(offsets) and max(offsets) > 2500
+
+
+def test_reservoir_tuple_keys_are_stable():
+    first, second = Reservoir(3), Reservoir(3)
+    for key in [(10, "bono"), (10, "sueldo"), (20, "bono"), (30, "efectivo")]:
+        first.add(key, key)
+    for key in [(30, "efectivo"), (20, "bono"), (10, "sueldo"), (10, "bono")]:
+        second.add(key, key)
+    assert first.items == second.items
+
+
+def test_benford_data_conforms_and_uniform_data_does_not():
+    rng = random.Random(4)
+    benford, uniform = DigitStatsAccumulator(), DigitStatsAccumulator()
+    for _ in range(20000):
+        benford.add_cents(int(10 ** rng.uniform(2, 8)))
+        uniform.add_cents(rng.randint(100000, 999999))
+    assert benford.first_digit_test()["conformity_level"] <= 1
+    assert not benford.first_digit_test()["chi_square_reject"]
+    assert uniform.first_digit_test()["chi_square_reject"]
+    assert uniform.first_digit_test()["conformity"] == "No conformidad"
+    assert DigitStatsAccumulator().first_digit_test() == {"status": "No data"}
+
+
+def test_digit_counts_use_integer_cents_and_merge():
+    stats = DigitStatsAccumulator()
+    for amount in (0.1, 1000.00, 250.00, 19.99, 0.0, -5.0):
+        stats.add(amount)
+    # 0.1 + 0.2 en flotante no debe cambiar el dígito: se trabaja en centavos enteros
+    stats.add(0.1 + 0.2)
+    assert stats.count == 5
+    assert stats.first[1] == 3 and stats.first[2] == 1 and stats.first[3] == 1
+    assert (stats.round_units, stats.round_hundreds, stats.round_thousands) == (2, 1, 1)
+    other = DigitStatsAccumulator()
+    other.add(1000.00)
+    stats.merge(other)
+    assert stats.count == 6 and stats.round_thousands == 2 and stats.first_two[10] == 3
@@ -0,0 +1,69 @@
+import gzip
+import random
+
+import pytest
+
+import string_extractor
+from string_extractor import ASCII, UTF16, entropy, extract_to_file, iter_unique_strings, string_pattern
+
+
+def _utf16(text):
+    return text.encode('utf-16-le')
+
+
+def test_pattern_prefers_utf16_and_keeps_spanish_letters():
+    data = b'\x01' + _utf16('NÓMINA') + b'\x02Pago a proveedor\xff\x03' + 'Compañía'.encode('latin-1') + b'\x04'
+    found = [(match.lastgroup, match.group()) for match in string_pattern(4).finditer(data)]
+    assert found == [(UTF16, _utf16('NÓMINA')), (ASCII, b'Pago a proveedor'), (ASCII, 'Compañía'.encode('latin-1'))]
+    # Bytes altos que no son letras del español cortan la cadena
+    assert string_pattern(4).findall(b'ab\x80cd') == []
+
+
+def test_entropy():
+    assert entropy('AAAAAAAA') == 0
+    assert entropy('ABAB') == 1
+    assert entropy('ABCDEFGH') == 3
+
+
+def test_unique_strings_across_chunks(tmp_path):
+    rng = random.Random(2)
+    texts = [f'Concepto {i} pago a proveedor' for i in range(400)]
+    parts = []
+    for i, text in enumerate(texts):
+        parts.append(bytes(rng.randrange(0, 32) for _ in range(rng.randint(5, 60))))
+        parts.append(_utf16(text) if i % 3 == 0 else text.encode('ascii'))
+    # Repeticiones, relleno de baja entropía y una cadena más larga que max_len
+    parts += [b'\x00', texts[5].encode('ascii'), b'\x00', _utf16(texts[7]), b'\x00', b'-' * 40, b'\x00',
+              b'x' * 10 + b'y' * 10 + b'z' * 300, b'\x00']
+    bak = tmp_path / "cadenas.bak"
+    bak.write_bytes(b''.join(parts))
+
+    stats = {}
+    # Bloques de 17 KB: muchas cadenas cruzan el límite entre lecturas
+    found = list(iter_unique_strings(bak, max_len=200, chunk_size=17 * 1024, stats=stats))
+    assert [text for _, _, text in found] == texts
+    assert [encoding for _, encoding, _ in found] == [UTF16 if i % 3 == 0 else ASCII for i in range(400)]
+    data = bak.read_bytes()
+    # El offset es el de la primera aparición
+    assert all(data.find(_utf16(text) if encoding == UTF16 else text.encode('ascii')) == offset
+               for offset, encoding, text in found)
+    assert stats['unique'] == 400 and stats['filtered'] == 2
+    assert stats['matches'] == 400 + 2 + 2
+    assert list(iter_unique_strings(bak, max_len=200, chunk_size=17 * 1024)) == \
+        list(iter_unique_strings(bak, max_len=200))
+
+
+def test_extract_to_file_gz(tmp_path):
+    bak = tmp_path / "cadenas.bak"
+    bak.write_bytes(b'\x00Pago de nomina\x00' + _utf16('Compañía Ñandú') + b'\x00Pago de nomina\x00')
+    output = tmp_path / "cadenas.tsv.gz"
+    stats = extract_to_file(bak, output)
+    lines = gzip.decompress(output.read_bytes()).decode('utf-8').splitlines()
+    assert lines == ['1\ta\tPago de nomina', '16\tu\tCompañía Ñandú']
+    assert stats['unique'] == 2 and 'seconds' in stats
+
+
+def test_zst_output_requires_zstandard(tmp_path, monkeypatch):
+    monkeypatch.setattr(string_extractor, "zstandard", None)
+    with pytest.raises(RuntimeError):
+        string_extractor.open_output(tmp_path / "cadenas.tsv.zst")
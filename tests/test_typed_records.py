@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from scan_engine import run_plugins
+from typed_records import (FMT_COMPACT, FMT_DMY, FMT_ISO, FMT_MDY, FMT_YMD, NO_DATE, TypedExtractor,
+                           day_to_iso, iso_to_day, link_nearest, nearest_before, parse_date)
+
+CHUNK = 64 * 1024
+
+
+@pytest.mark.parametrize("value,iso,fmt", [
+    (b"2024-01-31", "2024-01-31", FMT_ISO),
+    (b"31/01/2024", "2024-01-31", FMT_DMY),
+    (b"2024/01/31", "2024-01-31", FMT_YMD),
+    (b"20240131", "2024-01-31", FMT_COMPACT),
+    (b"01/31/2024", "2024-01-31", FMT_MDY),
+    # Ambigua: se lee como día/mes (formato mexicano)
+    (b"02/03/2024", "2024-03-02", FMT_DMY),
+    (memoryview(b"2024-02-29"), "2024-02-29", FMT_ISO),
+])
+def test_parse_date_formats(value, iso, fmt):
+    day, parsed_fmt = parse_date(value)
+    assert day_to_iso(day) == iso and parsed_fmt == fmt
+    assert iso_to_day(iso) == day
+
+
+@pytest.mark.parametrize("value", [b"2023-02-29", b"31/04/2024", b"20241301"])
+def test_parse_date_rejects_impossible_dates(value):
+    assert parse_date(value) is None
+
+
+def test_day_to_iso_missing():
+    assert day_to_iso(NO_DATE) is None
+    assert iso_to_day("1970-01-01") == 0
+
+
+def test_link_nearest_matches_nearest_before():
+    rng = random.Random(11)
+    anchors = sorted(rng.sample(range(100_000), 300))
+    events = sorted(rng.sample(range(100_000), 2000))
+    anchor_values = [offset // 7 for offset in anchors]
+    expected = nearest_before(events, anchors, anchor_values, 512)
+    streamed = link_nearest(((offset, None) for offset in events), zip(anchors, anchor_values), 512)
+    assert [linked for _, _, linked in streamed] == list(expected)
+    # Sin ancla previa o demasiado lejos: NO_DATE
+    assert list(nearest_before([5, 600], [10, 100], [1, 2], 512)) == [NO_DATE, 2]
+    assert list(nearest_before([5, 600], [10, 100], [1, 2], 499)) == [NO_DATE, NO_DATE]
+
+
+def test_parallel_columns_equal_sequential_and_stay_sorted(bak):
+    extractors = []
+    for workers in (1, 3):
+        extractor = TypedExtractor(str(bak))
+        run_plugins(str(bak), [extractor], chunk_size=CHUNK, workers=workers)
+        extractors.append(extractor)
+    first, second = extractors
+    assert len(first.amounts) == 2000 and len(first.dates) == 2000
+    for name in ("amounts", "dates"):
+        left, right = getattr(first, name), getattr(second, name)
+        assert (left.offsets, left.values, left.formats) == (right.offsets, right.values, right.formats)
+        assert list(left.offsets) == sorted(left.offsets)
+    # En el respaldo sintético cada monto va justo después de su fecha
+    assert NO_DATE not in first.amount_days()
+
+
+def test_amounts_in_period_equals_linear_filter(bak):
+    extractor = TypedExtractor(str(bak))
+    run_plugins(str(bak), [extractor], chunk_size=CHUNK)
+    days = extractor.amount_days()
+    start, end = iso_to_day("2024-03-01"), iso_to_day("2024-05-31")
+    positions = extractor.amounts_in_period(start, end)
+    assert sorted(positions) == [i for i, day in enumerate(days) if start <= day <= end]
+    assert 0 < len(positions) < len(days)
+    assert all(start <= extractor.dates.values[i] <= end for i in extractor.dates_in_period(start, end))
+
+
+def test_save_and_load_roundtrip(bak, tmp_path):
+    extractor = TypedExtractor(str(bak))
+    run_plugins(str(bak), [extractor], chunk_size=CHUNK)
+    path = tmp_path / "test.typed"
+    extractor.save(path)
+    # 8 bytes de conteo por tabla y 17 bytes por registro
+    assert path.stat().st_size == 8 + 2 * 8 + 17 * (len(extractor.amounts) + len(extractor.dates))
+    loaded = TypedExtractor.load(path)
+    for name in ("amounts", "dates"):
+        left, right = getattr(extractor, name), getattr(loaded, name)
+        assert (left.offsets, left.values, left.formats) == (right.offsets, right.values, right.formats)
+    assert loaded.amount_days() == extractor.amount_days()
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "otro.bin"
+    path.write_bytes(b"NOTTYPED" + bytes(16))
+    with pytest.raises(ValueError):
+        TypedExtractor.load(path)